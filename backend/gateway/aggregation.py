@@ -0,0 +1,173 @@
+from datetime import datetime
+from typing import Dict, List, Tuple
+import numpy as np
+
+AGGREGATIONS = ("min", "max", "mean", "last", "lttb")
+# LTTB over Mongo history runs on mean buckets this many times finer than the requested point count
+LTTB_OVERSAMPLE = 4
+
+MONGO_ACCUMULATORS = {"min": "$min", "max": "$max", "mean": "$avg", "last": "$last"}
+
+
+def bucket_aggregate(keys: np.ndarray, times: np.ndarray, values: np.ndarray,
+                     start: float, bucket: float, agg: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Aggregate (key, time, value) rows into fixed buckets counted from `start`.
+
+    Returns (key, bucket_start, value) arrays, sorted by key then bucket. All series are
+    handled in one vectorized pass: rows are sorted by (key, time) and each run of equal
+    (key, bucket) is reduced with ufunc.reduceat.
+    """
+    if len(times) == 0:
+        return keys[:0], times[:0], values[:0]
+    order = np.lexsort((times, keys))
+    keys, times, values = keys[order], times[order], values[order].astype("f8")
+    buckets = np.floor((times - start) / bucket).astype(np.int64)
+    change = np.empty(len(times), dtype=bool)
+    change[0] = True
+    change[1:] = (keys[1:] != keys[:-1]) | (buckets[1:] != buckets[:-1])
+    starts = np.flatnonzero(change)
+    ends = np.append(starts[1:], len(values))
+
+    if agg == "min":
+        result = np.minimum.reduceat(values, starts)
+    elif agg == "max":
+        result = np.maximum.reduceat(values, starts)
+    elif agg == "mean":
+        result = np.add.reduceat(values, starts) / (ends - starts)
+    elif agg == "last":
+        result = values[ends - 1]
+    else:
+        raise ValueError(f"Unsupported aggregation: {agg}")
+    return keys[starts], start + buckets[starts] * bucket, result
+
+
+def lttb(times: np.ndarray, values: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets downsampling; returns indices of the kept points."""
+    n = len(times)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_t = times[hi:next_hi].mean() if next_hi > hi else times[-1]
+        avg_v = values[hi:next_hi].mean() if next_hi > hi else values[-1]
+        t, v = times[lo:hi], values[lo:hi]
+        area = np.abs((times[a] - avg_t) * (v - values[a]) - (times[a] - t) * (avg_v - values[a]))
+        a = lo + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def series_from_rows(keys: np.ndarray, times: np.ndarray, values: np.ndarray,
+                     names: List[str]) -> Dict[str, dict]:
+    """Split (key, time, value) arrays sorted by key into {sensor_id: {time, value}} series."""
+    series: Dict[str, dict] = {}
+    if len(keys) == 0:
+        return series
+    bounds = np.flatnonzero(np.diff(keys)) + 1
+    for chunk_t, chunk_v, key in zip(np.split(times, bounds), np.split(values, bounds), keys[np.append(0, bounds)]):
+        series[names[key]] = {
+            "time": [datetime.fromtimestamp(t).isoformat() for t in chunk_t.tolist()],
+            "value": np.round(chunk_v.astype("f8"), 4).tolist(),
+        }
+    return series
+
+
+def aggregate_rows(rows: np.ndarray, names: List[str], start: float, bucket: float,
+                   agg: str, points: int) -> Dict[str, dict]:
+    """Aggregate ColumnStore rows into per-sensor series."""
+    keys, times, values = rows["sensor"], rows["time"], rows["value"]
+    if agg != "lttb":
+        return series_from_rows(*bucket_aggregate(keys, times, values, start, bucket, agg), names)
+    order = np.lexsort((times, keys))
+    keys, times, values = keys[order], times[order], values[order]
+    bounds = np.flatnonzero(np.diff(keys)) + 1
+    picked = [offset + lttb(times[offset:end], values[offset:end].astype("f8"), points)
+              for offset, end in zip(np.append(0, bounds), np.append(bounds, len(keys)))]
+    index = np.concatenate(picked) if picked else np.empty(0, dtype=np.int64)
+    return series_from_rows(keys[index], times[index], values[index], names)
+
+
+def mongo_pipeline(start: datetime, end: datetime, bucket: float, agg: str,
+                   sensor_id: str | None = None) -> list:
+    """Aggregation pipeline bucketing raw readings the same way bucket_aggregate does.
+
+    Bucket numbers are counted from `start` so results line up with the in-memory path.
+    For lttb the pipeline produces fine-grained mean buckets that are downsampled afterwards.
+    """
+    match: dict = {"time": {"$gte": start, "$lt": end}}
+    if sensor_id is not None:
+        match["sensor_id"] = sensor_id
+    accumulator = MONGO_ACCUMULATORS.get(agg, "$avg")
+    bucket_ms = bucket * 1000
+    return [
+        {"$match": match},
+        {"$sort": {"time": 1}},
+        {"$group": {
+            "_id": {
+                "sensor_id": "$sensor_id",
+                "bucket": {"$floor": {"$divide": [{"$subtract": ["$time", start]}, bucket_ms]}},
+            },
+            "value": {accumulator: "$value"},
+        }},
+        {"$sort": {"_id.sensor_id": 1, "_id.bucket": 1}},
+        {"$project": {"_id": 0, "sensor_id": "$_id.sensor_id", "bucket": "$_id.bucket", "value": 1}},
+    ]
+
+
+def series_from_buckets(docs: List[dict], start: datetime, bucket: float, agg: str,
+                        points: int) -> Dict[str, dict]:
+    """Turn mongo_pipeline output into the same per-sensor series shape as aggregate_rows."""
+    if not docs:
+        return {}
+    names = sorted({doc["sensor_id"] for doc in docs})
+    index = {name: i for i, name in enumerate(names)}
+    keys = np.fromiter((index[doc["sensor_id"]] for doc in docs), dtype=np.int64, count=len(docs))
+    times = start.timestamp() + bucket * np.fromiter((doc["bucket"] for doc in docs), dtype="f8", count=len(docs))
+    values = np.fromiter((doc["value"] for doc in docs), dtype="f8", count=len(docs))
+    if agg == "lttb":
+        bounds = np.flatnonzero(np.diff(keys)) + 1
+        picked = [offset + lttb(times[offset:end], values[offset:end], points)
+                  for offset, end in zip(np.append(0, bounds), np.append(bounds, len(keys)))]
+        chosen = np.concatenate(picked)
+        keys, times, values = keys[chosen], times[chosen], values[chosen]
+    return series_from_rows(keys, times, values, names)
+
+
+def rollup_pipeline(start: datetime, end: datetime, bucket: float, agg: str,
+                    sensor_id: str | None = None) -> list:
+    """Like mongo_pipeline, but over rollup documents (count, min, max, sum, last per bucket).
+
+    Rollup buckets are grouped by their start time, so a query bucket that is not a
+    multiple of the rollup tier takes whole rollup buckets at its edges.
+    """
+    match: dict = {"time": {"$gte": start, "$lt": end}}
+    if sensor_id is not None:
+        match["sensor_id"] = sensor_id
+    if agg == "min":
+        accumulators = {"value": {"$min": "$min"}}
+    elif agg == "max":
+        accumulators = {"value": {"$max": "$max"}}
+    elif agg == "last":
+        accumulators = {"value": {"$last": "$last"}}
+    else:
+        accumulators = {"sum": {"$sum": "$sum"}, "count": {"$sum": "$count"}}
+    value = "$value" if "value" in accumulators else {"$divide": ["$sum", "$count"]}
+    bucket_ms = bucket * 1000
+    return [
+        {"$match": match},
+        {"$sort": {"time": 1}},
+        {"$group": {
+            "_id": {
+                "sensor_id": "$sensor_id",
+                "bucket": {"$floor": {"$divide": [{"$subtract": ["$time", start]}, bucket_ms]}},
+            },
+            **accumulators,
+        }},
+        {"$sort": {"_id.sensor_id": 1, "_id.bucket": 1}},
+        {"$project": {"_id": 0, "sensor_id": "$_id.sensor_id", "bucket": "$_id.bucket", "value": value}},
+    ]
@@ -0,0 +1,135 @@
+"""Sensor-to-actuation latency of the gateway's zone controller as the number of zones grows.
+
+For each zone count, starts the stand-in broker and a gateway (see bench_e2e.py), then
+runs rounds in which one temperature reading per zone is published, alternating between
+too cold and too hot, so every zone's heater/fan state flips and the controller must
+send one command per zone. The time from publishing a round to each zone's command
+arriving on actuators/<zone> is the sensor-to-actuation latency; the time until the
+last zone's command arrives shows how control keeps up with more zones.
+
+    python bench_control.py --zones 1 10 100 1000 --rounds 50 --output control.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import threading
+import time
+from datetime import datetime
+
+from bench_e2e import connect_mqtt, percentile, start_services, stop_services
+
+COLD, HOT = 5.0, 40.0
+
+
+class CommandListener:
+    """Collects arrival times of actuators/<zone> messages."""
+
+    def __init__(self, host, port):
+        self.arrivals = []
+        self.expected = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.client = connect_mqtt(host, port, "bench-control-listener")
+        self.client.on_message = self.on_message
+        self.client.subscribe("actuators/+", qos=0)
+
+    def expect(self, count):
+        with self._lock:
+            self.arrivals = []
+            self.expected = count
+            self._done.clear()
+
+    def on_message(self, client, userdata, msg):
+        now = time.perf_counter()
+        with self._lock:
+            self.arrivals.append(now)
+            if len(self.arrivals) >= self.expected:
+                self._done.set()
+
+    def wait(self, timeout):
+        self._done.wait(timeout)
+        with self._lock:
+            return list(self.arrivals)
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+async def run_zones(zones, args):
+    host = "127.0.0.1"
+    broker, gateway = await start_services(host, args.http_port, args.broker_port,
+                                           extra_env={"GATEWAY_CONTROL": "1",
+                                                      "GATEWAY_CONTROL_MODE": "hysteresis"})
+    listener = CommandListener(host, args.broker_port)
+    publisher = connect_mqtt(host, args.broker_port, "bench-control-sensors")
+    topics = [f"sensors/temperature/ctl-{zone}" for zone in range(zones)]
+    latencies, completions, missing = [], [], 0
+    try:
+        await asyncio.sleep(0.5)
+        for round_index in range(args.rounds + 1):
+            value = COLD if round_index % 2 == 0 else HOT
+            stamp = datetime.now().isoformat()
+            payloads = [json.dumps({"value": value, "time": stamp, "zone": zone}) for zone in range(zones)]
+            listener.expect(zones)
+            start = time.perf_counter()
+            for topic, payload in zip(topics, payloads):
+                publisher.publish(topic, payload, qos=args.qos)
+            arrivals = listener.wait(args.timeout)
+            # Round 0 only creates the zones' state; it is not measured
+            if round_index:
+                latencies.extend(arrival - start for arrival in arrivals)
+                missing += zones - len(arrivals)
+                if len(arrivals) >= zones:
+                    completions.append(max(arrivals) - start)
+            await asyncio.sleep(args.pause)
+    finally:
+        publisher.loop_stop()
+        publisher.disconnect()
+        listener.close()
+        stop_services(gateway, broker)
+
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        "zones": zones,
+        "rounds": args.rounds,
+        "commands": len(latencies),
+        "missing": missing,
+        "command_p50_ms": ms(percentile(latencies, 0.5)),
+        "command_p99_ms": ms(percentile(latencies, 0.99)),
+        "round_p50_ms": ms(percentile(completions, 0.5)),
+        "round_p99_ms": ms(percentile(completions, 0.99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zones", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds between rounds")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds to wait for a round's commands")
+    parser.add_argument("--qos", type=int, choices=(0, 1), default=0)
+    parser.add_argument("--broker-port", type=int, default=18831)
+    parser.add_argument("--http-port", type=int, default=8201)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for zones in args.zones:
+        result = asyncio.run(run_zones(zones, args))
+        results.append(result)
+        print(f"zones={zones:5d}: command p50 {result['command_p50_ms']} ms  p99 {result['command_p99_ms']} ms  "
+              f"all zones p50 {result['round_p50_ms']} ms  p99 {result['round_p99_ms']} ms  "
+              f"({result['commands']} commands, {result['missing']} missing)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"host": {"python": platform.python_version(), "machine": platform.machine(),
+                                "cpus": os.cpu_count()},
+                       "timestamp": datetime.now().isoformat(), "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
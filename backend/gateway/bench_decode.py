@@ -0,0 +1,132 @@
+"""Benchmark for payload decoding and response serialization.
+
+Compares the legacy path (json.loads + Reading(**data), FastAPI's jsonable_encoder on
+the way out) with the fast path in decoding.py (model_validate_json on the raw bytes,
+TypeAdapter.dump_json on the way out).
+
+Payloads can be recorded from a live broker and replayed later:
+
+    python bench_decode.py --record payloads.jsonl --host 192.168.0.38 --port 8883 --count 5000
+    python bench_decode.py --payloads payloads.jsonl
+
+Without --payloads, payloads shaped like peer/sensor's readings are generated.
+"""
+import argparse
+import json
+import random
+import struct
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from decoding import (BINARY_HEADER, BINARY_MAGIC, decode_reading, decode_sensor_payload, decode_sensor_samples,
+                      dump_readings)
+
+SENSOR_TYPES = ("temperature", "humidity", "moisture")
+
+
+def record(path, host, port, count):
+    import paho.mqtt.client as mqtt
+    from paho.mqtt.enums import CallbackAPIVersion
+
+    recorded = 0
+    with open(path, "w") as out:
+        def on_connect(client, userdata, flags, rc):
+            client.subscribe("sensors/+/+")
+
+        def on_message(client, userdata, msg):
+            nonlocal recorded
+            out.write(json.dumps({"topic": msg.topic, "payload": msg.payload.decode()}) + "\n")
+            recorded += 1
+            if recorded >= count:
+                client.disconnect()
+
+        client = mqtt.Client(callback_api_version=CallbackAPIVersion.VERSION1)
+        client.on_connect = on_connect
+        client.on_message = on_message
+        client.connect(host, port, 60)
+        client.loop_forever()
+    print(f"Recorded {recorded} payloads to {path}")
+
+
+def load_payloads(path):
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [(record["topic"], record["payload"].encode()) for record in records]
+
+
+def generate_payloads(count, sensors):
+    start = datetime.now()
+    payloads = []
+    for i in range(count):
+        sensor_type = SENSOR_TYPES[i % len(SENSOR_TYPES)]
+        payloads.append((f"sensors/{sensor_type}/s{i % sensors}", json.dumps({
+            "sensor_id": f"s{i % sensors}",
+            "sensor_type": sensor_type,
+            "value": round(random.uniform(10, 30), 2) + random.uniform(2, 5),
+            "time": (start + timedelta(seconds=i // sensors)).isoformat(),
+        }).encode()))
+    return payloads
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<38} {count / elapsed:12.0f} /s  ({elapsed * 1000:8.1f} ms)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payloads", help="JSONL file of recorded {topic, payload} lines")
+    parser.add_argument("--record", help="record payloads from a broker into this file and exit")
+    parser.add_argument("--host", default="192.168.0.38")
+    parser.add_argument("--port", type=int, default=8883)
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--sensors", type=int, default=300)
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.host, args.port, args.count)
+        return
+
+    messages = load_payloads(args.payloads) if args.payloads else generate_payloads(args.count, args.sensors)
+    payloads = [payload for _, payload in messages]
+    count = len(payloads)
+    print(f"payloads: {count}, avg size {sum(map(len, payloads)) / count:.0f} bytes")
+
+    readings = timed("decode json.loads + Reading(**data)", count,
+                     lambda: [decode_reading(p, fast=False) for p in payloads])
+    timed("decode Reading.model_validate_json", count,
+          lambda: [decode_reading(p, fast=True) for p in payloads])
+
+    def from_topic():
+        readings = []
+        for topic, payload in messages:
+            _, sensor_type, sensor_id = topic.split("/")
+            readings.append(decode_sensor_payload(sensor_type, sensor_id, payload, fast=True))
+        return readings
+    timed("decode topic ids + Reading", count, from_topic)
+
+    # The same readings as report-by-exception sends them: batches of 10, JSON and binary
+    batches = []
+    for i in range(0, len(readings) - 9, 10):
+        group = readings[i:i + 10]
+        batches.append((json.dumps([{"value": r.value, "time": r.time.isoformat()} for r in group]).encode(),
+                        BINARY_HEADER.pack(BINARY_MAGIC, len(group), 0) +
+                        b"".join(struct.pack("<df", r.time.timestamp(), r.value) for r in group)))
+    for label, index in (("decode json batch/10", 0), ("decode binary batch/10", 1)):
+        size = sum(len(batch[index]) for batch in batches) / (10 * len(batches))
+        timed(f"{label} ({size:.0f} B/reading)", 10 * len(batches),
+              lambda: [decode_sensor_samples("temperature", "s0", batch[index]) for batch in batches])
+
+    timed("serialize jsonable_encoder + json.dumps", count,
+          lambda: json.dumps(jsonable_encoder(readings)).encode())
+    timed("serialize TypeAdapter.dump_json", count,
+          lambda: dump_readings(readings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""End-to-end benchmark: sensor fleet -> MQTT broker -> gateway -> HTTP query, all on localhost.
+
+Starts the stand-in MQTT broker (standins.py) and the gateway with FakeMongoClient in
+place of AsyncMongoClient (or a real Mongo with --mongo-uri), then publishes readings
+from --sensors sensors at --rate messages/sec each, spread over --publishers processes.
+While the fleet runs, a probe publishes a marker value and polls
+/sensors/temperature/probe/latest until it shows up, which gives the ingest-to-query
+latency. Throughput comes from the gateway's ingest counter; CPU and RSS of the
+gateway and the broker are read from /proc.
+
+    python bench_e2e.py --sensors 500 --rate 2 --duration 20 --output results.json
+"""
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+
+from bench_workers import Connection, wait_ready
+
+SENSOR_TYPES = ("temperature", "humidity", "moisture")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def serve_gateway(mongo_uri: str | None):
+    """Run the gateway in this process, with the Mongo stand-in unless a URI was given."""
+    import uvicorn
+    import gateway
+    from standins import FakeMongoClient
+
+    if not mongo_uri:
+        FakeMongoClient.latency = float(os.environ.get("BENCH_MONGO_LATENCY", 0))
+        gateway.AsyncMongoClient = FakeMongoClient
+    uvicorn.run(gateway.app, host=gateway.GATEWAY_HOST, port=gateway.GATEWAY_PORT, log_level="warning")
+
+
+def process_usage(pid: int) -> dict:
+    """CPU seconds (user + system) and current/peak RSS in MiB of a process."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    usage = {"cpu_seconds": (int(fields[11]) + int(fields[12])) / CLOCK_TICKS}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                key = "rss_mib" if line.startswith("VmRSS") else "peak_rss_mib"
+                usage[key] = round(int(line.split()[1]) / 1024, 1)
+    return usage
+
+
+def connect_mqtt(host, port, client_id):
+    client = mqtt.Client(callback_api_version=CallbackAPIVersion.VERSION1, client_id=client_id)
+    client.max_queued_messages_set(0)
+    client.connect(host, port, 60)
+    client.loop_start()
+    return client
+
+
+def publish_fleet(index, host, port, sensors, rate, duration, qos, tick=0.05):
+    """Publish `rate` messages/sec for each of `sensors` sensors; returns messages sent."""
+    client = connect_mqtt(host, port, f"bench-fleet-{index}")
+    topics = [f"sensors/{SENSOR_TYPES[i % len(SENSOR_TYPES)]}/fleet{index}-{i}" for i in range(sensors)]
+    sent, cursor = 0, 0
+    start = time.perf_counter()
+    try:
+        while (elapsed := time.perf_counter() - start) < duration:
+            due = elapsed * sensors * rate
+            now = datetime.now().isoformat()
+            while sent < due:
+                payload = json.dumps({"value": round(random.uniform(10, 30), 2), "time": now})
+                client.publish(topics[cursor], payload, qos=qos)
+                cursor = (cursor + 1) % sensors
+                sent += 1
+            time.sleep(tick)
+    finally:
+        client.loop_stop()
+        client.disconnect()
+    return sent
+
+
+async def probe_latency(host, http_port, broker_port, interval, duration, qos):
+    """Publish marker readings and time how long until GET .../latest returns each one."""
+    client = connect_mqtt(host, broker_port, "bench-probe")
+    conn = Connection(host, http_port)
+    latencies, lost = [], 0
+    deadline = time.perf_counter() + duration
+    try:
+        while time.perf_counter() < deadline:
+            marker = round(random.uniform(1000, 2000), 4)
+            start = time.perf_counter()
+            client.publish("sensors/temperature/probe",
+                           json.dumps({"value": marker, "time": datetime.now().isoformat()}), qos=qos)
+            while time.perf_counter() - start < 5:
+                status, body = await conn.request("GET", "/sensors/temperature/probe/latest")
+                if status == 200 and json.loads(body).get("value") == marker:
+                    latencies.append(time.perf_counter() - start)
+                    break
+                await asyncio.sleep(0.0005)
+            else:
+                lost += 1
+            await asyncio.sleep(interval)
+    finally:
+        conn.close()
+        client.loop_stop()
+        client.disconnect()
+    return latencies, lost
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def ingest_pushed(host, port) -> int:
+    conn = Connection(host, port)
+    try:
+        _, body = await conn.request("GET", "/stats")
+    finally:
+        conn.close()
+    return json.loads(body)["ingest"]["pushed"]
+
+
+async def start_services(host, http_port, broker_port, mongo_uri=None, mongo_latency=0.0, extra_env=None):
+    """Start the stand-in broker and a gateway wired to it; returns (broker, gateway) processes."""
+    env = dict(os.environ, GATEWAY_HOST=host, GATEWAY_PORT=str(http_port),
+               GATEWAY_MQTT_BROKER=host, GATEWAY_MQTT_PORT=str(broker_port),
+               BENCH_MONGO_LATENCY=str(mongo_latency), **(extra_env or {}))
+    env.pop("GATEWAY_STATE_ADDRESS", None)
+    if mongo_uri:
+        env["GATEWAY_MONGO_URI"] = mongo_uri
+    here = os.path.dirname(os.path.abspath(__file__))
+    quiet = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL, "cwd": here}
+    broker = subprocess.Popen([sys.executable, "standins.py", "broker", "--port", str(broker_port)], **quiet)
+    gateway = subprocess.Popen([sys.executable, os.path.join(here, "bench_e2e.py"), "--serve-gateway"] +
+                               (["--mongo-uri", mongo_uri] if mongo_uri else []), env=env, **quiet)
+    try:
+        await wait_ready(host, http_port)
+        # Give the gateway's MQTT client time to connect and subscribe
+        await asyncio.sleep(1.0)
+    except BaseException:
+        stop_services(broker, gateway)
+        raise
+    return broker, gateway
+
+
+def stop_services(*processes):
+    for process in processes:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+async def bench(args):
+    host = "127.0.0.1"
+    broker, gateway = await start_services(host, args.http_port, args.broker_port, args.mongo_uri, args.mongo_latency,
+                                           extra_env={"GATEWAY_SPOOL_DIR": args.spool_dir} if args.spool_dir else None)
+    try:
+        pushed_before = await ingest_pushed(host, args.http_port)
+        usage_before = {"gateway": process_usage(gateway.pid), "broker": process_usage(broker.pid)}
+        started = time.perf_counter()
+
+        loop = asyncio.get_running_loop()
+        counts = [len(part) for part in (range(i, args.sensors, args.publishers) for i in range(args.publishers))]
+        with ProcessPoolExecutor(args.publishers) as pool:
+            fleet = asyncio.gather(*(
+                loop.run_in_executor(pool, publish_fleet, i, host, args.broker_port, count, args.rate,
+                                     args.duration, args.qos)
+                for i, count in enumerate(counts) if count))
+            latencies, lost = await probe_latency(host, args.http_port, args.broker_port,
+                                                  args.probe_interval, args.duration, args.qos)
+            # Probe readings go through the same path, so they count as published too
+            sent = sum(await fleet) + len(latencies) + lost
+        elapsed = time.perf_counter() - started
+        # Let the gateway drain what is still in flight before reading its counters
+        await asyncio.sleep(args.drain)
+        pushed = await ingest_pushed(host, args.http_port) - pushed_before
+        usage_after = {"gateway": process_usage(gateway.pid), "broker": process_usage(broker.pid)}
+    finally:
+        stop_services(gateway, broker)
+
+    resources = {}
+    for name, after in usage_after.items():
+        cpu = after["cpu_seconds"] - usage_before[name]["cpu_seconds"]
+        resources[name] = {"cpu_seconds": round(cpu, 2), "cpu_percent": round(100 * cpu / elapsed, 1),
+                           "rss_mib": after["rss_mib"], "peak_rss_mib": after["peak_rss_mib"]}
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "serve_gateway")},
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "timestamp": datetime.now().isoformat(),
+        "elapsed_seconds": round(elapsed, 2),
+        "published": sent,
+        "ingested": pushed,
+        "publish_rate": round(sent / elapsed, 1),
+        "ingest_rate": round(pushed / elapsed, 1),
+        "latency_ms": {
+            "samples": len(latencies),
+            "lost": lost,
+            "p50": round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+            "p99": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+            "max": round(max(latencies) * 1000, 2) if latencies else None,
+        },
+        "resources": resources,
+    }
+
+
+def report(result):
+    latency = result["latency_ms"]
+    print(f"published {result['published']} ({result['publish_rate']:.0f} msg/s), "
+          f"ingested {result['ingested']} ({result['ingest_rate']:.0f} msg/s)")
+    print(f"ingest-to-query latency: p50 {latency['p50']} ms  p99 {latency['p99']} ms  "
+          f"max {latency['max']} ms  ({latency['samples']} probes, {latency['lost']} lost)")
+    for name, usage in result["resources"].items():
+        print(f"{name:8s} cpu {usage['cpu_percent']:5.1f}%  rss {usage['rss_mib']} MiB  "
+              f"peak {usage['peak_rss_mib']} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sensors", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=1.0, help="messages per second per sensor")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--publishers", type=int, default=max((os.cpu_count() or 2) // 2, 1))
+    parser.add_argument("--qos", type=int, choices=(0, 1), default=0)
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    parser.add_argument("--drain", type=float, default=2.0)
+    parser.add_argument("--broker-port", type=int, default=18830)
+    parser.add_argument("--http-port", type=int, default=8200)
+    parser.add_argument("--mongo-uri", help="use this Mongo instead of the in-process stand-in")
+    parser.add_argument("--mongo-latency", type=float, default=0.0, help="simulated insert_many round trip (s)")
+    parser.add_argument("--spool-dir", help="run the gateway with this GATEWAY_SPOOL_DIR")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--serve-gateway", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_gateway:
+        serve_gateway(args.mongo_uri)
+        return
+    result = asyncio.run(bench(args))
+    report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Microbenchmark for the MQTT -> event loop handoff.
+
+Drives the gateway's on_message with a fake paho client that replays N sensor
+messages from its network thread as fast as possible, and reports messages/sec
+for the old per-message run_coroutine_threadsafe path and the batched IngestBridge.
+
+    python bench_ingest.py --messages 200000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import gateway
+from gateway import Reading, SENSOR_TYPES, queue_consumer, enqueue_batch, run_mqtt_client
+from ingest_bridge import IngestBridge
+from topic_router import TopicRouter
+from mongo_writer import MongoBatchWriter
+from sensor_store import SensorStore
+from column_store import ColumnStore
+from streaming import StreamHub
+from snapshot_cache import SnapshotCache
+from inference import InferenceEngine
+from prediction_store import PredictionStore
+
+
+class FakeCollection:
+    async def insert_many(self, docs, ordered=True):
+        return None
+
+
+class FakeMQTTClient:
+    """Stands in for paho's Client: loop_forever replays canned messages and returns."""
+
+    def __init__(self, messages, **kwargs):
+        self.messages = messages
+        self.on_connect = None
+        self.on_message = None
+
+    def connect_async(self, host, port, keepalive=60):
+        pass
+
+    def subscribe(self, topic, qos=0):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def loop_forever(self):
+        self.on_connect(self, None, {}, 0)
+        for msg in self.messages:
+            self.on_message(self, None, msg)
+
+
+def make_messages(count, sensors):
+    messages = []
+    now = datetime.now().isoformat()
+    for i in range(count):
+        sensor_type = SENSOR_TYPES[i % len(SENSOR_TYPES)]
+        sensor_id = f"s{i % sensors}"
+        payload = json.dumps({"sensor_id": sensor_id, "sensor_type": sensor_type, "value": 20.0 + i % 10, "time": now})
+        messages.append(SimpleNamespace(topic=f"sensors/{sensor_type}/{sensor_id}", payload=payload.encode()))
+    return messages
+
+
+def make_state():
+    writer = MongoBatchWriter({name: FakeCollection() for name in SENSOR_TYPES},
+                              batch_size=gateway.MONGO_BATCH_SIZE, flush_interval=0.05,
+                              max_pending=gateway.MONGO_MAX_PENDING)
+    return SimpleNamespace(
+        predictions=PredictionStore(SENSOR_TYPES, capacity=gateway.PREDICTION_CAPACITY),
+        prediction_writer=None,
+        inference=InferenceEngine(SENSOR_TYPES) if gateway.INFERENCE_ENABLED else None,
+        prediction_store=SensorStore(SENSOR_TYPES, depth=gateway.PREDICTION_HISTORY_DEPTH),
+        controller=None,
+        mqtt_client=None,
+        sensor_store=SensorStore(SENSOR_TYPES, depth=gateway.SENSOR_HISTORY_DEPTH),
+        history=ColumnStore(SENSOR_TYPES, capacity=gateway.HISTORY_CAPACITY),
+        stream_hub=StreamHub(),
+        snapshots=SnapshotCache(),
+        shared_log=None,
+        shared_predictions=None,
+        data_queue=asyncio.Queue(),
+        mongo_writer=writer)
+
+
+async def legacy_path(messages):
+    """The pre-bridge handoff: two run_coroutine_threadsafe calls per message."""
+    loop = asyncio.get_running_loop()
+    state = make_state()
+    writer = state.mongo_writer
+    writer.start()
+
+    async def legacy_consumer():
+        while True:
+            reading = await state.data_queue.get()
+            state.sensor_store.append(reading)
+            state.data_queue.task_done()
+
+    def on_message(client, userdata, msg):
+        reading = Reading(**json.loads(msg.payload.decode()))
+        asyncio.run_coroutine_threadsafe(writer.put(reading), loop)
+        asyncio.run_coroutine_threadsafe(state.data_queue.put(reading), loop)
+
+    client = FakeMQTTClient(messages)
+    client.on_connect = lambda *args: None
+    client.on_message = on_message
+    consumer = asyncio.create_task(legacy_consumer())
+
+    start = time.perf_counter()
+    await loop.run_in_executor(None, client.loop_forever)
+    while sum(writer.stats()[key] for key in ("written", "queue_depth")) < len(messages):
+        await asyncio.sleep(0.001)
+    await state.data_queue.join()
+    await writer.close()
+    elapsed = time.perf_counter() - start
+    consumer.cancel()
+    return elapsed
+
+
+async def bridge_path(messages):
+    """The current handoff: on_message pushes into IngestBridge, one batch per loop wakeup."""
+    loop = asyncio.get_running_loop()
+    state = make_state()
+    app = SimpleNamespace(state=state)
+    state.ingest = IngestBridge(loop, max_pending=gateway.INGEST_MAX_PENDING)
+    state.router = TopicRouter()
+    state.ingest.subscribe(state.mongo_writer.put_many)
+    state.ingest.subscribe(enqueue_batch(app))
+    state.mongo_writer.start()
+    state.ingest.start()
+    consumer = asyncio.create_task(queue_consumer(app))
+
+    start = time.perf_counter()
+    await run_mqtt_client(loop, app, client_factory=lambda **kwargs: FakeMQTTClient(messages, **kwargs))
+    await state.ingest.close()
+    await state.data_queue.join()
+    await state.mongo_writer.close()
+    elapsed = time.perf_counter() - start
+    consumer.cancel()
+    return elapsed, {**state.ingest.stats(), **state.router.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--sensors", type=int, default=300)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages, args.sensors)
+    before = asyncio.run(legacy_path(messages))
+    after, stats = asyncio.run(bridge_path(messages))
+    print(f"messages:             {args.messages}")
+    print(f"run_coroutine_threadsafe: {args.messages / before:12.0f} msg/s ({before:.3f}s)")
+    print(f"IngestBridge:             {args.messages / after:12.0f} msg/s ({after:.3f}s), avg batch {stats['avg_batch']}, routed {stats['handled']}")
+
+
+if __name__ == "__main__":
+    main()
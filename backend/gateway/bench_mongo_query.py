@@ -0,0 +1,92 @@
+"""Query-latency benchmark: plain collection vs time-series collection.
+
+Loads the same synthetic readings into a plain collection and into a time-series
+collection (timeField=time, metaField=sensor_id) on a local mongod, then times the
+queries the gateway issues: a single sensor's time range and the /query bucket
+aggregation.
+
+    python bench_mongo_query.py --uri mongodb://localhost:27017 --readings 1000000
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from pymongo import AsyncMongoClient
+
+from timeseries import create_timeseries, ensure_indexes
+from aggregation import mongo_pipeline
+
+DB_NAME = "bench_sensors"
+
+
+async def load(collection, count, sensors, start, batch_size=20000):
+    rng = np.random.default_rng(0)
+    values = rng.normal(20, 3, count)
+    for offset in range(0, count, batch_size):
+        docs = [{"sensor_id": f"s{i % sensors}", "sensor_type": "temperature", "value": float(values[i]),
+                 "time": start + timedelta(seconds=i // sensors)}
+                for i in range(offset, min(offset + batch_size, count))]
+        await collection.insert_many(docs, ordered=False)
+
+
+async def timed(label, func, repeat):
+    await func()
+    samples = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        rows = await func()
+        samples.append((time.perf_counter() - begin) * 1000)
+    print(f"  {label:<28} p50 {np.percentile(samples, 50):8.2f} ms   p99 {np.percentile(samples, 99):8.2f} ms  ({rows} rows)")
+
+
+async def run(args):
+    client = AsyncMongoClient(args.uri)
+    db = client[DB_NAME]
+    await client.drop_database(DB_NAME)
+    start = datetime(2025, 1, 1)
+    span = args.readings // args.sensors
+
+    plain = db["plain"]
+    await db.create_collection("plain")
+    await ensure_indexes(plain)
+    await create_timeseries(db, "timeseries")
+    series = db["timeseries"]
+    for collection in (plain, series):
+        begin = time.perf_counter()
+        await load(collection, args.readings, args.sensors, start)
+        print(f"loaded {args.readings} readings into {collection.name} in {time.perf_counter() - begin:.1f}s")
+
+    t0 = start + timedelta(seconds=span // 2)
+    t1 = t0 + timedelta(seconds=max(span // 10, 1))
+    for collection in (plain, series):
+        print(f"{collection.name}:")
+
+        async def sensor_range():
+            cursor = collection.find({"sensor_id": "s7", "time": {"$gte": t0, "$lt": t1}}, projection={"_id": 0})
+            return len(await cursor.to_list())
+
+        async def bucketed():
+            cursor = await collection.aggregate(mongo_pipeline(start, start + timedelta(seconds=span), span / 500, "mean"))
+            return len(await cursor.to_list())
+
+        await timed("sensor time range", sensor_range, args.repeat)
+        await timed("/query mean, 500 buckets", bucketed, max(args.repeat // 10, 1))
+
+    stats = {name: await db.command("collStats", name) for name in ("plain", "timeseries")}
+    for name, info in stats.items():
+        print(f"{name}: storage {info.get('storageSize', 0) / 2**20:.1f} MiB, indexes {info.get('totalIndexSize', 0) / 2**20:.1f} MiB")
+    if not args.keep:
+        await client.drop_database(DB_NAME)
+    await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--readings", type=int, default=1_000_000)
+    parser.add_argument("--sensors", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="keep the bench_sensors database afterwards")
+    asyncio.run(run(parser.parse_args()))
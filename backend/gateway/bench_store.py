@@ -0,0 +1,72 @@
+"""Memory and query-latency benchmark for the in-memory history.
+
+Loads the same readings into a deque of pydantic Reading objects (the old
+lifespan buffers) and into a ColumnStore, then compares memory use and the
+latency of time-range / per-sensor queries.
+
+    python bench_store.py --readings 1000000
+"""
+import argparse
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from models import Reading
+from column_store import ColumnStore
+
+
+def make_readings(count, sensors):
+    start = datetime(2025, 1, 1)
+    rng = np.random.default_rng(0)
+    values = rng.normal(20, 3, count)
+    return [Reading(sensor_id=f"s{i % sensors}", sensor_type="temperature",
+                    value=float(values[i]), time=start + timedelta(seconds=i // sensors))
+            for i in range(count)], start
+
+
+def measure(label, func, repeat=20):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<34} {elapsed * 1000:9.3f} ms  ({len(result)} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=1_000_000)
+    parser.add_argument("--sensors", type=int, default=100)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    readings, start = make_readings(args.readings, args.sensors)
+    buffer = deque(readings, maxlen=args.readings)
+    deque_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    store = ColumnStore(["temperature"], capacity=args.readings)
+    load_start = time.perf_counter()
+    store.extend(readings)
+    load_ms = (time.perf_counter() - load_start) * 1000
+
+    print(f"readings: {args.readings}, sensors: {args.sensors}")
+    print(f"  deque[Reading] memory              {deque_bytes / 2**20:9.1f} MiB")
+    print(f"  ColumnStore memory                 {store.nbytes / 2**20:9.1f} MiB  (loaded in {load_ms:.0f} ms)")
+
+    span = args.readings // args.sensors
+    t0 = start + timedelta(seconds=span // 2)
+    t1 = t0 + timedelta(seconds=max(span // 10, 1))
+    print("time-range query (10% of span):")
+    measure("deque scan", lambda: [r for r in buffer if t0 <= r.time < t1], repeat=3)
+    measure("ColumnStore.query", lambda: store.query("temperature", t0.timestamp(), t1.timestamp()))
+    print("single sensor, full history:")
+    measure("deque scan", lambda: [r for r in buffer if r.sensor_id == "s7"], repeat=3)
+    measure("ColumnStore.query", lambda: store.query("temperature", sensor_id="s7"))
+
+
+if __name__ == "__main__":
+    main()
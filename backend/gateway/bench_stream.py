@@ -0,0 +1,113 @@
+"""Load test for the /stream Server-Sent Events endpoint.
+
+Opens N concurrent subscribers against a running gateway, publishes readings
+through POST /add at a fixed rate, and reports delivered events, coalescing and
+publish-to-delivery latency measured on a sample of subscribers.
+
+    uvicorn gateway:app --port 8000 &
+    python bench_stream.py --url http://127.0.0.1:8000 --subscribers 1000 --rate 200 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import resource
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import numpy as np
+
+SENSOR_TYPES = ("temperature", "humidity", "moisture")
+
+
+async def http_request(host, port, method, path, body=b""):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+async def subscriber(host, port, path, stats, sample):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    stats["connected"] += 1
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.startswith(b"data: "):
+                continue
+            stats["events"] += 1
+            if sample:
+                now = time.time()
+                for reading in json.loads(line[6:]):
+                    stats["latency"].append(now - datetime.fromisoformat(reading["time"]).timestamp())
+                    stats["readings"] += 1
+    finally:
+        writer.close()
+
+
+async def publisher(host, port, rate, duration, sensors, tick=0.1):
+    """POST one list of readings per tick so the publish rate is not capped by request round trips."""
+    sent = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < duration:
+        due = int(elapsed * rate) + 1 - sent
+        now = datetime.now().isoformat()
+        batch = [{"sensor_id": f"s{i % sensors}", "sensor_type": SENSOR_TYPES[i % len(SENSOR_TYPES)],
+                  "value": 20.0, "time": now} for i in range(sent, sent + due)]
+        if batch:
+            await http_request(host, port, "POST", "/add", json.dumps(batch).encode())
+            sent += len(batch)
+        await asyncio.sleep(tick)
+    return sent
+
+
+async def run(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    stats = {"connected": 0, "events": 0, "readings": 0, "latency": []}
+    tasks = []
+    for i in range(args.subscribers):
+        sensor_type = SENSOR_TYPES[i % len(SENSOR_TYPES)]
+        path = "/stream" if i % 3 == 0 else f"/stream?sensor_type={sensor_type}"
+        tasks.append(asyncio.create_task(subscriber(host, port, path, stats, sample=i % args.sample_every == 0)))
+        if i % 100 == 99:
+            await asyncio.sleep(0.05)
+    await asyncio.sleep(1)
+    print(f"connected subscribers: {stats['connected']}/{args.subscribers}")
+
+    start = time.perf_counter()
+    sent = await publisher(host, port, args.rate, args.duration, args.sensors)
+    await asyncio.sleep(1)
+    elapsed = time.perf_counter() - start
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latency = np.array(stats["latency"]) * 1000
+    print(f"published readings:    {sent} ({sent / args.duration:.0f}/s)")
+    print(f"delivered events:      {stats['events']} ({stats['events'] / elapsed:.0f}/s across all subscribers)")
+    if len(latency):
+        print(f"delivery latency (ms): p50 {np.percentile(latency, 50):.1f}  p99 {np.percentile(latency, 99):.1f}  "
+              f"max {latency.max():.1f}  ({len(latency)} sampled readings)")
+    print((await http_request(host, port, "GET", "/stats")).split(b"\r\n\r\n", 1)[-1].decode())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=200, help="readings published per second")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--sensors", type=int, default=100)
+    parser.add_argument("--sample-every", type=int, default=50, help="measure latency on every Nth subscriber")
+    args = parser.parse_args()
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, args.subscribers * 2 + 100)), hard))
+    asyncio.run(run(args))
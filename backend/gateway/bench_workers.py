@@ -0,0 +1,193 @@
+"""Throughput benchmark for 1, 2 and 4 gateway workers.
+
+Starts `python gateway.py` with GATEWAY_WORKERS=N on localhost, then drives it with
+keep-alive HTTP connections issuing a read-heavy mix (GET /sensors/{type}/{id} and
+GET /sensors/{type}) plus POST /add ingest, and reports requests/sec. Afterwards it
+checks that every worker reports the same number of sensors, i.e. that the shared
+state backend is in use. It also publishes --predictions messages on the ml topic
+through the stand-in broker (standins.py) and checks that every worker's /ml returns
+all of them, although the shared subscription hands each one to a single worker.
+
+    python bench_workers.py --workers 1 2 4 --connections 64 --duration 10
+"""
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+
+SENSOR_TYPES = ("temperature", "humidity", "moisture")
+
+
+class Connection:
+    """Minimal HTTP/1.1 keep-alive client, enough for the gateway's JSON responses."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b""):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await self.writer.drain()
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        length = 0
+        for line in head.split(b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":", 1)[1])
+        payload = await self.reader.readexactly(length)
+        return int(head.split(b" ", 2)[1]), payload
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def readings_body(sensors, count):
+    now = datetime.now().isoformat()
+    return json.dumps([{"sensor_id": f"s{random.randrange(sensors)}", "sensor_type": random.choice(SENSOR_TYPES),
+                        "value": round(random.uniform(10, 30), 2), "time": now} for _ in range(count)]).encode()
+
+
+async def wait_ready(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = Connection(host, port)
+            status, _ = await conn.request("GET", "/check")
+            conn.close()
+            if status == 200:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("gateway did not start")
+
+
+async def drive(host, port, connections, duration, sensors, write_ratio):
+    counts = {"requests": 0, "errors": 0}
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        conn = Connection(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                roll = random.random()
+                if roll < write_ratio:
+                    status, _ = await conn.request("POST", "/add", readings_body(sensors, 10))
+                elif roll < 0.5:
+                    status, _ = await conn.request("GET", f"/sensors/{random.choice(SENSOR_TYPES)}")
+                else:
+                    status, _ = await conn.request(
+                        "GET", f"/sensors/{random.choice(SENSOR_TYPES)}/s{random.randrange(sensors)}")
+                counts["requests" if status < 400 else "errors"] += 1
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    return counts, time.perf_counter() - start
+
+
+def drive_process(host, port, connections, duration, sensors, write_ratio):
+    return asyncio.run(drive(host, port, connections, duration, sensors, write_ratio))
+
+
+async def sensor_counts(host, port, probes=16):
+    seen = set()
+    for _ in range(probes):
+        conn = Connection(host, port)
+        _, body = await conn.request("GET", "/stats")
+        conn.close()
+        seen.add(json.loads(body)["sensors"])
+    return seen
+
+
+def publish_predictions(port, count):
+    """Publish `count` distinct predictions on the ml topic and wait until they are sent."""
+    client = mqtt.Client(callback_api_version=CallbackAPIVersion.VERSION1, client_id="bench-ml")
+    client.connect("127.0.0.1", port, 60)
+    client.loop_start()
+    try:
+        for i in range(count):
+            payload = json.dumps({"sensor_type": SENSOR_TYPES[i % len(SENSOR_TYPES)], "real": i, "prediction": i})
+            client.publish("ml", payload, qos=1).wait_for_publish(5)
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+
+async def prediction_counts(host, port, probes=16):
+    seen = set()
+    for _ in range(probes):
+        conn = Connection(host, port)
+        _, body = await conn.request("GET", "/ml?limit=10000")
+        conn.close()
+        seen.add(len(json.loads(body)))
+    return seen
+
+
+async def bench(workers, args):
+    env = dict(os.environ, GATEWAY_HOST="127.0.0.1", GATEWAY_PORT=str(args.port), GATEWAY_WORKERS=str(workers),
+               GATEWAY_MQTT_BROKER="127.0.0.1", GATEWAY_MQTT_PORT=str(args.broker_port))
+    env.pop("GATEWAY_STATE_ADDRESS", None)
+    quiet = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+    broker = subprocess.Popen([sys.executable, "standins.py", "broker", "--port", str(args.broker_port)], **quiet)
+    process = subprocess.Popen([sys.executable, "gateway.py"], env=env, **quiet)
+    try:
+        await wait_ready("127.0.0.1", args.port)
+        conn = Connection("127.0.0.1", args.port)
+        await conn.request("POST", "/add", readings_body(args.sensors, args.sensors * 10))
+        conn.close()
+        # The load is generated from several processes so the client is not the bottleneck
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(args.client_processes) as pool:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(pool, drive_process, "127.0.0.1", args.port,
+                                     args.connections // args.client_processes, args.duration,
+                                     args.sensors, args.write_ratio)
+                for _ in range(args.client_processes)))
+        counts = {key: sum(result[0][key] for result in results) for key in ("requests", "errors")}
+        elapsed = max(result[1] for result in results)
+        await asyncio.sleep(0.5)
+        seen = await sensor_counts("127.0.0.1", args.port)
+        await loop.run_in_executor(None, publish_predictions, args.broker_port, args.predictions)
+        await asyncio.sleep(0.5)
+        predictions = await prediction_counts("127.0.0.1", args.port)
+        print(f"workers={workers}: {counts['requests'] / elapsed:9.0f} req/s  "
+              f"({counts['requests']} ok, {counts['errors']} errors)  sensors reported by workers: {sorted(seen)}  "
+              f"ml predictions reported by workers: {sorted(predictions)} of {args.predictions}")
+    finally:
+        for child in (process, broker):
+            child.terminate()
+            child.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--sensors", type=int, default=300)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--predictions", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--broker-port", type=int, default=18831)
+    parser.add_argument("--client-processes", type=int, default=max((os.cpu_count() or 2) // 2, 1))
+    args = parser.parse_args()
+    for workers in args.workers:
+        asyncio.run(bench(workers, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+from typing import Dict, Iterable, List
+import numpy as np
+
+READING_DTYPE = np.dtype([("time", "f8"), ("value", "f4"), ("sensor", "u4")])
+
+
+class ColumnBuffer:
+    """Preallocated circular structured array holding one sensor type's history."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=READING_DTYPE)
+        self.head = 0
+        self.count = 0
+
+    def extend(self, times: np.ndarray, values: np.ndarray, sensors: np.ndarray):
+        n = len(times)
+        if n == 0:
+            return
+        if n > self.capacity:
+            times, values, sensors = times[-self.capacity:], values[-self.capacity:], sensors[-self.capacity:]
+            n = self.capacity
+        first = min(n, self.capacity - self.head)
+        for start, stop, offset in ((self.head, self.head + first, 0), (0, n - first, first)):
+            if stop > start:
+                rows = self.data[start:stop]
+                rows["time"] = times[offset:offset + stop - start]
+                rows["value"] = values[offset:offset + stop - start]
+                rows["sensor"] = sensors[offset:offset + stop - start]
+        self.head = (self.head + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+
+    def segments(self) -> List[np.ndarray]:
+        """Views over the stored rows, oldest first, without copying."""
+        if self.count < self.capacity:
+            return [self.data[:self.count]]
+        return [self.data[self.head:], self.data[:self.head]]
+
+    def oldest_time(self) -> float | None:
+        if self.count == 0:
+            return None
+        return float(self.segments()[0]["time"][0])
+
+    def select(self, start: float | None = None, end: float | None = None, sensor: int | None = None) -> np.ndarray:
+        """Rows with start <= time < end (and matching sensor), oldest first."""
+        parts = []
+        for segment in self.segments():
+            mask = np.ones(len(segment), dtype=bool)
+            if start is not None:
+                mask &= segment["time"] >= start
+            if end is not None:
+                mask &= segment["time"] < end
+            if sensor is not None:
+                mask &= segment["sensor"] == sensor
+            parts.append(segment[mask])
+        return np.concatenate(parts) if len(parts) > 1 else parts[0].copy()
+
+
+class ColumnStore:
+    """Deep in-memory history: one ColumnBuffer per sensor type plus an interned sensor-id table.
+
+    A row takes 16 bytes (float64 epoch time, float32 value, uint32 sensor index), so
+    a million readings per type fit in ~16 MB instead of a deque of pydantic objects.
+    """
+
+    def __init__(self, sensor_types: Iterable[str], capacity: int = 1_000_000):
+        self.capacity = capacity
+        self.buffers: Dict[str, ColumnBuffer] = {name: ColumnBuffer(capacity) for name in sensor_types}
+        self._ids: Dict[str, int] = {}
+        self.sensor_names: List[str] = []
+
+    def intern(self, sensor_id: str) -> int:
+        index = self._ids.get(sensor_id)
+        if index is None:
+            index = self._ids[sensor_id] = len(self.sensor_names)
+            self.sensor_names.append(sensor_id)
+        return index
+
+    def extend(self, readings: Iterable):
+        columns: Dict[str, tuple] = {}
+        for reading in readings:
+            if reading.sensor_type not in self.buffers:
+                continue
+            times, values, sensors = columns.setdefault(reading.sensor_type, ([], [], []))
+            times.append(reading.time.timestamp())
+            values.append(reading.value)
+            sensors.append(self.intern(reading.sensor_id))
+        for sensor_type, (times, values, sensors) in columns.items():
+            self.buffers[sensor_type].extend(np.asarray(times, dtype="f8"),
+                                             np.asarray(values, dtype="f4"),
+                                             np.asarray(sensors, dtype="u4"))
+
+    def query(self, sensor_type: str, start: float | None = None, end: float | None = None,
+              sensor_id: str | None = None) -> np.ndarray:
+        """Rows for one sensor type in [start, end), optionally for a single sensor."""
+        buffer = self.buffers[sensor_type]
+        sensor = None
+        if sensor_id is not None:
+            sensor = self._ids.get(sensor_id)
+            if sensor is None:
+                return np.empty(0, dtype=READING_DTYPE)
+        return buffer.select(start, end, sensor)
+
+    def to_columns(self, rows: np.ndarray) -> dict:
+        """Columnar JSON-ready form of query() output."""
+        names = np.asarray(self.sensor_names, dtype=object)
+        return {
+            "time": rows["time"].tolist(),
+            "value": rows["value"].astype("f8").round(4).tolist(),
+            "sensor_id": names[rows["sensor"]].tolist() if len(rows) else [],
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.data.nbytes for buffer in self.buffers.values())
+
+    def __len__(self):
+        return sum(buffer.count for buffer in self.buffers.values())
@@ -0,0 +1,14 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+import gateway
+import standins
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """The gateway app with the Mongo stand-in and no MQTT connection."""
+    monkeypatch.setattr(gateway, "AsyncMongoClient", standins.FakeMongoClient)
+    monkeypatch.setattr(gateway, "run_mqtt_client", lambda *args, **kwargs: asyncio.sleep(3600))
+    with TestClient(gateway.app) as client:
+        yield client
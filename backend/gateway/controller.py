@@ -0,0 +1,193 @@
+"""Closed-loop greenhouse control on the live reading stream.
+
+Every batch of readings is averaged per sensor type and zone, and each type's loop
+decides two actuators per zone: one that raises the value (heater, humidifier, pump)
+and one that lowers it (fan, dehumidifier). A zone's full actuator state is published
+to `<topic>/<zone>` (retained) only when it changes, so the peer applies absolute
+states and a reconnecting peer picks up the current ones from the broker.
+"""
+import json
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Tuple
+import numpy as np
+
+# sensor type -> (actuator that raises the value, actuator that lowers it)
+ACTUATOR_PAIRS = {
+    "temperature": ("heater", "fan"),
+    "humidity": ("humidifier", "dehumidifier"),
+    "moisture": ("pump", None),
+}
+ACTUATORS = ("fan", "heater", "pump", "humidifier", "dehumidifier")
+
+
+class _ZoneArrays:
+    """Per-zone state arrays that grow to the highest zone seen."""
+
+    FIELDS: Tuple[str, ...] = ()
+
+    def __init__(self, capacity: int = 16):
+        for name in self.FIELDS:
+            setattr(self, name, np.zeros(capacity))
+        self.raising = np.zeros(capacity, dtype=bool)
+        self.lowering = np.zeros(capacity, dtype=bool)
+
+    def _reserve(self, zones: np.ndarray):
+        needed = int(zones.max()) + 1
+        if needed > len(self.raising):
+            size = max(needed, 2 * len(self.raising))
+            for name in self.FIELDS + ("raising", "lowering"):
+                array = getattr(self, name)
+                grown = np.zeros(size, dtype=array.dtype)
+                grown[:len(array)] = array
+                setattr(self, name, grown)
+
+
+class HysteresisLoop(_ZoneArrays):
+    """On/off control with a dead band.
+
+    The raising actuator switches on below `low` and off once the value is back at the
+    middle of the band; the lowering one mirrors it above `high`.
+    """
+
+    def __init__(self, low: float, high: float):
+        super().__init__()
+        self.low = low
+        self.high = high
+        self.target = (low + high) / 2
+
+    def update(self, zones: np.ndarray, values: np.ndarray, now: float) -> Tuple[np.ndarray, np.ndarray]:
+        self._reserve(zones)
+        raising = (values < self.low) | (self.raising[zones] & (values < self.target))
+        lowering = (values > self.high) | (self.lowering[zones] & (values > self.target))
+        self.raising[zones] = raising
+        self.lowering[zones] = lowering
+        return raising, lowering
+
+
+class PIDLoop(_ZoneArrays):
+    """PID on the distance to the middle of the band, switching actuators on the output's sign.
+
+    The output is normalised so that 1.0 means "fully on"; the raising actuator runs
+    while it is above `threshold` and the lowering one while it is below -`threshold`.
+    The integral is clamped to ±`integral_limit` to avoid wind-up while an actuator
+    cannot keep up.
+    """
+
+    FIELDS = ("integral", "previous", "last_update")
+
+    def __init__(self, low: float, high: float, kp: float, ki: float, kd: float,
+                 threshold: float = 0.5, integral_limit: float = 1.0):
+        super().__init__()
+        self.target = (low + high) / 2
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.threshold = threshold
+        self.integral_limit = integral_limit
+
+    def update(self, zones: np.ndarray, values: np.ndarray, now: float) -> Tuple[np.ndarray, np.ndarray]:
+        self._reserve(zones)
+        error = self.target - values
+        last = self.last_update[zones]
+        fresh = last == 0
+        dt = np.where(fresh, 0.0, now - last)
+        integral = np.clip(self.integral[zones] + self.ki * error * dt,
+                           -self.integral_limit, self.integral_limit)
+        derivative = np.divide(error - self.previous[zones], dt, out=np.zeros_like(error), where=dt > 0)
+        output = self.kp * error + integral + self.kd * derivative
+
+        self.integral[zones] = integral
+        self.previous[zones] = error
+        self.last_update[zones] = now
+        raising = output > self.threshold
+        lowering = output < -self.threshold
+        self.raising[zones] = raising
+        self.lowering[zones] = lowering
+        return raising, lowering
+
+
+def make_loops(mode: str, setpoints: Dict[str, Tuple[float, float]],
+               gains: Dict[str, Tuple[float, float, float]] | None = None) -> Dict[str, object]:
+    """One loop per sensor type; `setpoints` maps a type to its (low, high) band."""
+    if mode == "hysteresis":
+        return {name: HysteresisLoop(low, high) for name, (low, high) in setpoints.items()}
+    if mode == "pid":
+        return {name: PIDLoop(low, high, *gains[name]) for name, (low, high) in setpoints.items()}
+    raise ValueError(f"Unknown control mode: {mode}")
+
+
+class ZoneController:
+    """Runs the per-type loops over ingest batches and publishes actuator changes per zone.
+
+    `publish(topic, payload)` returns whether the command was handed to the broker.
+    `on_command(seconds)`, if given, is called with the time from the batch reaching the
+    gateway to its command going out (e.g. a metrics histogram).
+    """
+
+    def __init__(self, loops: Dict[str, object], publish: Callable[[str, bytes], bool],
+                 topic: str = "actuators", max_zones: int = 1024,
+                 on_command: Callable[[float], None] | None = None):
+        self.loops = loops
+        self.publish = publish
+        self.topic = topic
+        self.max_zones = max_zones
+        self.on_command = on_command
+        self.actuators: Dict[int, Dict[str, bool]] = {}
+        # Zones whose last command could not be published; retried with the next batch
+        self._unsent: set = set()
+
+        self.evaluated = 0
+        self.commands = 0
+        self.failed = 0
+        self.ignored = 0
+
+    def process(self, readings: Iterable, received_at: float | None = None) -> List[int]:
+        """Feed a batch to the loops; returns the zones whose commands were published."""
+        groups: Dict[str, List] = defaultdict(list)
+        for reading in readings:
+            if reading.sensor_type in self.loops:
+                groups[reading.sensor_type].append(reading)
+        now = time.time()
+        changed = set(self._unsent)
+        for sensor_type, group in groups.items():
+            zones = np.fromiter((r.zone for r in group), dtype=np.int64, count=len(group))
+            values = np.fromiter((r.value for r in group), dtype="f8", count=len(group))
+            valid = (zones >= 0) & (zones < self.max_zones)
+            if not valid.all():
+                self.ignored += int((~valid).sum())
+                zones, values = zones[valid], values[valid]
+                if not len(zones):
+                    continue
+            # One control input per zone: the mean of its readings in this batch
+            unique, inverse = np.unique(zones, return_inverse=True)
+            means = np.bincount(inverse, weights=values) / np.bincount(inverse)
+            raising, lowering = self.loops[sensor_type].update(unique, means, now)
+            self.evaluated += len(unique)
+
+            raise_name, lower_name = ACTUATOR_PAIRS[sensor_type]
+            for zone, up, down in zip(unique.tolist(), raising.tolist(), lowering.tolist()):
+                state = self.actuators.get(zone)
+                if state is None:
+                    state = self.actuators[zone] = dict.fromkeys(ACTUATORS, False)
+                    changed.add(zone)
+                if state[raise_name] != up:
+                    state[raise_name] = up
+                    changed.add(zone)
+                if lower_name is not None and state[lower_name] != down:
+                    state[lower_name] = down
+                    changed.add(zone)
+
+        for zone in sorted(changed):
+            payload = json.dumps({**self.actuators[zone], "issued": time.time()}).encode()
+            if self.publish(f"{self.topic}/{zone}", payload):
+                self._unsent.discard(zone)
+                self.commands += 1
+                if self.on_command is not None and received_at is not None:
+                    self.on_command(time.monotonic() - received_at)
+            else:
+                self._unsent.add(zone)
+                self.failed += 1
+        return sorted(changed)
+
+    def stats(self) -> dict:
+        return {"zones": len(self.actuators), "evaluated": self.evaluated, "commands": self.commands,
+                "failed": self.failed, "ignored": self.ignored}
@@ -0,0 +1,92 @@
+import json
+import struct
+from datetime import datetime
+from typing import List, Union
+import numpy as np
+from pydantic import TypeAdapter
+from pydantic_core import from_json
+from models import Reading, Prediction
+
+READINGS = TypeAdapter(List[Reading])
+PREDICTIONS = TypeAdapter(List[Prediction])
+READING_OR_LIST = TypeAdapter(Union[Reading, List[Reading]])
+
+# Compact sensor payload (little-endian), told apart from JSON by its first byte:
+#   u8 magic, u8 sample count n, u16 zone, then n x (f8 epoch seconds, f4 value)
+BINARY_MAGIC = 0xA5
+BINARY_HEADER = struct.Struct("<BBH")
+BINARY_SAMPLE = np.dtype([("time", "<f8"), ("value", "<f4")])
+
+
+def decode_reading(payload: bytes, fast: bool = True) -> Reading:
+    """Decode one MQTT sensor payload.
+
+    The fast path hands the raw bytes to pydantic-core, which parses the JSON and the
+    ISO timestamp in a single pass without building an intermediate dict.
+    """
+    if fast:
+        return Reading.model_validate_json(payload)
+    return Reading(**json.loads(payload.decode()))
+
+def decode_sensor_payload(sensor_type: str, sensor_id: str, payload: bytes, fast: bool = True) -> Reading:
+    """Build a Reading from a sensors/<type>/<id> message, taking type and id from the topic.
+
+    The payload is only parsed (not validated) into a dict, the topic fields are added and
+    the result is validated once as a Reading.
+    """
+    doc = from_json(payload) if fast else json.loads(payload.decode())
+    return Reading.model_validate(_with_topic(doc, sensor_type, sensor_id))
+
+def _with_topic(doc, sensor_type: str, sensor_id: str):
+    # The topic wins over ids a legacy payload may still carry
+    if isinstance(doc, dict):
+        doc["sensor_id"] = sensor_id
+        doc["sensor_type"] = sensor_type
+    return doc
+
+def decode_sensor_samples(sensor_type: str, sensor_id: str, payload: bytes, fast: bool = True) -> List[Reading]:
+    """Every reading in a sensors/<type>/<id> message.
+
+    The payload is one JSON sample, a JSON list of samples (a batching sensor) or a
+    binary batch starting with BINARY_MAGIC.
+    """
+    if payload and payload[0] == BINARY_MAGIC:
+        return decode_binary_samples(sensor_type, sensor_id, payload)
+    if payload[:1] != b"[":
+        return [decode_sensor_payload(sensor_type, sensor_id, payload, fast)]
+    docs = from_json(payload) if fast else json.loads(payload)
+    if isinstance(docs, list):
+        docs = [_with_topic(doc, sensor_type, sensor_id) for doc in docs]
+    return READINGS.validate_python(docs)
+
+def decode_binary_samples(sensor_type: str, sensor_id: str, payload: bytes) -> List[Reading]:
+    _, count, zone = BINARY_HEADER.unpack_from(payload)
+    if len(payload) != BINARY_HEADER.size + count * BINARY_SAMPLE.itemsize:
+        raise ValueError(f"Binary payload of {len(payload)} bytes does not hold {count} samples")
+    samples = np.frombuffer(payload, BINARY_SAMPLE, count=count, offset=BINARY_HEADER.size)
+    # f4 keeps ~7 significant digits; round away the widening noise (21.46 -> 21.459999084...)
+    values = samples["value"].astype("f8").round(4).tolist()
+    return READINGS.validate_python([
+        {"sensor_id": sensor_id, "sensor_type": sensor_type, "value": value,
+         "time": datetime.fromtimestamp(stamp), "zone": zone}
+        for stamp, value in zip(samples["time"].tolist(), values)])
+
+def decode_prediction(payload: bytes, fast: bool = True) -> Prediction:
+    if fast:
+        return Prediction.model_validate_json(payload)
+    return Prediction(**json.loads(payload.decode()))
+
+def decode_readings(payload: bytes, fast: bool = True) -> List[Reading]:
+    """Decode an HTTP body holding either one reading or a list of readings."""
+    if fast:
+        item = READING_OR_LIST.validate_json(payload)
+    else:
+        item = READING_OR_LIST.validate_python(json.loads(payload.decode()))
+    return item if isinstance(item, list) else [item]
+
+def dump_readings(readings) -> bytes:
+    """Serialize readings straight to JSON bytes, skipping FastAPI's jsonable_encoder pass."""
+    return READINGS.dump_json(list(readings))
+
+def dump_predictions(predictions) -> bytes:
+    return PREDICTIONS.dump_json(list(predictions))
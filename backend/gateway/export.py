@@ -0,0 +1,217 @@
+"""Bulk export and import of sensor history as compressed NPZ chunks.
+
+Readings are read from Mongo with a batched, projected cursor sorted by time and
+written out in chunks of at most `chunk_rows` readings, partitioned by sensor type
+and day:
+
+    <out>/<sensor_type>/<YYYY-MM-DD>/part-00000.npz
+
+Each chunk holds the columns `time` (f8, epoch seconds; Mongo's naive times are UTC), `value` (f8),
+`zone` (u2), `sensor` (u4, index into `sensors`) and `sensors` (the sensor ids in the
+chunk; chunks written before `zone` was added import with zone 0), so
+memory use is bounded by the chunk size however long the range is. /export streams
+the same files as a tar archive. Importing a directory or such a tar writes the
+readings back (backfill). Stop the gateway or pick a range it is not writing to:
+
+    python export.py export ./dump --from 2025-01-01 --to 2025-02-01 [--types temperature]
+    python export.py import ./dump          # or an archive saved from /export
+"""
+import argparse
+import asyncio
+import io
+import os
+import tarfile
+from datetime import date, datetime, timezone
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+CHUNK_ROWS = 100_000
+CURSOR_BATCH_SIZE = 10_000
+IMPORT_BATCH_SIZE = 10_000
+
+Chunk = Tuple[date, int, bytes]
+
+
+def encode_chunk(times: List[float], values: List[float], zones: List[int], sensor_ids: List[str]) -> bytes:
+    sensors, index = np.unique(np.array(sensor_ids), return_inverse=True)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, time=np.array(times, dtype="f8"), value=np.array(values, dtype="f8"),
+                        zone=np.array(zones, dtype="u2"), sensor=index.astype("u4"), sensors=sensors)
+    return buffer.getvalue()
+
+
+def decode_chunk(data: bytes) -> Dict[str, np.ndarray]:
+    with np.load(io.BytesIO(data)) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
+def chunk_documents(columns: Dict[str, np.ndarray], sensor_type: str) -> Iterator[dict]:
+    """Mongo documents for one decoded chunk, shaped like the ones the gateway writes."""
+    names = columns["sensors"].tolist()
+    zones = columns["zone"].tolist() if "zone" in columns else [0] * len(columns["time"])
+    for t, value, zone, sensor in zip(columns["time"].tolist(), columns["value"].tolist(), zones,
+                                      columns["sensor"].tolist()):
+        yield {"sensor_id": names[sensor], "sensor_type": sensor_type, "value": value,
+               "time": datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None), "zone": zone}
+
+
+async def export_chunks(collection, start: datetime | None = None, end: datetime | None = None,
+                        chunk_rows: int = CHUNK_ROWS, batch_size: int = CURSOR_BATCH_SIZE) -> AsyncIterator[Chunk]:
+    """(day, part, npz bytes) for every chunk of one collection, in time order.
+
+    Chunks are compressed on the default executor so a large export does not stall the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    match: dict = {}
+    if start is not None:
+        match.setdefault("time", {})["$gte"] = start
+    if end is not None:
+        match.setdefault("time", {})["$lt"] = end
+    cursor = collection.find(match, projection={"_id": 0, "sensor_id": 1, "value": 1, "time": 1, "zone": 1},
+                             sort=[("time", 1)], batch_size=batch_size)
+    times: List[float] = []
+    values: List[float] = []
+    zones: List[int] = []
+    sensor_ids: List[str] = []
+    day: date | None = None
+    part = 0
+    async for doc in cursor:
+        doc_day = doc["time"].date()
+        if times and (doc_day != day or len(times) >= chunk_rows):
+            yield day, part, await loop.run_in_executor(None, encode_chunk, times, values, zones, sensor_ids)
+            part = part + 1 if doc_day == day else 0
+            times, values, zones, sensor_ids = [], [], [], []
+        day = doc_day
+        # pymongo returns naive datetimes that are UTC, whatever the host's time zone
+        times.append(doc["time"].replace(tzinfo=timezone.utc).timestamp())
+        values.append(doc["value"])
+        # Readings stored before zones existed have no zone field
+        zones.append(doc.get("zone", 0))
+        sensor_ids.append(doc["sensor_id"])
+    if times:
+        yield day, part, await loop.run_in_executor(None, encode_chunk, times, values, zones, sensor_ids)
+
+
+def chunk_path(sensor_type: str, day: date, part: int) -> str:
+    return f"{sensor_type}/{day.isoformat()}/part-{part:05d}.npz"
+
+
+async def export_to_directory(collections: Dict, out_dir: str, start: datetime | None = None,
+                              end: datetime | None = None, chunk_rows: int = CHUNK_ROWS, log=print) -> Dict[str, int]:
+    exported: Dict[str, int] = {}
+    for sensor_type, collection in collections.items():
+        exported[sensor_type] = 0
+        async for day, part, data in export_chunks(collection, start, end, chunk_rows):
+            path = os.path.join(out_dir, chunk_path(sensor_type, day, part))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            exported[sensor_type] += 1
+            log(f"{path} written")
+    return exported
+
+
+class _TarSink:
+    """Write-only file object that hands the tar stream out piece by piece."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+async def export_tar(collections: Dict, start: datetime | None = None, end: datetime | None = None,
+                     chunk_rows: int = CHUNK_ROWS) -> AsyncIterator[bytes]:
+    """Tar archive of the export layout, produced one chunk at a time."""
+    sink = _TarSink()
+    tar = tarfile.open(fileobj=sink, mode="w|")
+    for sensor_type, collection in collections.items():
+        async for day, part, data in export_chunks(collection, start, end, chunk_rows):
+            info = tarfile.TarInfo(chunk_path(sensor_type, day, part))
+            info.size = len(data)
+            info.mtime = int(datetime.now().timestamp())
+            tar.addfile(info, io.BytesIO(data))
+            yield sink.drain()
+    tar.close()
+    yield sink.drain()
+
+
+def iter_import_files(path: str) -> Iterator[Tuple[str, bytes]]:
+    """(sensor_type, npz bytes) from an export directory or tar archive."""
+    if os.path.isdir(path):
+        for root, _, files in sorted(os.walk(path)):
+            for name in sorted(files):
+                if name.endswith(".npz"):
+                    full = os.path.join(root, name)
+                    with open(full, "rb") as f:
+                        yield os.path.relpath(full, path).split(os.sep)[0], f.read()
+    else:
+        with tarfile.open(path, mode="r|*") as tar:
+            for member in tar:
+                if member.isfile() and member.name.endswith(".npz"):
+                    data = tar.extractfile(member)
+                    if data is not None:
+                        yield member.name.split("/")[0], data.read()
+
+
+async def import_chunks(collections: Dict, files: Iterable[Tuple[str, bytes]],
+                        batch_size: int = IMPORT_BATCH_SIZE, log=print) -> Dict[str, int]:
+    """Insert exported chunks back into their collections."""
+    imported = {sensor_type: 0 for sensor_type in collections}
+    for sensor_type, data in files:
+        collection = collections.get(sensor_type)
+        if collection is None:
+            log(f"Skipping chunk of unknown sensor type: {sensor_type}")
+            continue
+        batch = []
+        for doc in chunk_documents(decode_chunk(data), sensor_type):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                await collection.insert_many(batch, ordered=False)
+                imported[sensor_type] += len(batch)
+                batch = []
+        if batch:
+            await collection.insert_many(batch, ordered=False)
+            imported[sensor_type] += len(batch)
+        log(f"{sensor_type}: {imported[sensor_type]} readings imported")
+    return imported
+
+
+async def _main(args):
+    from pymongo import AsyncMongoClient
+    import gateway
+
+    client = AsyncMongoClient(args.uri or gateway.MONGO_URI)
+    db = client[args.db]
+    collections = {name: db[name] for name in (args.types or gateway.SENSOR_TYPES)}
+    try:
+        if args.command == "export":
+            start = datetime.fromisoformat(args.start) if args.start else None
+            end = datetime.fromisoformat(args.end) if args.end else None
+            print(await export_to_directory(collections, args.path, start, end, args.chunk_rows))
+        else:
+            print(await import_chunks(collections, iter_import_files(args.path), args.batch_size))
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("path", help="export directory, or a directory / tar archive to import")
+    parser.add_argument("--from", dest="start", help="ISO start time (inclusive)")
+    parser.add_argument("--to", dest="end", help="ISO end time (exclusive)")
+    parser.add_argument("--types", nargs="+", help="sensor types, defaults to gateway.SENSOR_TYPES")
+    parser.add_argument("--uri", help="defaults to gateway.MONGO_URI")
+    parser.add_argument("--db", default="sensors")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    asyncio.run(_main(parser.parse_args()))
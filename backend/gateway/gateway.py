@@ -1,61 +1,273 @@
 from typing import Any
-from collections import deque
 import asyncio
-from pydantic import BaseModel
+import os
+import time
+import socket
+from pydantic import ValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Union,List
 import uvicorn
 import json
 from contextlib import asynccontextmanager
-from fastapi import FastAPI,Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI,Request,Query
+from fastapi.exceptions import RequestValidationError
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from pymongo import AsyncMongoClient
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
 from datetime import datetime
+from models import Reading, Prediction
+from decoding import PREDICTIONS, READINGS, decode_sensor_samples, decode_prediction, decode_readings, dump_readings, dump_predictions
+from mongo_writer import MongoBatchWriter
+from spool import SpoolWriter, claim_spool
+from sensor_store import SensorStore
+from column_store import ColumnStore
+from timeseries import ensure_collections
+from streaming import StreamHub
+from snapshot_cache import SnapshotCache, etag_matches
+from aggregation import AGGREGATIONS, LTTB_OVERSAMPLE, aggregate_rows, mongo_pipeline, rollup_pipeline, series_from_buckets
+from ingest_bridge import IngestBridge
+from topic_router import TopicRouter
+from state_backend import start_state_server, connect_state_backend
+from export import export_tar
+from inference import InferenceEngine, to_predictions
+from prediction_store import PredictionStore
+from controller import ZoneController, make_loops
+from rollup import RollupWriter, choose_tier, ensure_rollup_collections, rollup_name
+from metrics import Registry, LatencyMiddleware, SamplingProfiler
 import logging
 log = logging.getLogger("uvicorn")
 log.setLevel(logging.DEBUG)
-from typing import cast
-col_temperature: Any
-col_humidity: Any
-col_moisture: Any
-MONGO_URI = "mongodb+srv://a:a@cluster0.daspxne.mongodb.net/?appName=Cluster0"
+col_temperature: Any = None
+col_humidity: Any = None
+col_moisture: Any = None
+MONGO_URI = os.environ.get("GATEWAY_MONGO_URI", "mongodb+srv://a:a@cluster0.daspxne.mongodb.net/?appName=Cluster0")
 mongo_client = None
 
-MQTT_BROKER = "192.168.0.38"
-MQTT_PORT = 8883
+MQTT_BROKER = os.environ.get("GATEWAY_MQTT_BROKER", "192.168.0.38")
+MQTT_PORT = int(os.environ.get("GATEWAY_MQTT_PORT", 8883))
+# Seconds shutdown waits for the MQTT network thread to return after disconnecting
+MQTT_STOP_TIMEOUT = 5.0
+GATEWAY_HOST = os.environ.get("GATEWAY_HOST", "192.168.0.38")
+GATEWAY_PORT = int(os.environ.get("GATEWAY_PORT", 8000))
+GATEWAY_WORKERS = int(os.environ.get("GATEWAY_WORKERS", 1))
+# Several workers (or gateways on several hosts, via the env var) join one shared subscription so the
+# broker splits sensor traffic between them; a single gateway keeps its persistent "gateway" session
+# instead, so QoS 1 readings published while it is down are delivered when it reconnects
+MQTT_SHARED_GROUP: str | None = os.environ.get("GATEWAY_MQTT_SHARED_GROUP") or ("gateway" if GATEWAY_WORKERS > 1 else None)
+# host:port of the shared ReadingLog; __main__ starts one when running several workers
+STATE_ADDRESS = os.environ.get("GATEWAY_STATE_ADDRESS")
+STATE_AUTHKEY = os.environ.get("GATEWAY_STATE_AUTHKEY", "")
+STATE_SYNC_INTERVAL = 0.05
+STATE_LOG_RETENTION = 10000
 
-class Reading(BaseModel):
-    sensor_id: str
-    sensor_type: str
-    value: float
-    time: datetime
+SENSOR_TYPES = ("temperature", "humidity", "moisture")
+SENSOR_HISTORY_DEPTH = 100
+SENSOR_IDLE_TIMEOUT = 600.0
+HISTORY_CAPACITY = 1_000_000
+QUERY_DEFAULT_POINTS = 500
+QUERY_MAX_POINTS = 5000
+STREAM_MAX_PENDING = 1000
+STREAM_KEEPALIVE = 15.0
 
-class Prediction(BaseModel):
-    sensor_type: str
-    real: float
-    prediction: float
+# Sensor collections are MongoDB time-series collections (timeField=time, metaField=sensor_id)
+MONGO_GRANULARITY = "seconds"
+# Minute/hour/day rollups (<type>_<tier>) kept up to date from the ingest stream; /query uses the
+# coarsest tier that fits the requested bucket, so raw readings only need to cover recent history
+ROLLUP_ENABLED = True
+ROLLUP_TIERS = {"minute": 60, "hour": 3600, "day": 86400}
+ROLLUP_RETENTION_SECONDS: dict = {"minute": 90 * 86400, "hour": 2 * 365 * 86400, "day": None}
+ROLLUP_FLUSH_INTERVAL = 5.0
+ROLLUP_MAX_PENDING = 500000
+# Raw readings expire only when this is set explicitly: run 'python rollup.py backfill' first, or
+# the history older than the TTL is deleted before any rollup of it exists (e.g. 1209600 = 14 days)
+RAW_RETENTION_SECONDS: int | None = int(os.environ["GATEWAY_RAW_RETENTION_SECONDS"]) \
+    if os.environ.get("GATEWAY_RAW_RETENTION_SECONDS") else None
+
+MONGO_BATCH_SIZE = 500
+MONGO_FLUSH_INTERVAL = 1.0
+MONGO_MAX_PENDING = 20000
+# With a spool directory, readings go to an on-disk log first and are drained to Mongo from there,
+# so ingest never waits for Mongo and an outage's backlog survives restarts (one subdirectory per worker)
+SPOOL_DIR = os.environ.get("GATEWAY_SPOOL_DIR") or None
+SPOOL_SEGMENT_BYTES = 64 << 20
+SPOOL_MAX_BYTES = 2 << 30
+SPOOL_DRAIN_BATCH = 5000
+SPOOL_MAX_RETRY_INTERVAL = 30.0
+# Tries per batch before it goes to the spool's dead-letter file (about 8 minutes with the backoff above)
+SPOOL_MAX_ATTEMPTS = 20
+INGEST_MAX_PENDING = 50000
+# Online per-sensor EWMA z-score anomaly flags and Holt forecasts on the ingest stream
+INFERENCE_ENABLED = True
+INFERENCE_EWMA_ALPHA = 0.1
+INFERENCE_HOLT_ALPHA = 0.5
+INFERENCE_HOLT_BETA = 0.1
+ANOMALY_Z_THRESHOLD = 4.0
+ANOMALY_WARMUP = 10
+PREDICTION_HISTORY_DEPTH = 100
+# Predictions received on the ml topic: bounded per type, optionally persisted to predictions_<type>
+PREDICTION_CAPACITY = 10000
+PREDICTION_RETENTION_SECONDS: float | None = 24 * 3600
+PREDICTION_PERSIST = False
+ML_DEFAULT_LIMIT = 1000
+ML_MAX_LIMIT = 10000
+# Per-zone closed-loop control; commands go to CONTROL_TOPIC/<zone> as retained messages.
+# Off unless explicitly enabled: retained commands drive real actuators
+CONTROL_ENABLED = os.environ.get("GATEWAY_CONTROL", "") == "1"
+CONTROL_TOPIC = "actuators"
+CONTROL_QOS = 1
+CONTROL_MODE = os.environ.get("GATEWAY_CONTROL_MODE", "hysteresis")  # or "pid"
+CONTROL_MAX_ZONES = 1024
+# (low, high) band per sensor type; PID mode steers to the middle of the band
+CONTROL_SETPOINTS = {"temperature": (18.0, 26.0), "humidity": (60.0, 80.0), "moisture": (400.0, 600.0)}
+# (kp, ki, kd) per sensor type for PID mode
+CONTROL_PID_GAINS = {"temperature": (0.25, 0.005, 0.0), "humidity": (0.1, 0.002, 0.0), "moisture": (0.01, 0.0002, 0.0)}
+# Sampling profiler behind /debug/profile; off unless explicitly enabled
+PROFILER_ENABLED = os.environ.get("GATEWAY_PROFILER", "") == "1"
+PROFILER_INTERVAL = 0.005
+PROFILER_MAX_SECONDS = 60.0
+# Decode payloads with pydantic-core straight from bytes and serialize responses without jsonable_encoder
+FAST_DECODE = True
+
+# Hot-path instruments; everything else in /metrics is read from component stats at scrape time
+METRICS = Registry("gateway_")
+INGEST_LAG = METRICS.histogram("ingest_to_visible_seconds",
+                               "Time from MQTT receipt (or POST /add) until a batch is visible to reads")
+APPLY_SECONDS = METRICS.histogram("apply_batch_seconds", "Time to apply one batch to the in-memory stores")
+BATCH_SIZE = METRICS.histogram("ingest_batch_readings", "Readings per ingest batch",
+                               buckets=(1, 10, 100, 1000, 10000, 100000))
+MONGO_FLUSH_SECONDS = METRICS.histogram("mongo_flush_seconds", "Duration of one Mongo writer flush", ("writer",))
+HTTP_SECONDS = METRICS.histogram("http_request_seconds", "Time until response headers, per route",
+                                 ("method", "route", "status"))
+CONTROL_LAG = METRICS.histogram("control_command_seconds",
+                                "Time from a batch reaching the gateway until the actuator command it caused is sent")
+
+def apply_batch(app: FastAPI, batch: List[Reading], received_at: float | None = None):
+    """Make a batch visible to the read endpoints and live subscribers."""
+    app.state.sensor_store.extend(batch)
+    app.state.history.extend(batch)
+    app.state.stream_hub.publish(batch)
+    if app.state.inference is not None:
+        app.state.prediction_store.extend(app.state.inference.process(batch))
+    # With several workers each one runs the loops on the full replayed stream and sends the
+    # same absolute commands, which the peer applies idempotently
+    if app.state.controller is not None:
+        app.state.controller.process(batch, received_at)
 
 async def queue_consumer(app: FastAPI):
-    """Consume readings from the async queue and push into the correct buffer."""
+    """Consume batches of readings from the async queue and apply them, or publish them to the shared log."""
     while True:
-        reading: Reading = await app.state.data_queue.get()
+        received_at, batch = await app.state.data_queue.get()
         try:
-            if reading.sensor_type == "temperature":
-                app.state.temperature_data.append(reading)
-            elif reading.sensor_type == "humidity":
-                app.state.humidity_data.append(reading)
-            elif reading.sensor_type == "moisture":
-                app.state.moisture_data.append(reading)
+            BATCH_SIZE.observe(len(batch))
+            with APPLY_SECONDS.time():
+                if app.state.shared_log is not None:
+                    # Manager proxies block on IPC, so they are called off the event loop
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, app.state.shared_log.append, dump_readings(batch))
+                else:
+                    apply_batch(app, batch, received_at)
+            INGEST_LAG.observe(time.monotonic() - received_at)
         finally:
             app.state.data_queue.task_done()
 
+async def state_sync(app: FastAPI):
+    """Replay batches and predictions every worker appended to the shared logs into this worker's stores."""
+    loop = asyncio.get_running_loop()
+    seq = prediction_seq = 0
+    while True:
+        try:
+            seq, chunks = await loop.run_in_executor(None, app.state.shared_log.since, seq)
+            for chunk in chunks:
+                apply_batch(app, READINGS.validate_json(chunk))
+            prediction_seq, chunks = await loop.run_in_executor(None, app.state.shared_predictions.since, prediction_seq)
+            for chunk in chunks:
+                app.state.predictions.extend(PREDICTIONS.validate_json(chunk))
+        except Exception as e:
+            log.error(f"Shared state sync failed: {e}")
+        await asyncio.sleep(STATE_SYNC_INTERVAL)
+
+def publish_command(app: FastAPI, topic: str, payload: bytes) -> bool:
+    """Send a controller command through the gateway's MQTT connection, if it is up."""
+    client = app.state.mqtt_client
+    if client is None or not client.is_connected():
+        return False
+    return client.publish(topic, payload, qos=CONTROL_QOS, retain=True).rc == mqtt.MQTT_ERR_SUCCESS
+
+def record_predictions(app: FastAPI, predictions: List[Prediction]):
+    """Keep ml-topic predictions in the bounded store and hand them to the optional Mongo writer.
+
+    With several workers only one of them receives each prediction; it persists it and
+    the MQTT thread publishes it to the shared log, from which every worker's store is filled.
+    """
+    if app.state.shared_predictions is None:
+        app.state.predictions.extend(predictions)
+    if app.state.prediction_writer is not None:
+        app.state.prediction_writer.put_nowait(predictions)
+
+def state_metrics(app: FastAPI) -> Registry:
+    """Gauges and counters read from the app's components when /metrics is scraped."""
+    state = app.state
+    registry = Registry("gateway_")
+    registry.counter_func("mqtt_messages_total", "MQTT messages per route; outcome=error counts decode/handler failures",
+                          lambda: {**{(route, "handled"): n for route, n in state.router.handled.items()},
+                                   **{(route, "error"): n for route, n in state.router.errors.items()}},
+                          ("route", "outcome"))
+    registry.counter_func("mqtt_unknown_messages_total", "MQTT messages matching no route", lambda: state.router.unknown)
+    registry.counter_func("ingest_pushed_total", "Readings handed to the ingest bridge", lambda: state.ingest.pushed)
+    registry.counter_func("ingest_batches_total", "Batches delivered by the ingest bridge", lambda: state.ingest.batches)
+    registry.counter_func("ingest_stalls_total", "Times the MQTT thread blocked on a full bridge", lambda: state.ingest.stalls)
+    registry.gauge_func("ingest_pending", "Readings waiting in the ingest bridge", lambda: state.ingest.stats()["pending"])
+    registry.gauge_func("data_queue_depth", "Batches waiting for queue_consumer", state.data_queue.qsize)
+    writers = lambda: {"readings": state.mongo_writer, "predictions": state.prediction_writer}
+    registry.gauge_func("mongo_queue_depth", "Documents buffered or in flight per Mongo writer",
+                        lambda: {(name, ): w.stats()["queue_depth"] for name, w in writers().items() if w}, ("writer",))
+    for field, help in (("written", "Documents written"), ("dropped", "Documents dropped"), ("errors", "Failed insert_many calls")):
+        registry.counter_func(f"mongo_{field}_total", f"{help} per Mongo writer",
+                              lambda field=field: {(name, ): getattr(w, field) for name, w in writers().items() if w},
+                              ("writer",))
+    if isinstance(state.mongo_writer, SpoolWriter):
+        registry.gauge_func("spool_bytes", "Disk used by the ingest spool's segments", lambda: state.mongo_writer.spool.nbytes)
+        registry.counter_func("spool_corrupt_total", "Damaged spool records skipped", lambda: state.mongo_writer.spool.corrupt)
+        registry.counter_func("spool_dead_lettered_total", "Readings moved to the spool's dead-letter file",
+                              lambda: state.mongo_writer.spool.dead_lettered)
+    if state.rollups is not None:
+        registry.gauge_func("rollup_pending", "Rollup buckets changed since the last flush", lambda: len(state.rollups))
+        registry.counter_func("rollup_upserts_total", "Rollup bucket upserts written", lambda: state.rollups.upserts)
+        registry.counter_func("rollup_dropped_total", "Rollup bucket deltas dropped after failed flushes",
+                              lambda: state.rollups.dropped)
+    registry.gauge_func("sensors", "Sensors with recent readings", state.sensor_store.size)
+    registry.gauge_func("history_rows", "Readings in the in-memory column history", lambda: len(state.history))
+    registry.gauge_func("history_bytes", "Bytes allocated for the column history", lambda: state.history.nbytes)
+    registry.gauge_func("stream_subscribers", "Connected SSE clients", lambda: len(state.stream_hub))
+    registry.gauge_func("predictions_stored", "ml-topic predictions held in memory", lambda: len(state.predictions))
+    registry.counter_func("snapshot_requests_total", "Snapshot cache lookups by outcome",
+                          lambda: {(outcome, ): state.snapshots.stats()[outcome] for outcome in ("hits", "builds")},
+                          ("outcome",))
+    if state.inference is not None:
+        registry.counter_func("inference_readings_total", "Readings scored by the inference engine",
+                              lambda: state.inference.processed)
+        registry.counter_func("inference_anomalies_total", "Readings flagged as anomalous",
+                              lambda: state.inference.anomalies)
+    if state.controller is not None:
+        registry.counter_func("control_commands_total", "Actuator commands by outcome",
+                              lambda: {("sent", ): state.controller.commands, ("failed", ): state.controller.failed},
+                              ("outcome",))
+        registry.gauge_func("control_zones", "Zones under closed-loop control", lambda: len(state.controller.actuators))
+    return registry
+
+def enqueue_batch(app: FastAPI):
+    """Bridge consumer that hands each ingest batch to queue_consumer as a single queue item."""
+    async def consumer(batch: List[Reading]):
+        app.state.data_queue.put_nowait((app.state.ingest.received_at, batch))
+    return consumer
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown logic using async context manager."""
     global mongo_client, col_temperature, col_humidity, col_moisture,MONGO_URI
-    existing=None
+    db=None
     try:
         mongo_client= AsyncMongoClient(MONGO_URI)
         db = mongo_client["sensors"]
@@ -65,45 +277,119 @@ async def lifespan(app: FastAPI):
 
     except Exception as e:
         log.exception(e)
-    try:
-        existing = await db.list_collection_names()
-    except Exception as e:
-        log.exception(e)
-    app.state.predictions = cast(list[Prediction], [])
-    app.state.temperature_data = deque(maxlen=100)
-    app.state.humidity_data = deque(maxlen=100)
-    app.state.moisture_data = deque(maxlen=100)
+    if db is not None:
+        try:
+            await ensure_collections(db, SENSOR_TYPES, MONGO_GRANULARITY, RAW_RETENTION_SECONDS, log=log.info)
+            if ROLLUP_ENABLED:
+                await ensure_rollup_collections(db, SENSOR_TYPES, ROLLUP_TIERS, ROLLUP_RETENTION_SECONDS, log=log.info)
+        except Exception as e:
+            log.exception(e)
+    app.state.predictions = PredictionStore(SENSOR_TYPES, capacity=PREDICTION_CAPACITY,
+                                            retention_seconds=PREDICTION_RETENTION_SECONDS)
+    app.state.prediction_writer = MongoBatchWriter(
+        {name: db[f"predictions_{name}"] for name in SENSOR_TYPES},
+        batch_size=MONGO_BATCH_SIZE, flush_interval=MONGO_FLUSH_INTERVAL,
+        max_pending=MONGO_MAX_PENDING, on_flush=MONGO_FLUSH_SECONDS.labels("predictions").observe,
+    ) if PREDICTION_PERSIST and db is not None else None
+    app.state.sensor_store = SensorStore(SENSOR_TYPES, depth=SENSOR_HISTORY_DEPTH, idle_timeout=SENSOR_IDLE_TIMEOUT)
+    app.state.shared_log = connect_state_backend(STATE_ADDRESS, STATE_AUTHKEY.encode()) if STATE_ADDRESS else None
+    app.state.shared_predictions = connect_state_backend(
+        STATE_ADDRESS, STATE_AUTHKEY.encode(), "prediction_log") if STATE_ADDRESS else None
+    app.state.history = ColumnStore(SENSOR_TYPES, capacity=HISTORY_CAPACITY)
+    app.state.inference = InferenceEngine(
+        SENSOR_TYPES, ewma_alpha=INFERENCE_EWMA_ALPHA, holt_alpha=INFERENCE_HOLT_ALPHA, holt_beta=INFERENCE_HOLT_BETA,
+        z_threshold=ANOMALY_Z_THRESHOLD, warmup=ANOMALY_WARMUP) if INFERENCE_ENABLED else None
+    app.state.prediction_store = SensorStore(SENSOR_TYPES, depth=PREDICTION_HISTORY_DEPTH, idle_timeout=SENSOR_IDLE_TIMEOUT)
+    app.state.mqtt_client = None
+    app.state.controller = ZoneController(
+        make_loops(CONTROL_MODE, CONTROL_SETPOINTS, CONTROL_PID_GAINS),
+        lambda topic, payload: publish_command(app, topic, payload),
+        topic=CONTROL_TOPIC, max_zones=CONTROL_MAX_ZONES, on_command=CONTROL_LAG.observe) if CONTROL_ENABLED else None
+    app.state.stream_hub = StreamHub(max_pending=STREAM_MAX_PENDING)
+    app.state.snapshots = SnapshotCache()
     app.state.data_queue = asyncio.Queue()
-
-
-    for name in ["temperature", "humidity", "moisture"]:
-        if existing!=None and name not in existing:
-            await db.create_collection(name)
-            print("Created collection:", name)
+    app.state.collections = dict(zip(SENSOR_TYPES, (col_temperature, col_humidity, col_moisture)))
+    if SPOOL_DIR and db is not None:
+        app.state.mongo_writer = SpoolWriter(
+            app.state.collections, claim_spool(SPOOL_DIR, segment_bytes=SPOOL_SEGMENT_BYTES, max_bytes=SPOOL_MAX_BYTES),
+            batch_size=SPOOL_DRAIN_BATCH, flush_interval=MONGO_FLUSH_INTERVAL,
+            max_retry_interval=SPOOL_MAX_RETRY_INTERVAL, max_attempts=SPOOL_MAX_ATTEMPTS, on_flush=MONGO_FLUSH_SECONDS.labels("readings").observe)
+    else:
+        app.state.mongo_writer = MongoBatchWriter(
+            app.state.collections,
+            batch_size=MONGO_BATCH_SIZE, flush_interval=MONGO_FLUSH_INTERVAL, max_pending=MONGO_MAX_PENDING,
+            on_flush=MONGO_FLUSH_SECONDS.labels("readings").observe)
+    app.state.rollups = RollupWriter(
+        {(name, tier): db[rollup_name(name, tier)] for name in SENSOR_TYPES for tier in ROLLUP_TIERS},
+        ROLLUP_TIERS, flush_interval=ROLLUP_FLUSH_INTERVAL, max_pending=ROLLUP_MAX_PENDING,
+        on_flush=MONGO_FLUSH_SECONDS.labels("rollups").observe) if ROLLUP_ENABLED and db is not None else None
 
     loop = asyncio.get_running_loop()
+    app.state.ingest = IngestBridge(loop, max_pending=INGEST_MAX_PENDING)
+    app.state.router = TopicRouter()
+    app.state.metrics = state_metrics(app)
+    app.state.profiler = SamplingProfiler(PROFILER_INTERVAL) if PROFILER_ENABLED else None
+    app.state.ingest.subscribe(app.state.mongo_writer.put_many)
+    app.state.ingest.subscribe(enqueue_batch(app))
+    app.state.mongo_writer.start()
+    if app.state.rollups is not None:
+        app.state.ingest.subscribe(app.state.rollups.put_many)
+        app.state.rollups.start()
+    if app.state.prediction_writer is not None:
+        app.state.prediction_writer.start()
+    app.state.ingest.start()
     consumer_task = asyncio.create_task(queue_consumer(app))
+    sync_task = asyncio.create_task(state_sync(app)) if app.state.shared_log is not None else None
     mqtt_task = asyncio.create_task(run_mqtt_client(loop,app))
     
     try:
         yield
     finally:
+        # Stop the paho thread before closing the bridge so nothing is pushed after its last batch;
+        # cancelling the task alone would leave loop_forever running in the executor
+        if app.state.mqtt_client is not None:
+            app.state.mqtt_client.disconnect()
+            await asyncio.wait({mqtt_task}, timeout=MQTT_STOP_TIMEOUT)
         mqtt_task.cancel()
+        await asyncio.gather(mqtt_task, return_exceptions=True)
+        await app.state.ingest.close()
         consumer_task.cancel()
+        if sync_task is not None:
+            sync_task.cancel()
+        await app.state.mongo_writer.close()
+        if app.state.rollups is not None:
+            await app.state.rollups.close()
+        if app.state.prediction_writer is not None:
+            await app.state.prediction_writer.close()
         if mongo_client !=None:
             await mongo_client.close()
         print("App shutting down...")
 
+def encode_readings(readings) -> bytes:
+    if FAST_DECODE:
+        return dump_readings(readings)
+    return json.dumps(jsonable_encoder(list(readings))).encode()
+
+def cached_readings_response(request: Request, key, readings_func):
+    """Serve a reading list from the snapshot cache, answering 304 when the client's ETag is current."""
+    state = request.app.state
+    body, etag = state.snapshots.get(key, state.sensor_store.version(), lambda: encode_readings(readings_func()))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 app = FastAPI(lifespan=lifespan)
 app.add_middleware(CORSMiddleware,
     allow_origins=["*"],  # OR change to your frontend IP
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"])
+app.add_middleware(LatencyMiddleware, histogram=HTTP_SECONDS)
 @app.get("/")
 def HomeData1(request: Request):
     state = request.app.state
-    return list(state.temperature_data)+list(state.humidity_data)+list(state.moisture_data)
+    return cached_readings_response(request, "all", state.sensor_store.all)
 @app.get("/check")
 async def check(request: Request):
     return {
@@ -115,46 +401,262 @@ async def check(request: Request):
 @app.get("/sensors")
 def HomeData(request: Request):
     state = request.app.state
-    return list(state.temperature_data)+list(state.humidity_data)+list(state.moisture_data)
+    return cached_readings_response(request, "all", state.sensor_store.all)
 @app.get("/sensors/{sensor_type}")
 async def get_sensor_type_data(sensor_type: str,request: Request):
-    state = request.app.state
-    buffer_map = {
-        "temperature": state.temperature_data,
-        "humidity": state.humidity_data,
-        "moisture": state.moisture_data
-    }
-    buffer = buffer_map.get(sensor_type.lower())
-    if buffer is None:
+    store: SensorStore = request.app.state.sensor_store
+    sensor_type = sensor_type.lower()
+    if not store.has_type(sensor_type):
         return {"error": "Invalid sensor type"}
-    return list(buffer)
+    return cached_readings_response(request, ("type", sensor_type), lambda: store.by_type(sensor_type))
 @app.get("/sensors/{sensor_type}/{sensor_id}")
 async def get_sensor_id_data(sensor_type: str,sensor_id:str,request: Request):
+    store: SensorStore = request.app.state.sensor_store
+    sensor_type = sensor_type.lower()
+    if not store.has_type(sensor_type):
+        return {"error": "Invalid sensor type"}
+    return cached_readings_response(request, ("sensor", sensor_type, sensor_id),
+                                    lambda: store.sensor(sensor_type, sensor_id))
+@app.get("/sensors/{sensor_type}/{sensor_id}/latest")
+async def get_sensor_latest(sensor_type: str,sensor_id:str,request: Request):
+    store: SensorStore = request.app.state.sensor_store
+    sensor_type = sensor_type.lower()
+    if not store.has_type(sensor_type):
+        return {"error": "Invalid sensor type"}
+    reading = store.latest(sensor_type, sensor_id)
+    if reading is None:
+        return {"error": "Unknown sensor"}
+    return reading
+
+@app.get("/history/{sensor_type}")
+async def get_history(sensor_type: str, request: Request, start: datetime | None = None,
+                      end: datetime | None = None, sensor_id: str | None = None):
+    """Columnar range query over the in-memory history (time as epoch seconds)."""
+    history: ColumnStore = request.app.state.history
+    sensor_type = sensor_type.lower()
+    if sensor_type not in history.buffers:
+        return {"error": "Invalid sensor type"}
+    rows = history.query(sensor_type,
+                         start.timestamp() if start else None,
+                         end.timestamp() if end else None,
+                         sensor_id)
+    return Response(content=json.dumps({"sensor_type": sensor_type, **history.to_columns(rows)}),
+                    media_type="application/json")
+
+@app.get("/query/{sensor_type}")
+async def query_sensor_data(sensor_type: str, request: Request,
+                            start: datetime | None = Query(None, alias="from"),
+                            end: datetime | None = Query(None, alias="to"),
+                            bucket: float | None = Query(None, gt=0),
+                            agg: str = "mean",
+                            points: int = Query(QUERY_DEFAULT_POINTS, ge=3, le=QUERY_MAX_POINTS),
+                            sensor_id: str | None = None):
+    """Downsampled per-sensor series for a time range.
+
+    Without `bucket`, the range is split into `points` buckets so the payload size does not
+    depend on the span; an explicit `bucket` is widened so the range never has more than
+    QUERY_MAX_POINTS buckets. Ranges that the in-memory history still covers are aggregated with
+    NumPy; older ranges go through a Mongo aggregation pipeline, over the coarsest rollup
+    tier that is no wider than the bucket (or the finest tier once the raw readings expired).
+    """
     state = request.app.state
-    buffer_map = {
-        "temperature": state.temperature_data,
-        "humidity": state.humidity_data,
-        "moisture": state.moisture_data
-    }
-    buffer = buffer_map.get(sensor_type.lower())
-    if buffer is None:
+    history: ColumnStore = state.history
+    sensor_type = sensor_type.lower()
+    if sensor_type not in history.buffers:
         return {"error": "Invalid sensor type"}
-    return [r for r in buffer if r.sensor_id == sensor_id]
+    if agg not in AGGREGATIONS:
+        return {"error": f"Invalid aggregation, valid: {AGGREGATIONS}"}
+    end = end or datetime.now()
+    start = start or datetime.fromtimestamp(end.timestamp() - 3600)
+    span = end.timestamp() - start.timestamp()
+    if span <= 0:
+        return {"error": "'from' must be before 'to'"}
+    # An explicit bucket may not be finer than QUERY_MAX_POINTS buckets over the range
+    bucket = max(bucket, span / QUERY_MAX_POINTS) if bucket else span / points
+
+    oldest = history.buffers[sensor_type].oldest_time()
+    collection = state.collections.get(sensor_type)
+    series = None
+    source = "memory"
+    tier = None
+    if collection is not None and (oldest is None or start.timestamp() < oldest):
+        mongo_bucket = span / (points * LTTB_OVERSAMPLE) if agg == "lttb" else bucket
+        if state.rollups is not None:
+            raw_available = RAW_RETENTION_SECONDS is None or start.timestamp() >= time.time() - RAW_RETENTION_SECONDS
+            tier = choose_tier(mongo_bucket, ROLLUP_TIERS, raw_available)
+        try:
+            if tier is not None:
+                mongo_bucket = max(mongo_bucket, ROLLUP_TIERS[tier])
+                bucket = max(bucket, mongo_bucket) if agg != "lttb" else bucket
+                cursor = await state.rollups.collections[sensor_type, tier].aggregate(
+                    rollup_pipeline(start, end, mongo_bucket, agg, sensor_id))
+            else:
+                cursor = await collection.aggregate(mongo_pipeline(start, end, mongo_bucket, agg, sensor_id))
+            docs = await cursor.to_list()
+            series = series_from_buckets(docs, start, mongo_bucket, agg, points)
+            source = "mongo"
+        except Exception as e:
+            log.error(f"Mongo query for {sensor_type} failed, answering from memory: {e}")
+    if series is None:
+        rows = history.query(sensor_type, start.timestamp(), end.timestamp(), sensor_id)
+        series = aggregate_rows(rows, history.sensor_names, start.timestamp(), bucket, agg, points)
+    return Response(content=json.dumps({"sensor_type": sensor_type, "agg": agg, "bucket": bucket,
+                                        "source": source, "tier": tier if source == "mongo" else None,
+                                        "series": series}),
+                    media_type="application/json")
 
+@app.get("/stream")
+async def stream_sensor_data(request: Request, sensor_type: str | None = None, sensor_id: str | None = None):
+    """Server-Sent Events feed of new readings; each event carries a JSON list of readings.
+
+    Slow clients get their backlog collapsed to the latest reading per sensor instead of
+    an ever-growing queue.
+    """
+    hub: StreamHub = request.app.state.stream_hub
+    if sensor_type is not None:
+        sensor_type = sensor_type.lower()
+        if sensor_type not in SENSOR_TYPES:
+            return {"error": "Invalid sensor type"}
+    elif sensor_id is not None:
+        # Sensor ids are only unique within a type, so a bare id would silently stream every sensor
+        raise RequestValidationError([{"type": "missing", "loc": ("query", "sensor_type"),
+                                       "msg": "sensor_type is required with sensor_id", "input": None}])
+    subscriber = hub.subscribe(sensor_type, sensor_id)
+
+    async def events():
+        try:
+            while True:
+                batch = await subscriber.next_batch(timeout=STREAM_KEEPALIVE)
+                if batch:
+                    yield b"data: " + dump_readings(batch) + b"\n\n"
+                else:
+                    yield b": keepalive\n\n"
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/export")
+async def export_sensor_data(request: Request,
+                             start: datetime | None = Query(None, alias="from"),
+                             end: datetime | None = Query(None, alias="to"),
+                             sensor_type: str | None = None):
+    """Stream raw readings from Mongo as a tar of NPZ chunks, partitioned by sensor type and day.
+
+    The archive can be fed back with 'python export.py import <file>'.
+    """
+    collections = request.app.state.collections
+    if sensor_type is not None:
+        sensor_type = sensor_type.lower()
+        if sensor_type not in SENSOR_TYPES:
+            return {"error": "Invalid sensor type"}
+        collections = {sensor_type: collections[sensor_type]}
+    if any(collection is None for collection in collections.values()):
+        return {"error": "Database unavailable"}
+    name = f"export-{sensor_type or 'all'}-{datetime.now().strftime('%Y%m%dT%H%M%S')}.tar"
+    return StreamingResponse(export_tar(collections, start, end), media_type="application/x-tar",
+                             headers={"Content-Disposition": f'attachment; filename="{name}"'})
 
 @app.post("/add")
-async def add_data(item: Reading | List[Reading],request:Request):
-    state = request.app.state
+async def add_data(request:Request):
     """Add a new reading or list of readings manually (for HTTP clients)."""
-    items = item if isinstance(item, list) else [item]
-    for r in items:
-        await state.data_queue.put(r)
+    state = request.app.state
+    try:
+        items = decode_readings(await request.body(), fast=FAST_DECODE)
+    except ValidationError as e:
+        raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)])
+    except json.JSONDecodeError as e:
+        raise RequestValidationError([{"type": "json_invalid", "loc": ("body", e.pos), "msg": "JSON decode error", "input": {}}])
+    await state.data_queue.put((time.monotonic(), items))
     return {"status": "ok"}
 
 @app.get("/ml")
-def get_ml_data(request:Request):
+def get_ml_data(request: Request, sensor_type: str | None = None,
+                limit: int = Query(ML_DEFAULT_LIMIT, ge=1, le=ML_MAX_LIMIT),
+                start: datetime | None = Query(None, alias="from"),
+                end: datetime | None = Query(None, alias="to")):
+    """Most recent ml-topic predictions, optionally for one sensor type and an arrival-time window."""
     state = request.app.state
-    return state.predictions
+    store: PredictionStore = state.predictions
+    if sensor_type is not None:
+        sensor_type = sensor_type.lower()
+        if not store.has_type(sensor_type):
+            return {"error": "Invalid sensor type"}
+    if start is None and end is None:
+        predictions = store.latest(sensor_type, limit)
+    else:
+        predictions = store.window(sensor_type, start.timestamp() if start else None,
+                                   end.timestamp() if end else None, limit)
+    if FAST_DECODE:
+        return Response(content=dump_predictions(predictions), media_type="application/json")
+    return predictions
+
+@app.get("/control")
+def get_control(request: Request):
+    """Actuator state the controller last sent to each zone, plus its counters."""
+    controller: ZoneController | None = request.app.state.controller
+    if controller is None:
+        return {"error": "Control disabled"}
+    return {"mode": CONTROL_MODE, "setpoints": CONTROL_SETPOINTS, "actuators": controller.actuators, **controller.stats()}
+
+@app.get("/predictions/{sensor_type}")
+def get_type_predictions(sensor_type: str, request: Request, anomalies: bool = False):
+    """Latest in-gateway prediction of every sensor of a type (only flagged ones with `anomalies`)."""
+    store: SensorStore = request.app.state.prediction_store
+    sensor_type = sensor_type.lower()
+    if not store.has_type(sensor_type):
+        return {"error": "Invalid sensor type"}
+    predictions = [store.latest(sensor_type, sensor_id) for sensor_id in store.sensor_ids(sensor_type)]
+    if anomalies:
+        predictions = [prediction for prediction in predictions if prediction.anomaly]
+    return Response(content=dump_predictions(to_predictions(predictions)), media_type="application/json")
+
+@app.get("/predictions/{sensor_type}/{sensor_id}")
+def get_sensor_predictions(sensor_type: str, sensor_id: str, request: Request):
+    """Recent in-gateway predictions of one sensor, oldest first."""
+    store: SensorStore = request.app.state.prediction_store
+    sensor_type = sensor_type.lower()
+    if not store.has_type(sensor_type):
+        return {"error": "Invalid sensor type"}
+    return Response(content=dump_predictions(to_predictions(store.sensor(sensor_type, sensor_id))),
+                    media_type="application/json")
+
+@app.get("/stats")
+def get_stats(request: Request):
+    state = request.app.state
+    return {"mqtt": state.router.stats(), "ingest": state.ingest.stats(), "mongo_writer": state.mongo_writer.stats(), "sensors": state.sensor_store.size(),
+            "history": {"rows": len(state.history), "bytes": state.history.nbytes},
+            "stream_subscribers": len(state.stream_hub), "snapshots": state.snapshots.stats(),
+            "inference": state.inference.stats() if state.inference is not None else None,
+            "control": state.controller.stats() if state.controller is not None else None,
+            "rollups": state.rollups.stats() if state.rollups is not None else None,
+            "predictions": {"stored": len(state.predictions), "dropped": state.predictions.dropped,
+                            "writer": state.prediction_writer.stats() if state.prediction_writer is not None else None}}
+
+@app.get("/metrics")
+def get_metrics(request: Request):
+    """Prometheus text exposition of the gateway's counters, gauges and histograms."""
+    body = METRICS.render() + request.app.state.metrics.render()
+    return Response(content=body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/debug/profile")
+async def profile(request: Request, seconds: float = Query(10.0, gt=0, le=PROFILER_MAX_SECONDS)):
+    """Sample every thread's stack for `seconds` and return folded stacks (for flamegraph tools).
+
+    Only available when the gateway runs with GATEWAY_PROFILER=1.
+    """
+    profiler: SamplingProfiler | None = request.app.state.profiler
+    if profiler is None:
+        return Response(status_code=404, content="Profiler disabled; set GATEWAY_PROFILER=1")
+    if profiler.running:
+        return Response(status_code=409, content="A profile is already being taken")
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        folded = profiler.stop()
+    return Response(content=folded, media_type="text/plain")
 
 @app.get("/mqtt_buttons", response_class=HTMLResponse)
 async def mqtt_buttons_page():
@@ -205,47 +707,69 @@ async def mqtt_buttons_page():
     """
     return HTMLResponse(html_content)
     
-async def run_mqtt_client(loop,app):
-    """Connect to MQTT broker and push messages into async queue."""
-
-    async def save_to_mongo(reading: Reading):
-        if reading.sensor_type == "temperature":
-            await col_temperature.insert_one(reading.model_dump())
-        elif reading.sensor_type == "humidity":
-            await col_humidity.insert_one(reading.model_dump())
-        elif reading.sensor_type == "moisture":
-            await col_moisture.insert_one(reading.model_dump())
-            
+async def run_mqtt_client(loop,app,client_factory=mqtt.Client):
+    """Connect to MQTT broker, subscribe to the routed topics and hand decoded readings to the ingest bridge."""
+
+    ingest: IngestBridge = app.state.ingest
+    router: TopicRouter = app.state.router
+
+    def handle_sensor(parts: List[str], payload: bytes):
+        _, sensor_type, sensor_id = parts
+        if sensor_type not in SENSOR_TYPES:
+            raise ValueError(f"Invalid sensor type: {sensor_type}")
+        # A message holds one reading, or several from a batching sensor
+        readings = decode_sensor_samples(sensor_type, sensor_id, payload, fast=FAST_DECODE)
+        if len(readings) == 1:
+            ingest.push(readings[0])
+        else:
+            ingest.push_many(readings)
+
+    def handle_prediction(parts: List[str], payload: bytes):
+        predictions = [decode_prediction(payload, fast=FAST_DECODE)]
+        # A blocking IPC call, fine on this MQTT thread but not on the event loop
+        if app.state.shared_predictions is not None:
+            app.state.shared_predictions.append(dump_predictions(predictions))
+        loop.call_soon_threadsafe(record_predictions, app, predictions)
+
+    router.route("sensors/+/+", handle_sensor)
+    router.route("ml", handle_prediction)
+    # QoS 1 lets the broker queue messages for the persistent session while the gateway is offline
+    subscriptions = router.subscriptions(MQTT_SHARED_GROUP, qos=0 if MQTT_SHARED_GROUP else 1)
+
     def on_connect(client, userdata, flags, rc):
         if rc == 0:
             print("Connected to MQTT broker!")
-            client.subscribe("#")
+            client.subscribe(subscriptions)
         else:
             print(f"Failed to connect, return code {rc}")
 
     def on_message(client, userdata, msg):
-        try:
-
-            if msg.topic.startswith("sensors/"):
-                data = json.loads(msg.payload.decode())
-                reading = Reading(**data)
-                asyncio.run_coroutine_threadsafe(save_to_mongo(reading), loop)
-                asyncio.run_coroutine_threadsafe(app.state.data_queue.put(reading), loop)
-            elif msg.topic=="ml":
-                data = json.loads(msg.payload.decode())
-                pred = Prediction(**data)
-                app.state.predictions.append(pred)
-            else:
-                print(msg.payload)
-
-        except Exception as e:
-            print(f"Error parsing MQTT message: {e}")
+        router.dispatch(msg.topic, msg.payload)
 
-    client = mqtt.Client(callback_api_version=CallbackAPIVersion.VERSION1,client_id="gateway",clean_session=False)
+    if MQTT_SHARED_GROUP:
+        # Each worker needs its own session; the shared subscription keeps delivery going if one drops
+        client = client_factory(callback_api_version=CallbackAPIVersion.VERSION1,
+                                client_id=f"gateway-{socket.gethostname()}-{os.getpid()}", clean_session=True)
+    else:
+        client = client_factory(callback_api_version=CallbackAPIVersion.VERSION1,client_id="gateway",clean_session=False)
     client.on_connect = on_connect
     client.on_message = on_message
+    app.state.mqtt_client = client
     client.connect_async(host=MQTT_BROKER, port=MQTT_PORT, keepalive=60)
-    await loop.run_in_executor(None, client.loop_forever)
+    try:
+        await loop.run_in_executor(None, client.loop_forever)
+    finally:
+        client.disconnect()
 
 if __name__ == "__main__":
-    uvicorn.run("gateway:app", host="192.168.0.38",port=8000, reload=False, workers=1, log_level="info", proxy_headers=True, forwarded_allow_ips="192.168.0.38")
\ No newline at end of file
+    state_server = None
+    if GATEWAY_WORKERS > 1 and not STATE_ADDRESS:
+        STATE_AUTHKEY = os.urandom(16).hex()
+        os.environ["GATEWAY_STATE_ADDRESS"] = f"127.0.0.1:{GATEWAY_PORT + 1000}"
+        os.environ["GATEWAY_STATE_AUTHKEY"] = STATE_AUTHKEY
+        state_server = start_state_server(os.environ["GATEWAY_STATE_ADDRESS"], STATE_AUTHKEY.encode(), STATE_LOG_RETENTION)
+    try:
+        uvicorn.run("gateway:app", host=GATEWAY_HOST,port=GATEWAY_PORT, reload=False, workers=GATEWAY_WORKERS, log_level="info", proxy_headers=True, forwarded_allow_ips=GATEWAY_HOST)
+    finally:
+        if state_server is not None:
+            state_server.shutdown()
\ No newline at end of file
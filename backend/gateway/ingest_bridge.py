@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+from typing import Awaitable, Callable, List
+
+BatchConsumer = Callable[[list], Awaitable[None]]
+
+
+class IngestBridge:
+    """Moves items decoded on the paho network thread into the event loop in batches.
+
+    The network thread only appends to a list under a short lock and wakes the loop
+    once per batch with call_soon_threadsafe. On the loop side a single pump task swaps
+    the list out and hands the whole batch to every consumer. When the loop falls
+    behind and `max_pending` items are waiting, `push` blocks the network thread so
+    the broker connection itself applies backpressure.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_pending: int = 50000):
+        self.loop = loop
+        self.max_pending = max_pending
+        self._items: list = []
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._scheduled = False
+        self._first_pushed = 0.0
+        self._ready = asyncio.Event()
+        self._consumers: List[BatchConsumer] = []
+        self._closed = False
+        self._task: asyncio.Task | None = None
+
+        self.pushed = 0
+        self.batches = 0
+        self.stalls = 0
+        # time.monotonic() at which the oldest item of the batch being delivered was pushed
+        self.received_at = 0.0
+
+    def subscribe(self, consumer: BatchConsumer):
+        self._consumers.append(consumer)
+
+    def push(self, item):
+        """Called from the paho thread for every decoded message."""
+        with self._lock:
+            while len(self._items) >= self.max_pending:
+                self.stalls += 1
+                self._not_full.wait()
+            if not self._items:
+                self._first_pushed = time.monotonic()
+            self._items.append(item)
+            self.pushed += 1
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.loop.call_soon_threadsafe(self._ready.set)
+
+    def push_many(self, items: list):
+        """push() for several items from one message, taking the lock once."""
+        with self._lock:
+            while len(self._items) >= self.max_pending:
+                self.stalls += 1
+                self._not_full.wait()
+            if not self._items:
+                self._first_pushed = time.monotonic()
+            self._items.extend(items)
+            self.pushed += len(items)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.loop.call_soon_threadsafe(self._ready.set)
+
+    def _take(self) -> list:
+        with self._lock:
+            batch = self._items
+            self._items = []
+            self._scheduled = False
+            self.received_at = self._first_pushed
+            self._not_full.notify_all()
+        return batch
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            batch = self._take()
+            if batch:
+                self.batches += 1
+                for consumer in self._consumers:
+                    await consumer(batch)
+            if self._closed:
+                # Items pushed while the consumers ran still go out before the pump stops
+                if not self._items:
+                    return
+                self._ready.set()
+
+    async def close(self):
+        """Deliver whatever is still waiting and stop the pump; call once the MQTT thread has stopped."""
+        self._closed = True
+        self._ready.set()
+        if self._task is not None:
+            await self._task
+
+    def stats(self):
+        return {
+            "pending": len(self._items),
+            "pushed": self.pushed,
+            "batches": self.batches,
+            "avg_batch": round(self.pushed / self.batches, 2) if self.batches else 0.0,
+            "stalls": self.stalls,
+        }
@@ -0,0 +1,297 @@
+"""Low-overhead metrics in the Prometheus text format, plus an optional sampling profiler.
+
+Counters and histograms keep one cell per thread, so the paho thread and the event loop
+never contend on a lock or a shared cache line; a scrape sums the cells. Values that
+other components already count (router, ingest bridge, Mongo writer, stores) are read
+through callbacks at scrape time and cost nothing in between.
+"""
+import bisect
+import sys
+import threading
+import time
+from collections import Counter as Tally
+from typing import Callable, Dict, Iterable, List, Tuple
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _PerThread:
+    """One mutable list per thread; only its own thread writes it."""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._cells: Dict[int, list] = {}
+
+    def cell(self) -> list:
+        ident = threading.get_ident()
+        cell = self._cells.get(ident)
+        if cell is None:
+            cell = self._cells.setdefault(ident, [0] * self._size)
+        return cell
+
+    def total(self) -> list:
+        totals = [0] * self._size
+        for cell in list(self._cells.values()):
+            for i, value in enumerate(cell):
+                totals[i] += value
+        return totals
+
+
+class CounterChild:
+    def __init__(self):
+        self._cells = _PerThread(1)
+
+    def inc(self, amount: float = 1):
+        self._cells.cell()[0] += amount
+
+    def value(self) -> float:
+        return self._cells.total()[0]
+
+
+class HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # one count per bucket plus +Inf, then sum
+        self._cells = _PerThread(len(buckets) + 2)
+
+    def observe(self, value: float):
+        cell = self._cells.cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        totals = self._cells.total()
+        return totals[:-1], totals[-1]
+
+
+class _Timer:
+    def __init__(self, histogram: HistogramChild):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _Family:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Labels = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Labels, object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value())}")
+        return lines
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Labels = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for values, child in list(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {cumulative}")
+        return lines
+
+
+class Callback(_Family):
+    """Counter or gauge whose samples come from `fn` at scrape time.
+
+    `fn` returns a number, or a dict mapping label-value tuples to numbers.
+    """
+
+    def __init__(self, kind: str, name: str, help: str, fn: Callable, labelnames: Labels = ()):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        value = self.fn()
+        samples = value.items() if isinstance(value, dict) else [((), value)]
+        for values, sample in samples:
+            if sample is not None:
+                lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(sample)}")
+        return lines
+
+
+class Registry:
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._families: Dict[str, _Family] = {}
+
+    def _add(self, family: _Family):
+        if family.name in self._families:
+            raise ValueError(f"Duplicate metric: {family.name}")
+        self._families[family.name] = family
+        return family
+
+    def counter(self, name: str, help: str, labelnames: Labels = ()) -> Counter:
+        return self._add(Counter(self.prefix + name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Labels = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(self.prefix + name, help, labelnames, buckets))
+
+    def counter_func(self, name: str, help: str, fn: Callable, labelnames: Labels = ()) -> Callback:
+        return self._add(Callback("counter", self.prefix + name, help, fn, labelnames))
+
+    def gauge_func(self, name: str, help: str, fn: Callable, labelnames: Labels = ()) -> Callback:
+        return self._add(Callback("gauge", self.prefix + name, help, fn, labelnames))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for family in list(self._families.values()):
+            try:
+                lines.extend(family.render())
+            except Exception as e:
+                lines.append(f"# {family.name} unavailable: {e}")
+        return "\n".join(lines) + "\n"
+
+
+class LatencyMiddleware:
+    """ASGI middleware timing each request until its response headers go out.
+
+    Labels are method, route template and status, so streaming responses such as SSE
+    are measured to their first byte rather than for the life of the connection.
+    """
+
+    def __init__(self, app, histogram: Histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                self.histogram.labels(scope["method"], getattr(route, "path", "unmatched"),
+                                      str(message["status"])).observe(time.perf_counter() - start)
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+class SamplingProfiler:
+    """Samples every thread's stack with sys._current_frames() from a daemon thread.
+
+    Output is in folded-stack format (`frame;frame;frame count`), which flamegraph
+    tools read directly. Sampling only runs between start() and stop().
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Tally = Tally()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.samples.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.folded()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
@@ -0,0 +1,21 @@
+from datetime import datetime
+from pydantic import BaseModel
+
+
+class Reading(BaseModel):
+    sensor_id: str
+    sensor_type: str
+    value: float
+    time: datetime
+    # Greenhouse zone the sensor sits in; the controller runs one loop per zone
+    zone: int = 0
+
+class Prediction(BaseModel):
+    sensor_type: str
+    real: float
+    prediction: float
+    # Filled in by the gateway's inference engine; producers on the ml topic may leave them out
+    sensor_id: str | None = None
+    time: datetime | None = None
+    zscore: float | None = None
+    anomaly: bool = False
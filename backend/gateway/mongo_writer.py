@@ -0,0 +1,152 @@
+import asyncio
+import time
+import logging
+from typing import Any, Callable, Dict, Iterable, List
+
+log = logging.getLogger("uvicorn")
+
+
+class MongoBatchWriter:
+    """Write-behind stage that groups readings per sensor type and flushes them with insert_many.
+
+    A flush happens when `batch_size` readings are pending or `flush_interval` seconds
+    passed since the oldest pending one. `put` blocks once `max_pending` readings
+    (buffered + in flight) are waiting, which pushes backpressure back to the producer.
+    Readings of a failed insert_many are not retried and count as dropped; `close`
+    returns once everything accepted before it has been sent.
+    """
+
+    def __init__(self, collections: Dict[str, Any], batch_size: int = 500,
+                 flush_interval: float = 1.0, max_pending: int = 20000,
+                 on_flush: Callable[[float], None] | None = None):
+        self.collections = collections
+        # Called with each flush's duration in seconds (e.g. a metrics histogram)
+        self.on_flush = on_flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._buffers: Dict[str, List[dict]] = {name: [] for name in collections}
+        self._pending = 0
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._closed = False
+        self._task: asyncio.Task | None = None
+
+        self.flushes = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def put(self, reading):
+        """Queue a single reading, waiting while the writer is full."""
+        await self.put_many((reading,))
+
+    async def put_many(self, readings: Iterable):
+        """Queue several readings at once, waiting while the writer is full."""
+        while self._pending >= self.max_pending and not self._closed:
+            self._space.clear()
+            await self._space.wait()
+        for reading in readings:
+            buffer = self._buffers.get(reading.sensor_type)
+            if buffer is None:
+                self.dropped += 1
+                continue
+            buffer.append(reading.model_dump())
+            self._pending += 1
+        if self._pending >= self.batch_size:
+            self._wakeup.set()
+
+    def put_nowait(self, readings: Iterable) -> int:
+        """Queue what fits without waiting and count the rest as dropped; for best-effort callers."""
+        accepted = 0
+        for reading in readings:
+            buffer = self._buffers.get(reading.sensor_type)
+            if buffer is None or self._pending >= self.max_pending or self._closed:
+                self.dropped += 1
+                continue
+            buffer.append(reading.model_dump())
+            self._pending += 1
+            accepted += 1
+        if self._pending >= self.batch_size:
+            self._wakeup.set()
+        return accepted
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self._closed:
+                # Readings accepted while the last flush was in flight still go out
+                await self._flush_all()
+                return
+
+    async def _flush_all(self):
+        while any(self._buffers.values()):
+            await self.flush()
+
+    async def flush(self):
+        """Send everything buffered so far, one insert_many per sensor type."""
+        batches = {name: docs for name, docs in self._buffers.items() if docs}
+        if not batches:
+            return
+        self._buffers = {name: [] for name in self.collections}
+        count = sum(len(docs) for docs in batches.values())
+
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(self.collections[name].insert_many(docs, ordered=False) for name, docs in batches.items()),
+            return_exceptions=True)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        for name, result in zip(batches, results):
+            if isinstance(result, BaseException):
+                self.errors += 1
+                self.dropped += len(batches[name])
+                log.error(f"Mongo insert_many into {name} failed, dropping {len(batches[name])} readings: {result}")
+            else:
+                self.written += len(batches[name])
+        self.flushes += 1
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+        if self.on_flush is not None:
+            self.on_flush(elapsed_ms / 1000)
+
+        self._pending -= count
+        if self._pending < self.max_pending:
+            self._space.set()
+
+    async def close(self):
+        """Flush whatever is still buffered and stop the background task."""
+        self._closed = True
+        self._space.set()
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+        else:
+            await self._flush_all()
+
+    def stats(self):
+        return {
+            "queue_depth": self._pending,
+            "flushes": self.flushes,
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 3),
+        }
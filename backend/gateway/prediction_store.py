@@ -0,0 +1,104 @@
+import heapq
+import time
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+
+
+class PredictionRing:
+    """Fixed-capacity ring of predictions with their arrival times (epoch seconds), oldest first."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.stamps = np.zeros(capacity)
+        self.items: List = [None] * capacity
+        self.head = 0
+        self.count = 0
+
+    def append(self, stamp: float, item):
+        self.stamps[self.head] = stamp
+        self.items[self.head] = item
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def _index(self, offset: int) -> int:
+        """Slot of the offset-th oldest entry."""
+        return (self.head - self.count + offset) % self.capacity
+
+    def expire(self, before: float) -> int:
+        """Forget entries that arrived before `before`."""
+        stale = int(np.searchsorted(self._ordered_stamps(), before, side="left"))
+        for offset in range(stale):
+            self.items[self._index(offset)] = None
+        self.count -= stale
+        return stale
+
+    def _ordered_stamps(self) -> np.ndarray:
+        start = self._index(0)
+        if start + self.count <= self.capacity:
+            return self.stamps[start:start + self.count]
+        return np.concatenate([self.stamps[start:], self.stamps[:self.head]])
+
+    def entries(self, first: int, last: int) -> List[Tuple[float, object]]:
+        return [(float(self.stamps[i]), self.items[i]) for i in map(self._index, range(first, last))]
+
+    def latest(self, n: int) -> List[Tuple[float, object]]:
+        return self.entries(max(self.count - n, 0), self.count)
+
+    def window(self, start: float | None, end: float | None) -> List[Tuple[float, object]]:
+        stamps = self._ordered_stamps()
+        first = int(np.searchsorted(stamps, start, side="left")) if start is not None else 0
+        last = int(np.searchsorted(stamps, end, side="left")) if end is not None else self.count
+        return self.entries(first, last)
+
+
+class PredictionStore:
+    """Predictions kept per sensor type in bounded rings, indexed by arrival time.
+
+    Each type keeps at most `capacity` predictions and, with `retention_seconds`, none
+    older than that, so memory and the cost of /ml stay flat over the gateway's uptime.
+    """
+
+    def __init__(self, sensor_types: Iterable[str], capacity: int = 10000, retention_seconds: float | None = None):
+        self.capacity = capacity
+        self.retention_seconds = retention_seconds
+        self._rings: Dict[str, PredictionRing] = {name: PredictionRing(capacity) for name in sensor_types}
+        self.dropped = 0
+
+    def has_type(self, sensor_type: str) -> bool:
+        return sensor_type in self._rings
+
+    def extend(self, predictions: Iterable, now: float | None = None):
+        now = now if now is not None else time.time()
+        for prediction in predictions:
+            ring = self._rings.get(prediction.sensor_type)
+            if ring is None:
+                self.dropped += 1
+                continue
+            ring.append(now, prediction)
+        self.expire(now)
+
+    def expire(self, now: float | None = None) -> int:
+        if self.retention_seconds is None:
+            return 0
+        cutoff = (now if now is not None else time.time()) - self.retention_seconds
+        return sum(ring.expire(cutoff) for ring in self._rings.values())
+
+    def _merge(self, groups: List[List[Tuple[float, object]]]) -> List:
+        return [item for _, item in heapq.merge(*groups, key=lambda entry: entry[0])]
+
+    def latest(self, sensor_type: str | None = None, n: int = 100) -> List:
+        """The `n` most recent predictions (of one type or across all), oldest first."""
+        self.expire()
+        rings = [self._rings[sensor_type]] if sensor_type else self._rings.values()
+        return self._merge([ring.latest(n) for ring in rings])[-n:] if n > 0 else []
+
+    def window(self, sensor_type: str | None = None, start: float | None = None, end: float | None = None,
+               limit: int | None = None) -> List:
+        """Predictions that arrived in [start, end), oldest first; `limit` keeps the newest ones."""
+        self.expire()
+        rings = [self._rings[sensor_type]] if sensor_type else self._rings.values()
+        merged = self._merge([ring.window(start, end) for ring in rings])
+        return merged[-limit:] if limit else merged
+
+    def __len__(self):
+        return sum(ring.count for ring in self._rings.values())
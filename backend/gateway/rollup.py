@@ -0,0 +1,298 @@
+"""Incremental minute/hour/day rollups of the reading stream.
+
+Readings are folded into per-sensor buckets (count, min, max, sum, last) for every tier
+as they arrive. Every `flush_interval` seconds the changed buckets are sent to Mongo
+as one unordered bulk_write per collection of upserts. Each upsert merges the delta
+into the stored bucket, so several gateway workers (each seeing its share of the
+shared subscription) and restarts never overwrite each other's counts. Rollup
+collections are plain collections named <type>_<tier> with a unique
+(sensor_id, time) index and an optional TTL per tier.
+
+Minute and hour buckets are aligned to the epoch, day buckets to local midnight.
+History collected before rollups were enabled can be backfilled from the raw
+collections (stop the gateway first, or the overlapping range is counted twice):
+
+    python rollup.py backfill [--from 2025-01-01] [--to 2025-06-01]
+
+Raw readings never expire on their own; once the backfill has run, set
+GATEWAY_RAW_RETENTION_SECONDS to let the gateway put a TTL on the raw collections.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+import numpy as np
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+log = logging.getLogger("uvicorn")
+
+TIERS = {"minute": 60, "hour": 3600, "day": 86400}
+EPOCH = datetime.fromtimestamp(0)
+
+# count, min, max, sum, last, last_time
+Bucket = List[float]
+
+
+def rollup_name(sensor_type: str, tier: str) -> str:
+    return f"{sensor_type}_{tier}"
+
+
+def choose_tier(bucket: float, tiers: Dict[str, float], raw_available: bool = True) -> str | None:
+    """Coarsest tier no wider than `bucket`; None means the raw readings fit better.
+
+    When the raw readings for the range have already expired, the finest tier is used
+    even if it is coarser than the requested bucket.
+    """
+    fitting = [(width, name) for name, width in tiers.items() if width <= bucket]
+    if fitting:
+        return max(fitting)[1]
+    if raw_available:
+        return None
+    return min((width, name) for name, width in tiers.items())[1]
+
+
+def _merge(pending: Dict[Tuple[str, float], Bucket], key: Tuple[str, float], delta: Bucket):
+    entry = pending.get(key)
+    if entry is None:
+        pending[key] = delta
+        return
+    entry[0] += delta[0]
+    entry[1] = min(entry[1], delta[1])
+    entry[2] = max(entry[2], delta[2])
+    entry[3] += delta[3]
+    if delta[5] >= entry[5]:
+        entry[4], entry[5] = delta[4], delta[5]
+
+
+def upsert(sensor_id: str, bucket: float, delta: Bucket) -> UpdateOne:
+    """Merge one bucket delta into its stored document (created on first write)."""
+    count, low, high, total, last, last_time = delta
+    last_time = datetime.fromtimestamp(last_time)
+    return UpdateOne(
+        {"sensor_id": sensor_id, "time": datetime.fromtimestamp(bucket)},
+        [{"$set": {
+            "count": {"$add": [{"$ifNull": ["$count", 0]}, count]},
+            "sum": {"$add": [{"$ifNull": ["$sum", 0]}, total]},
+            "min": {"$min": [{"$ifNull": ["$min", low]}, low]},
+            "max": {"$max": [{"$ifNull": ["$max", high]}, high]},
+            # Fields in one $set stage see the document as it was, so both compare against the old last_time
+            "last": {"$cond": [{"$gte": [last_time, {"$ifNull": ["$last_time", EPOCH]}]}, last, "$last"]},
+            "last_time": {"$max": [{"$ifNull": ["$last_time", EPOCH]}, last_time]},
+        }}],
+        upsert=True)
+
+
+class RollupWriter:
+    """Folds readings into tiered buckets and upserts the changed ones in bulk.
+
+    `collections` maps (sensor_type, tier) to a Mongo collection. When more than
+    `max_pending` buckets are waiting (Mongo unreachable for a long time), the deltas of
+    a failed flush are dropped instead of re-queued.
+    """
+
+    def __init__(self, collections: Dict[Tuple[str, str], Any], tiers: Dict[str, float] = TIERS,
+                 flush_interval: float = 5.0, max_pending: int = 500000,
+                 on_flush: Callable[[float], None] | None = None):
+        self.collections = collections
+        self.tiers = {name: width for name, width in tiers.items()
+                      if any(tier == name for _, tier in collections)}
+        self.sensor_types = {sensor_type for sensor_type, _ in collections}
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.on_flush = on_flush
+        self._pending: Dict[Tuple[str, str], Dict[Tuple[str, float], Bucket]] = {key: {} for key in collections}
+        self._closed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+        self.readings = 0
+        self.flushes = 0
+        self.upserts = 0
+        self.errors = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def put_many(self, readings: Iterable):
+        """Ingest-bridge consumer; folding is synchronous, writes happen on the flush task."""
+        self.add(readings)
+
+    def add(self, readings: Iterable):
+        columns: Dict[str, tuple] = {}
+        for reading in readings:
+            if reading.sensor_type not in self.sensor_types:
+                continue
+            ids, times, values = columns.setdefault(reading.sensor_type, ([], [], []))
+            ids.append(reading.sensor_id)
+            times.append(reading.time.timestamp())
+            values.append(reading.value)
+        for sensor_type, (ids, times, values) in columns.items():
+            self.readings += len(ids)
+            self._fold(sensor_type, ids, np.array(times), np.array(values, dtype="f8"))
+
+    def _fold(self, sensor_type: str, ids: List[str], times: np.ndarray, values: np.ndarray):
+        names, keys = np.unique(np.array(ids), return_inverse=True)
+        names = names.tolist()
+        # Shift day buckets so they start at local midnight
+        local_offset = time.localtime(float(times[0])).tm_gmtoff
+        for tier, width in self.tiers.items():
+            pending = self._pending.get((sensor_type, tier))
+            if pending is None:
+                continue
+            shift = local_offset if width >= 86400 else 0
+            buckets = np.floor((times + shift) / width) * width - shift
+            order = np.lexsort((times, buckets, keys))
+            k, b, t, v = keys[order], buckets[order], times[order], values[order]
+            change = np.empty(len(k), dtype=bool)
+            change[0] = True
+            change[1:] = (k[1:] != k[:-1]) | (b[1:] != b[:-1])
+            starts = np.flatnonzero(change)
+            ends = np.append(starts[1:], len(k))
+            rows = zip(k[starts].tolist(), b[starts].tolist(), (ends - starts).tolist(),
+                       np.minimum.reduceat(v, starts).tolist(), np.maximum.reduceat(v, starts).tolist(),
+                       np.add.reduceat(v, starts).tolist(), v[ends - 1].tolist(), t[ends - 1].tolist())
+            for key, bucket, count, low, high, total, last, last_time in rows:
+                _merge(pending, (names[key], bucket), [count, low, high, total, last, last_time])
+
+    async def _run(self):
+        while not self._closed.is_set():
+            try:
+                await asyncio.wait_for(self._closed.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        """Upsert every bucket changed since the last flush, one bulk_write per collection."""
+        batches = {key: pending for key, pending in self._pending.items() if pending}
+        if not batches:
+            return
+        for key in batches:
+            self._pending[key] = {}
+
+        start = time.perf_counter()
+        items = {key: list(pending.items()) for key, pending in batches.items()}
+        results = await asyncio.gather(
+            *(self.collections[key].bulk_write([upsert(sensor_id, bucket, delta) for (sensor_id, bucket), delta in entries],
+                                               ordered=False)
+              for key, entries in items.items()),
+            return_exceptions=True)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        for key, result in zip(items, results):
+            entries = items[key]
+            if not isinstance(result, BaseException):
+                self.upserts += len(entries)
+                continue
+            self.errors += 1
+            log.error(f"Rollup bulk_write into {rollup_name(*key)} failed: {result}")
+            if isinstance(result, BulkWriteError):
+                # Unordered: everything but the reported operations was applied
+                failed = {error["index"] for error in result.details.get("writeErrors", [])}
+                self.upserts += len(entries) - len(failed)
+                entries = [entry for i, entry in enumerate(entries) if i in failed]
+            if len(self) + len(entries) > self.max_pending:
+                self.dropped += len(entries)
+                continue
+            for bucket_key, delta in entries:
+                _merge(self._pending[key], bucket_key, delta)
+        self.flushes += 1
+        self.last_flush_ms = elapsed_ms
+        if self.on_flush is not None:
+            self.on_flush(elapsed_ms / 1000)
+
+    async def close(self):
+        """Flush what is still pending and stop the background task."""
+        self._closed.set()
+        if self._task is not None:
+            await self._task
+        await self.flush()
+
+    def __len__(self):
+        return sum(len(pending) for pending in self._pending.values())
+
+    def stats(self):
+        return {"pending": len(self), "readings": self.readings, "flushes": self.flushes, "upserts": self.upserts,
+                "errors": self.errors, "dropped": self.dropped, "last_flush_ms": round(self.last_flush_ms, 3)}
+
+
+async def ensure_rollup_collections(db, sensor_types: Iterable[str], tiers: Iterable[str],
+                                    retention_seconds: Dict[str, int | None] | None = None, log=print):
+    """Unique (sensor_id, time) index on every rollup collection, plus a TTL index where configured."""
+    retention_seconds = retention_seconds or {}
+    for sensor_type in sensor_types:
+        for tier in tiers:
+            collection = db[rollup_name(sensor_type, tier)]
+            indexes = await collection.index_information()
+            if "sensor_time" not in indexes:
+                await collection.create_index([("sensor_id", 1), ("time", 1)], name="sensor_time", unique=True)
+            ttl = retention_seconds.get(tier)
+            if ttl and "ttl" not in indexes:
+                await collection.create_index([("time", 1)], name="ttl", expireAfterSeconds=ttl)
+                log(f"{rollup_name(sensor_type, tier)}: rollups expire after {ttl}s")
+            elif ttl and indexes["ttl"].get("expireAfterSeconds") != ttl:
+                await db.command("collMod", rollup_name(sensor_type, tier),
+                                 index={"name": "ttl", "expireAfterSeconds": ttl})
+
+
+async def backfill(db, sensor_types: Iterable[str], tiers: Dict[str, float], start: datetime | None = None,
+                   end: datetime | None = None, batch_size: int = 50000, log=print) -> int:
+    """Fold the raw collections' readings for [start, end) into the rollup collections."""
+    from models import Reading
+
+    total = 0
+    for sensor_type in sensor_types:
+        writer = RollupWriter({(sensor_type, tier): db[rollup_name(sensor_type, tier)] for tier in tiers}, tiers)
+        match: dict = {}
+        if start is not None:
+            match.setdefault("time", {})["$gte"] = start
+        if end is not None:
+            match.setdefault("time", {})["$lt"] = end
+        cursor = db[sensor_type].find(match, projection={"_id": 0, "sensor_id": 1, "value": 1, "time": 1},
+                                      batch_size=batch_size)
+        batch = []
+        async for doc in cursor:
+            batch.append(Reading.model_construct(sensor_type=sensor_type, **doc))
+            if len(batch) >= batch_size:
+                writer.add(batch)
+                await writer.flush()
+                batch = []
+                log(f"{sensor_type}: {writer.readings} readings folded")
+        if batch:
+            writer.add(batch)
+        await writer.flush()
+        log(f"{sensor_type}: {writer.readings} readings -> {writer.upserts} bucket upserts, {writer.errors} errors")
+        total += writer.readings
+    return total
+
+
+async def _main(args):
+    from pymongo import AsyncMongoClient
+    import gateway
+
+    client = AsyncMongoClient(args.uri or gateway.MONGO_URI)
+    db = client[args.db]
+    try:
+        await ensure_rollup_collections(db, gateway.SENSOR_TYPES, gateway.ROLLUP_TIERS,
+                                        gateway.ROLLUP_RETENTION_SECONDS)
+        start = datetime.fromisoformat(args.start) if args.start else None
+        end = datetime.fromisoformat(args.end) if args.end else None
+        await backfill(db, gateway.SENSOR_TYPES, gateway.ROLLUP_TIERS, start, end, args.batch_size)
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("backfill",))
+    parser.add_argument("--uri", help="defaults to gateway.MONGO_URI")
+    parser.add_argument("--db", default="sensors")
+    parser.add_argument("--from", dest="start", help="ISO start time (inclusive)")
+    parser.add_argument("--to", dest="end", help="ISO end time (exclusive)")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,86 @@
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Tuple
+
+
+class SensorStore:
+    """Recent readings indexed by (sensor_type, sensor_id), one fixed-size ring per sensor.
+
+    Each sensor keeps its own `depth` readings, so a busy sensor can no longer push
+    other sensors' history out. Sensors that have not reported for `idle_timeout`
+    seconds are dropped on the next sweep.
+    """
+
+    def __init__(self, sensor_types: Iterable[str], depth: int = 100,
+                 idle_timeout: float = 600.0, sweep_interval: float = 60.0):
+        self.depth = depth
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._rings: Dict[str, Dict[str, Deque]] = {name: {} for name in sensor_types}
+        self._last_seen: Dict[Tuple[str, str], float] = {}
+        self._next_sweep = time.monotonic() + sweep_interval
+        # Bumped whenever the stored data changes; read endpoints cache per generation
+        self.generation = 0
+
+    def has_type(self, sensor_type: str) -> bool:
+        return sensor_type in self._rings
+
+    def append(self, reading, now: float | None = None) -> bool:
+        rings = self._rings.get(reading.sensor_type)
+        if rings is None:
+            return False
+        ring = rings.get(reading.sensor_id)
+        if ring is None:
+            ring = rings[reading.sensor_id] = deque(maxlen=self.depth)
+        ring.append(reading)
+        self._last_seen[(reading.sensor_type, reading.sensor_id)] = now if now is not None else time.monotonic()
+        return True
+
+    def extend(self, readings: Iterable):
+        now = time.monotonic()
+        for reading in readings:
+            self.append(reading, now)
+        if now >= self._next_sweep:
+            self.evict_idle(now)
+        self.generation += 1
+
+    def version(self) -> int:
+        return self.generation
+
+    def evict_idle(self, now: float | None = None) -> int:
+        """Drop sensors that have been silent for longer than idle_timeout."""
+        now = now if now is not None else time.monotonic()
+        self._next_sweep = now + self.sweep_interval
+        stale = [key for key, seen in self._last_seen.items() if now - seen > self.idle_timeout]
+        for sensor_type, sensor_id in stale:
+            del self._last_seen[(sensor_type, sensor_id)]
+            del self._rings[sensor_type][sensor_id]
+        return len(stale)
+
+    def latest(self, sensor_type: str, sensor_id: str):
+        ring = self._rings.get(sensor_type, {}).get(sensor_id)
+        return ring[-1] if ring else None
+
+    def sensor(self, sensor_type: str, sensor_id: str) -> List:
+        return list(self._rings.get(sensor_type, {}).get(sensor_id, ()))
+
+    def sensor_ids(self, sensor_type: str) -> List[str]:
+        return list(self._rings.get(sensor_type, {}))
+
+    def by_type(self, sensor_type: str) -> List:
+        readings: List = []
+        for ring in self._rings.get(sensor_type, {}).values():
+            readings.extend(ring)
+        return readings
+
+    def all(self) -> List:
+        readings: List = []
+        for sensor_type in self._rings:
+            readings.extend(self.by_type(sensor_type))
+        return readings
+
+    def size(self) -> int:
+        return len(self._last_seen)
+
+    def __len__(self):
+        return self.size()
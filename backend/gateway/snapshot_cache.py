@@ -0,0 +1,42 @@
+import os
+from typing import Callable, Dict, Hashable, Tuple
+
+
+class SnapshotCache:
+    """Pre-serialized JSON bodies for the read endpoints, rebuilt at most once per data generation.
+
+    The generation comes from the sensor store, which bumps it for every batch
+    queue_consumer adds; until it changes every request for the same key gets the same
+    bytes and ETag, however many dashboards are polling.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        # Restarting the gateway resets the generation, so ETags also carry a per-process token
+        self._boot = os.urandom(4).hex()
+        self._entries: Dict[Hashable, Tuple[int, bytes, str]] = {}
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, key: Hashable, generation: int, build: Callable[[], bytes]) -> Tuple[bytes, str]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == generation:
+            self.hits += 1
+            return entry[1], entry[2]
+        if entry is None and len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        body = build()
+        etag = f'"{self._boot}-{generation}"'
+        self._entries[key] = (generation, body, etag)
+        self.builds += 1
+        return body, etag
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "builds": self.builds}
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
@@ -0,0 +1,466 @@
+"""Durable local spool between ingest and Mongo.
+
+Ingest appends each batch of readings to an append-only log on local disk and returns
+immediately; a drainer task replays the log to Mongo in batches and advances a
+checkpoint only after the inserts succeeded. A slow or unreachable Mongo therefore
+never stalls ingest and never grows the heap: the backlog lives on disk (bounded by
+`max_bytes`) and survives restarts.
+
+The log is a series of preallocated, memory-mapped segment files (<seq>.seg). Each
+record is a 12-byte header (payload length, reading count, crc32 of the payload)
+followed by the payload; a zero length marks the end of the written part. On open the
+tail of the newest segment is scanned and everything after the last record with a
+valid crc (a write torn by a crash) is discarded. The checkpoint file holds the
+(segment, offset) of the first record not yet in Mongo, so delivery is at-least-once:
+a crash between an insert and its checkpoint replays that batch.
+
+Readings Mongo rejects (a BulkWriteError or an oversized document), and batches still
+failing after `max_attempts` tries, are moved to dead_letter.jsonl in the spool
+directory so the drainer can move on. Each line holds the collection, the error and
+the readings, in the list format POST /add accepts.
+
+    python spool.py status /var/lib/gateway/spool
+"""
+import argparse
+import asyncio
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+from pymongo.errors import BulkWriteError, DocumentTooLarge, InvalidDocument
+from decoding import READINGS, dump_readings
+
+log = logging.getLogger("uvicorn")
+
+HEADER = struct.Struct("<III")  # length, readings, crc32
+CHECKPOINT = "checkpoint"
+LOCK = "lock"
+DEAD_LETTER = "dead_letter.jsonl"
+# Mongo will reject these again however often they are retried
+NON_RETRYABLE = (BulkWriteError, DocumentTooLarge, InvalidDocument)
+DUPLICATE_KEY = 11000
+
+Position = Tuple[int, int]  # (segment, offset)
+
+
+def segment_name(seq: int) -> str:
+    return f"{seq:010d}.seg"
+
+
+class _Segment:
+    def __init__(self, path: str, size: int | None = None):
+        self.path = path
+        self._file = open(path, "r+b" if size is None else "w+b")
+        if size is not None:
+            # Reserve the blocks up front: writing a sparse file's mmap on a full disk raises SIGBUS
+            try:
+                os.posix_fallocate(self._file.fileno(), 0, size)
+            except OSError:
+                self._file.close()
+                os.remove(path)
+                raise
+        self.map = mmap.mmap(self._file.fileno(), 0)
+
+    def __len__(self):
+        return len(self.map)
+
+    def record_at(self, offset: int) -> Tuple[int, int, int] | None:
+        """(payload length, readings, end offset) of a valid record at `offset`, else None."""
+        if offset + HEADER.size > len(self.map):
+            return None
+        length, count, crc = HEADER.unpack_from(self.map, offset)
+        end = offset + HEADER.size + length
+        if length == 0 or end > len(self.map):
+            return None
+        if zlib.crc32(self.map[offset + HEADER.size:end]) != crc:
+            return None
+        return length, count, end
+
+    def close(self):
+        self.map.close()
+        self._file.close()
+
+
+class Spool:
+    """Segmented append-only log of reading batches with a checkpointed read position.
+
+    Only one process may own a spool directory at a time (an flock on `lock`).
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 << 20, max_bytes: int = 2 << 30):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = open(os.path.join(directory, LOCK), "a")
+        try:
+            fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock.close()
+            raise
+        self._segments: Dict[int, _Segment] = {}
+
+        self.appended = 0
+        self.dropped = 0
+        self.corrupt = 0
+        self.recovered = 0
+        self.dead_lettered = 0
+        # Readings between the checkpoint and the write position
+        self.backlog = 0
+        try:
+            self._recover()
+        except Exception:
+            for segment in self._segments.values():
+                segment.close()
+            self._lock.close()
+            raise
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, segment_name(seq))
+
+    def _recover(self):
+        seqs = sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".seg"))
+        self.checkpoint = self._load_checkpoint() or ((seqs[0], 0) if seqs else (0, 0))
+        for seq in seqs:
+            if seq < self.checkpoint[0]:
+                os.remove(self._path(seq))
+        seqs = [seq for seq in seqs if seq >= self.checkpoint[0]]
+        if seqs and seqs[0] != self.checkpoint[0]:
+            self.checkpoint = (seqs[0], 0)
+        if not seqs:
+            self.checkpoint = (self.checkpoint[0], 0)
+            self._segments[self.checkpoint[0]] = _Segment(self._path(self.checkpoint[0]), self.segment_bytes)
+            self.write_position = self.checkpoint
+            return
+        for seq in seqs:
+            self._segments[seq] = _Segment(self._path(seq))
+        # Count the backlog and find where the last complete record of the newest segment ends
+        offset = 0
+        for seq in seqs:
+            segment = self._segments[seq]
+            offset = self.checkpoint[1] if seq == self.checkpoint[0] else 0
+            while (record := segment.record_at(offset)) is not None:
+                self.backlog += record[1]
+                offset = record[2]
+        last = self._segments[seqs[-1]]
+        if offset + HEADER.size <= len(last) and any(last.map[offset:offset + HEADER.size]):
+            # Zero a torn tail so later appends are never followed by a stale, valid-looking record
+            last.map[offset:] = bytes(len(last) - offset)
+        self.write_position = (seqs[-1], offset)
+        self.recovered = self.backlog
+        if self.recovered:
+            log.info(f"Spool {self.directory}: {self.recovered} readings waiting from a previous run")
+
+    def _load_checkpoint(self) -> Position | None:
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT)) as f:
+                data = json.load(f)
+            return data["segment"], data["offset"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def append(self, payload: bytes, count: int) -> bool:
+        """Write one record; returns False (and counts it dropped) when the spool or the disk is full."""
+        seq, offset = self.write_position
+        segment = self._segments[seq]
+        size = HEADER.size + len(payload)
+        if offset + size > len(segment):
+            if self.nbytes + max(size, self.segment_bytes) > self.max_bytes:
+                self.dropped += count
+                return False
+            seq, offset = seq + 1, 0
+            try:
+                segment = self._segments[seq] = _Segment(self._path(seq), max(size, self.segment_bytes))
+            except OSError as e:
+                self.dropped += count
+                log.error(f"Spool {self.directory}: cannot allocate segment {seq}, dropping {count} readings: {e}")
+                return False
+        HEADER.pack_into(segment.map, offset, len(payload), count, zlib.crc32(payload))
+        segment.map[offset + HEADER.size:offset + size] = payload
+        self.write_position = (seq, offset + size)
+        self.appended += count
+        self.backlog += count
+        return True
+
+    def read(self, max_readings: int, position: Position | None = None) -> Tuple[List[bytes], int, Position]:
+        """Records from `position` (default: the checkpoint) up to about `max_readings` readings.
+
+        Returns (payloads, readings, position after the last returned record). A damaged
+        record in an older segment skips the rest of that segment.
+        """
+        seq, offset = position or self.checkpoint
+        payloads: List[bytes] = []
+        readings = 0
+        while readings < max_readings and (seq, offset) < self.write_position:
+            segment = self._segments[seq]
+            record = segment.record_at(offset)
+            if record is None:
+                if seq == self.write_position[0]:
+                    break
+                if offset + HEADER.size <= len(segment) and HEADER.unpack_from(segment.map, offset)[0]:
+                    self.corrupt += 1
+                    log.error(f"Spool {segment.path}: damaged record at {offset}, skipping the rest of the segment")
+                seq, offset = seq + 1, 0
+                continue
+            length, count, end = record
+            payloads.append(segment.map[offset + HEADER.size:end])
+            readings += count
+            offset = end
+        return payloads, readings, (seq, offset)
+
+    def commit(self, position: Position, readings: int):
+        """Move the checkpoint to `position` and delete segments that are fully drained."""
+        path = os.path.join(self.directory, CHECKPOINT)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"segment": position[0], "offset": position[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self.checkpoint = position
+        self.backlog -= readings
+        for seq in [seq for seq in self._segments if seq < position[0]]:
+            self._segments.pop(seq).close()
+            os.remove(self._path(seq))
+
+    def dead_letter(self, collection: str, readings: List, error: BaseException):
+        """Append readings Mongo did not take to the dead-letter file (fsynced)."""
+        line = json.dumps({"time": datetime.now().isoformat(), "collection": collection,
+                           "error": f"{type(error).__name__}: {error}",
+                           "readings": json.loads(dump_readings(readings))})
+        with open(os.path.join(self.directory, DEAD_LETTER), "a") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.dead_lettered += len(readings)
+
+    def sync(self):
+        """msync the segment being written; appends already survive a process crash via the page cache."""
+        self._segments[self.write_position[0]].map.flush()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(segment) for segment in self._segments.values())
+
+    def close(self):
+        self.sync()
+        for segment in self._segments.values():
+            segment.close()
+        self._segments = {}
+        self._lock.close()
+
+    def stats(self) -> dict:
+        return {"directory": self.directory, "backlog": self.backlog, "segments": len(self._segments),
+                "bytes": self.nbytes, "appended": self.appended, "dropped": self.dropped,
+                "corrupt": self.corrupt, "recovered": self.recovered, "dead_lettered": self.dead_lettered}
+
+
+def claim_spool(root: str, slots: int = 64, **options) -> Spool:
+    """Open the first spool under root/<n> that no other process holds.
+
+    Several gateway workers on one host each get their own directory, and a restarted
+    worker picks up whichever backlog is free.
+    """
+    for slot in range(slots):
+        try:
+            return Spool(os.path.join(root, str(slot)), **options)
+        except OSError:
+            continue
+    raise RuntimeError(f"All {slots} spool directories under {root} are in use")
+
+
+class SpoolWriter:
+    """Write-behind stage like MongoBatchWriter, with the spool instead of memory as the buffer.
+
+    `put_many` appends to the spool and never waits for Mongo. The drainer inserts up to
+    `batch_size` readings per round, one insert_many per sensor type, and retries failed
+    types with exponential backoff (up to `max_retry_interval`), at most `max_attempts`
+    times, before dead-lettering them. Documents Mongo rejected are dead-lettered at once.
+    """
+
+    def __init__(self, collections: Dict[str, Any], spool: Spool, batch_size: int = 5000,
+                 flush_interval: float = 1.0, max_retry_interval: float = 30.0, max_attempts: int = 20,
+                 on_flush: Callable[[float], None] | None = None):
+        self.collections = collections
+        self.spool = spool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retry_interval = max_retry_interval
+        self.max_attempts = max_attempts
+        self.on_flush = on_flush
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._closed = False
+        self._task: asyncio.Task | None = None
+
+        self.flushes = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def put(self, reading):
+        await self.put_many((reading,))
+
+    async def put_many(self, readings: Iterable):
+        self.put_nowait(readings)
+
+    def put_nowait(self, readings: Iterable) -> int:
+        """Append the readings to the spool; returns how many were accepted."""
+        readings = list(readings)
+        batch = [reading for reading in readings if reading.sensor_type in self.collections]
+        self.dropped += len(readings) - len(batch)
+        if not batch or self._closed:
+            self.dropped += len(batch)
+            return 0
+        if not self.spool.append(dump_readings(batch), len(batch)):
+            return 0
+        if self.spool.backlog >= self.batch_size:
+            self._wakeup.set()
+        return len(batch)
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self.spool.sync()
+            await self.drain()
+
+    async def drain(self):
+        """Replay the spool to Mongo until it is empty; once closing, at most one more batch."""
+        while True:
+            payloads, count, position = self.spool.read(self.batch_size)
+            if not payloads:
+                if position != self.spool.checkpoint:
+                    self.spool.commit(position, 0)
+                return
+            batches: Dict[str, List] = {name: [] for name in self.collections}
+            for payload in payloads:
+                for reading in READINGS.validate_json(payload):
+                    batches[reading.sensor_type].append(reading)
+            batches = {name: readings for name, readings in batches.items() if readings}
+            if not await self._insert(batches):
+                return
+            self.spool.commit(position, count)
+            if self._closed:
+                return
+
+    async def _insert(self, batches: Dict[str, List]) -> bool:
+        """insert_many per type, retrying the failed ones; False if the writer closed first."""
+        retry_interval = self.flush_interval
+        docs = {name: [reading.model_dump() for reading in readings] for name, readings in batches.items()}
+        attempts = 0
+        while batches:
+            start = time.perf_counter()
+            results = await asyncio.gather(
+                *(self.collections[name].insert_many(docs[name], ordered=False) for name in batches),
+                return_exceptions=True)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            attempts += 1
+            failed = {}
+            for (name, readings), result in zip(batches.items(), results):
+                if not isinstance(result, BaseException):
+                    self.written += len(readings)
+                    continue
+                self.errors += 1
+                if isinstance(result, BulkWriteError):
+                    # Unordered: everything but the reported documents was inserted, and a duplicate
+                    # key means an earlier attempt already stored that document
+                    rejected = {error["index"] for error in result.details.get("writeErrors", [])
+                                if error.get("code") != DUPLICATE_KEY}
+                    self.written += len(readings) - len(rejected)
+                    self._dead_letter(name, [readings[i] for i in sorted(rejected)], result)
+                elif isinstance(result, NON_RETRYABLE) or attempts >= self.max_attempts:
+                    self._dead_letter(name, readings, result)
+                else:
+                    failed[name] = readings
+                    log.error(f"Mongo insert_many into {name} failed (attempt {attempts}/{self.max_attempts}), "
+                              f"keeping {len(readings)} readings spooled: {result}")
+            self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+            if self.on_flush is not None:
+                self.on_flush(elapsed_ms / 1000)
+            batches = failed
+            if batches:
+                if self._closed:
+                    return False
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), retry_interval)
+                except asyncio.TimeoutError:
+                    pass
+                retry_interval = min(retry_interval * 2, self.max_retry_interval)
+        return True
+
+    def _dead_letter(self, name: str, readings: List, error: BaseException):
+        if not readings:
+            return
+        log.error(f"Mongo insert_many into {name} failed, moving {len(readings)} readings to "
+                  f"{os.path.join(self.spool.directory, DEAD_LETTER)}: {error}")
+        try:
+            self.spool.dead_letter(name, readings, error)
+        except OSError as e:
+            self.dropped += len(readings)
+            log.error(f"Could not write the dead-letter file, dropping {len(readings)} readings: {e}")
+
+    async def close(self):
+        """Finish the batch in flight and leave the rest on disk for the next start."""
+        self._closed = True
+        self._stopping.set()
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+        else:
+            await self.drain()
+        self.spool.close()
+
+    def stats(self):
+        return {
+            "queue_depth": self.spool.backlog,
+            "flushes": self.flushes,
+            "written": self.written,
+            "dropped": self.dropped + self.spool.dropped,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "spool": self.spool.stats(),
+        }
+
+
+def _status(args):
+    for slot in sorted(os.listdir(args.root)):
+        directory = os.path.join(args.root, slot)
+        if not os.path.isdir(directory):
+            continue
+        try:
+            spool = Spool(directory)
+        except OSError:
+            print(f"{directory}: in use by a running gateway")
+            continue
+        try:
+            print(f"{directory}: {spool.stats()}, checkpoint {spool.checkpoint}, write position {spool.write_position}")
+        finally:
+            spool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("status",))
+    parser.add_argument("root", help="GATEWAY_SPOOL_DIR of the gateway")
+    _status(parser.parse_args())
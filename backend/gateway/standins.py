@@ -0,0 +1,281 @@
+"""Local stand-ins for the MQTT broker and MongoDB, for benchmarks that must run offline.
+
+StandInBroker speaks the subset of MQTT 3.1.1 the gateway and sensors use: CONNECT,
+PUBLISH at QoS 0/1, SUBSCRIBE with + and # wildcards and $share/<group>/ shared
+subscriptions, UNSUBSCRIBE, PINGREQ and DISCONNECT. Messages are delivered at QoS 0 and
+retained messages, wills and sessions are not supported.
+
+FakeMongoClient replaces AsyncMongoClient: inserts are counted (optionally after a
+simulated round trip), finds return no documents and aggregations fail with
+OperationFailure as a server would, so /query answers from memory.
+
+    python standins.py broker --port 1883
+"""
+import argparse
+import asyncio
+import itertools
+import struct
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+from pymongo.errors import OperationFailure
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+WRITE_HIGH_WATER = 1 << 20
+
+
+def encode_length(length: int) -> bytes:
+    out = bytearray()
+    while True:
+        digit, length = length % 128, length // 128
+        out.append(digit | (0x80 if length else 0))
+        if not length:
+            return bytes(out)
+
+
+def encode_publish(topic: str, payload: bytes) -> bytes:
+    topic_bytes = topic.encode()
+    body = struct.pack("!H", len(topic_bytes)) + topic_bytes + payload
+    return bytes((PUBLISH << 4,)) + encode_length(len(body)) + body
+
+
+def topic_matches(topic_filter: List[str], topic: List[str]) -> bool:
+    for i, level in enumerate(topic_filter):
+        if level == "#":
+            return True
+        if i >= len(topic) or (level != "+" and level != topic[i]):
+            return False
+    return len(topic) == len(topic_filter)
+
+
+class _Session:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.client_id = ""
+
+    def send(self, data: bytes):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+
+class StandInBroker:
+    def __init__(self):
+        # filter -> plain subscribers; (group, filter) -> members served round-robin
+        self._plain: Dict[str, Set[_Session]] = defaultdict(set)
+        self._shared: Dict[Tuple[str, str], List[_Session]] = defaultdict(list)
+        self._turn = itertools.count()
+        self._routes: Dict[str, tuple] = {}
+        self._server: asyncio.AbstractServer | None = None
+        self.received = 0
+        self.delivered = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 1883):
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _subscribe(self, session: _Session, topic_filter: str):
+        if topic_filter.startswith("$share/"):
+            _, group, real_filter = topic_filter.split("/", 2)
+            members = self._shared[(group, real_filter)]
+            if session not in members:
+                members.append(session)
+        else:
+            self._plain[topic_filter].add(session)
+        self._routes.clear()
+
+    def _unsubscribe(self, session: _Session, topic_filter: str | None = None):
+        for key, subscribers in list(self._plain.items()):
+            if topic_filter in (None, key):
+                subscribers.discard(session)
+        for (group, key), members in list(self._shared.items()):
+            if topic_filter in (None, key, f"$share/{group}/{key}") and session in members:
+                members.remove(session)
+        self._routes.clear()
+
+    def _route(self, topic: str) -> tuple:
+        """(plain subscribers, shared groups) for a topic, cached until subscriptions change."""
+        route = self._routes.get(topic)
+        if route is None:
+            levels = topic.split("/")
+            plain = {session for key, sessions in self._plain.items()
+                     if topic_matches(key.split("/"), levels) for session in sessions}
+            groups = [members for (_, key), members in self._shared.items()
+                      if members and topic_matches(key.split("/"), levels)]
+            route = self._routes[topic] = (tuple(plain), groups)
+        return route
+
+    def publish(self, topic: str, payload: bytes):
+        self.received += 1
+        plain, groups = self._route(topic)
+        if not plain and not groups:
+            return
+        packet = encode_publish(topic, payload)
+        for session in plain:
+            session.send(packet)
+        for members in groups:
+            members[next(self._turn) % len(members)].send(packet)
+        self.delivered += len(plain) + len(groups)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = _Session(writer)
+        try:
+            while True:
+                first = await reader.readexactly(1)
+                length, multiplier = 0, 1
+                while True:
+                    digit = (await reader.readexactly(1))[0]
+                    length += (digit & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not digit & 0x80:
+                        break
+                body = await reader.readexactly(length) if length else b""
+                kind, flags = first[0] >> 4, first[0] & 0x0F
+
+                if kind == PUBLISH:
+                    topic_length = struct.unpack_from("!H", body)[0]
+                    topic = body[2:2 + topic_length].decode()
+                    offset = 2 + topic_length
+                    if (flags >> 1) & 3:
+                        session.send(bytes((PUBACK << 4, 2)) + body[offset:offset + 2])
+                        offset += 2
+                    self.publish(topic, body[offset:])
+                elif kind == CONNECT:
+                    session.send(bytes((CONNACK << 4, 2, 0, 0)))
+                elif kind == SUBSCRIBE:
+                    packet_id, position, granted = body[:2], 2, bytearray()
+                    while position < len(body):
+                        topic_length = struct.unpack_from("!H", body, position)[0]
+                        self._subscribe(session, body[position + 2:position + 2 + topic_length].decode())
+                        position += 3 + topic_length
+                        granted.append(0)
+                    session.send(bytes((SUBACK << 4,)) + encode_length(2 + len(granted)) + packet_id + granted)
+                elif kind == UNSUBSCRIBE:
+                    position = 2
+                    while position < len(body):
+                        topic_length = struct.unpack_from("!H", body, position)[0]
+                        self._unsubscribe(session, body[position + 2:position + 2 + topic_length].decode())
+                        position += 2 + topic_length
+                    session.send(bytes((UNSUBACK << 4, 2)) + body[:2])
+                elif kind == PINGREQ:
+                    session.send(bytes((PINGRESP << 4, 0)))
+                elif kind == DISCONNECT:
+                    break
+
+                if writer.transport.get_write_buffer_size() > WRITE_HIGH_WATER:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._unsubscribe(session)
+            writer.close()
+
+    def stats(self) -> dict:
+        return {"received": self.received, "delivered": self.delivered}
+
+
+class _EmptyCursor:
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise StopAsyncIteration
+
+    async def to_list(self, length=None):
+        return []
+
+
+class FakeCollection:
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.inserted = 0
+        self.written = 0
+
+    async def insert_many(self, docs, ordered=True):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.inserted += len(docs)
+
+    async def bulk_write(self, requests, ordered=True):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.written += len(requests)
+
+    async def index_information(self):
+        return {}
+
+    async def create_index(self, keys, name=None, **kwargs):
+        return name
+
+    def find(self, *args, **kwargs):
+        return _EmptyCursor()
+
+    async def aggregate(self, pipeline):
+        raise OperationFailure("aggregation is not available on the stand-in database")
+
+
+class FakeDatabase:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name, self.latency)
+        return self._collections[name]
+
+    async def list_collections(self, filter=None):
+        return _EmptyCursor()
+
+    async def create_collection(self, name, **kwargs):
+        return self[name]
+
+    async def command(self, *args, **kwargs):
+        return {"ok": 1}
+
+
+class FakeMongoClient:
+    """Drop-in for AsyncMongoClient; `latency` seconds are added to every insert_many.
+
+    Nothing inserted is kept: finds come back empty and aggregate raises OperationFailure.
+    """
+
+    latency = 0.0
+
+    def __init__(self, *args, **kwargs):
+        self._databases: Dict[str, FakeDatabase] = {}
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        if name not in self._databases:
+            self._databases[name] = FakeDatabase(self.latency)
+        return self._databases[name]
+
+    async def close(self):
+        pass
+
+
+async def _serve_broker(host: str, port: int):
+    broker = StandInBroker()
+    await broker.start(host, port)
+    print(f"Stand-in MQTT broker listening on {host}:{port}", flush=True)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("broker",))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve_broker(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
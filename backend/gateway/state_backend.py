@@ -0,0 +1,77 @@
+"""Shared hot state for running several gateway workers.
+
+With one worker, queue_consumer applies every batch straight to the in-process
+stores. With several workers (uvicorn processes or separate hosts), each worker
+appends its ingest batches to a shared, sequence-numbered ReadingLog and a
+background sync task replays the log into that worker's own SensorStore,
+ColumnStore and SSE hub. Every worker then answers /sensors, /history, /query
+and /stream for the whole fleet while serving reads without any IPC. Predictions
+from the ml topic reach only one worker of the shared subscription, so they go
+through a second log the same way and every worker's /ml sees all of them.
+
+ReadingLog is served by a multiprocessing manager as a local stand-in; a Redis
+stream (XADD / XREAD) provides the same append/since contract across hosts.
+"""
+from collections import deque
+from functools import partial
+from itertools import islice
+from multiprocessing.managers import BaseManager
+from typing import Dict, List, Tuple
+
+_logs: "Dict[str, ReadingLog]" = {}
+
+
+class ReadingLog:
+    """Bounded log of serialized ingest batches, addressed by sequence number."""
+
+    def __init__(self, retention: int = 10000):
+        self._batches: deque = deque(maxlen=retention)
+        self._next = 0
+
+    def append(self, batch: bytes) -> int:
+        self._batches.append(batch)
+        self._next += 1
+        return self._next
+
+    def since(self, seq: int) -> Tuple[int, List[bytes]]:
+        """Batches appended after `seq` (as many as are still retained) and the new position."""
+        first = self._next - len(self._batches)
+        start = max(seq, first)
+        return self._next, list(islice(self._batches, start - first, None))
+
+
+def _init_logs(retention: int):
+    _logs["reading_log"] = ReadingLog(retention)
+    _logs["prediction_log"] = ReadingLog(retention)
+
+
+def _get_log(name: str) -> ReadingLog:
+    assert name in _logs, "state server not initialized"
+    return _logs[name]
+
+
+class StateManager(BaseManager):
+    pass
+
+
+StateManager.register("reading_log", callable=partial(_get_log, "reading_log"), exposed=("append", "since"))
+StateManager.register("prediction_log", callable=partial(_get_log, "prediction_log"), exposed=("append", "since"))
+
+
+def parse_address(address: str):
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+def start_state_server(address: str, authkey: bytes, retention: int = 10000) -> StateManager:
+    """Serve the reading and prediction logs from a child process; call before starting the workers."""
+    manager = StateManager(address=parse_address(address), authkey=authkey)
+    manager.start(initializer=_init_logs, initargs=(retention,))
+    return manager
+
+
+def connect_state_backend(address: str, authkey: bytes, log: str = "reading_log"):
+    """Proxy to one of the shared logs, "reading_log" or "prediction_log"."""
+    manager = StateManager(address=parse_address(address), authkey=authkey)
+    manager.connect()
+    return getattr(manager, log)()
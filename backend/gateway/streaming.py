@@ -0,0 +1,88 @@
+import asyncio
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+FilterKey = Tuple[str | None, str | None]
+
+
+class Subscriber:
+    """One live client: a bounded list of readings that collapses to the latest per sensor when it overflows."""
+
+    def __init__(self, sensor_type: str | None = None, sensor_id: str | None = None, max_pending: int = 1000):
+        self.key: FilterKey = (sensor_type, sensor_id)
+        self.max_pending = max_pending
+        self._pending: list = []
+        self._ready = asyncio.Event()
+        self.delivered = 0
+        self.coalesced = 0
+
+    def offer(self, readings: Iterable):
+        self._pending.extend(readings)
+        if len(self._pending) > self.max_pending:
+            self._coalesce()
+        self._ready.set()
+
+    def _coalesce(self):
+        latest: Dict[Tuple[str, str], object] = {}
+        for reading in self._pending:
+            key = (reading.sensor_type, reading.sensor_id)
+            latest.pop(key, None)
+            latest[key] = reading
+        kept = list(latest.values())[-self.max_pending:]
+        self.coalesced += len(self._pending) - len(kept)
+        self._pending = kept
+
+    async def next_batch(self, timeout: float | None = None) -> list:
+        """Wait for new readings; returns [] if `timeout` passes first."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        batch, self._pending = self._pending, []
+        self.delivered += len(batch)
+        return batch
+
+
+class StreamHub:
+    """Fans ingest batches out to subscribers, indexed by their (sensor_type, sensor_id) filter."""
+
+    def __init__(self, max_pending: int = 1000):
+        self.max_pending = max_pending
+        self._subscribers: Dict[FilterKey, Set[Subscriber]] = defaultdict(set)
+
+    def subscribe(self, sensor_type: str | None = None, sensor_id: str | None = None) -> Subscriber:
+        if sensor_id is not None and sensor_type is None:
+            raise ValueError("sensor_id needs a sensor_type")
+        subscriber = Subscriber(sensor_type, sensor_id, self.max_pending)
+        self._subscribers[subscriber.key].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.key)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.key]
+
+    def publish(self, readings: list):
+        if not self._subscribers:
+            return
+        groups: Dict[FilterKey, List] = defaultdict(list)
+        for reading in readings:
+            groups[(reading.sensor_type, reading.sensor_id)].append(reading)
+        by_type: Dict[FilterKey, List] = defaultdict(list)
+        for (sensor_type, sensor_id), group in groups.items():
+            by_type[(sensor_type, None)].extend(group)
+            for subscriber in self._subscribers.get((sensor_type, sensor_id), ()):
+                subscriber.offer(group)
+        for key, group in by_type.items():
+            for subscriber in self._subscribers.get(key, ()):
+                subscriber.offer(group)
+        everyone = self._subscribers.get((None, None))
+        if everyone:
+            for subscriber in everyone:
+                subscriber.offer(readings)
+
+    def __len__(self):
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
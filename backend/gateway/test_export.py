@@ -0,0 +1,53 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+import pytest
+from export import export_to_directory, import_chunks, iter_import_files
+
+
+class Collection:
+    """Just enough of an async Mongo collection for export and import."""
+
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+
+    def find(self, match, projection=None, sort=None, batch_size=None):
+        async def cursor():
+            for doc in sorted(self.docs, key=lambda doc: doc["time"]):
+                yield dict(doc)
+        return cursor()
+
+    async def insert_many(self, docs, ordered=True):
+        self.docs.extend(docs)
+
+
+@pytest.fixture
+def host_timezone(monkeypatch):
+    """Switch the process time zone; the export must not depend on it."""
+    def switch(name):
+        monkeypatch.setenv("TZ", name)
+        time.tzset()
+    yield switch
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_export_import_round_trip(tmp_path, host_timezone):
+    start = datetime(2025, 3, 1, 23, 0)
+    docs = [{"sensor_id": f"t{i % 3}", "sensor_type": "temperature", "value": float(i),
+             "time": start + timedelta(minutes=7 * i), "zone": i % 4}
+            for i in range(40)]
+    # Stored before zones existed
+    docs.append({"sensor_id": "legacy", "sensor_type": "temperature", "value": 1.0, "time": start})
+    host_timezone("America/New_York")
+    asyncio.run(export_to_directory({"temperature": Collection(docs)}, str(tmp_path), chunk_rows=8, log=lambda _: None))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["temperature"]
+    assert sorted(path.name for path in (tmp_path / "temperature").iterdir()) == ["2025-03-01", "2025-03-02"]
+    host_timezone("Asia/Tokyo")
+
+    restored = Collection()
+    asyncio.run(import_chunks({"temperature": restored}, iter_import_files(str(tmp_path)), log=lambda _: None))
+
+    key = lambda doc: (doc["time"], doc["sensor_id"])
+    expected = [{**doc, "zone": doc.get("zone", 0)} for doc in docs]
+    assert sorted(restored.docs, key=key) == sorted(expected, key=key)
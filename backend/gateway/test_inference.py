@@ -0,0 +1,31 @@
+from datetime import datetime
+import pytest
+from inference import InferenceEngine, VECTOR_MIN_ROWS
+from models import Reading
+
+
+def readings(sensor_ids, values):
+    now = datetime.now()
+    return [Reading(sensor_id=sensor_id, sensor_type="temperature", value=value, time=now)
+            for sensor_id, value in zip(sensor_ids, values)]
+
+
+@pytest.mark.parametrize("sensors", [1, VECTOR_MIN_ROWS * 2])
+def test_batch_matches_one_reading_at_a_time(sensors):
+    ids = [f"s{i % sensors}" for i in range(400)]
+    values = [20 + (i % 7) * 0.5 + (30 if i == 350 else 0) for i in range(400)]
+    batch = readings(ids, values)
+    batched = InferenceEngine(["temperature"]).process(batch)
+    single = InferenceEngine(["temperature"])
+    one_by_one = [row for reading in batch for row in single.process([reading])]
+    assert batched == one_by_one
+    assert any(row.anomaly for row in batched)
+
+
+def test_predictions_endpoint_serves_scored_readings(client):
+    client.app.state.prediction_store.extend(
+        client.app.state.inference.process(readings(["t1"] * 3, [20.0, 21.0, 22.0])))
+    body = client.get("/predictions/temperature/t1").json()
+    assert [p["real"] for p in body] == [20.0, 21.0, 22.0]
+    # Holt forecast from level 20.5 and trend 0.05
+    assert body[-1]["prediction"] == pytest.approx(20.55)
@@ -0,0 +1,28 @@
+import asyncio
+import threading
+from ingest_bridge import IngestBridge
+
+
+def test_close_delivers_items_pushed_while_consumers_run():
+    async def main():
+        bridge = IngestBridge(asyncio.get_running_loop())
+        delivered = []
+        consuming = asyncio.Event()
+
+        async def consumer(batch):
+            delivered.extend(batch)
+            consuming.set()
+            await asyncio.sleep(0.05)
+
+        bridge.subscribe(consumer)
+        bridge.start()
+        bridge.push(0)
+        await consuming.wait()
+        # The network thread keeps pushing while the first batch is being consumed and close is called
+        thread = threading.Thread(target=bridge.push_many, args=([1, 2],))
+        thread.start()
+        thread.join()
+        await bridge.close()
+        return delivered
+
+    assert asyncio.run(main()) == [0, 1, 2]
@@ -0,0 +1,50 @@
+import asyncio
+from datetime import datetime
+from models import Reading
+from mongo_writer import MongoBatchWriter
+
+
+class SlowCollection:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.docs = []
+        self.inserting = asyncio.Event()
+
+    async def insert_many(self, docs, ordered=True):
+        self.inserting.set()
+        await asyncio.sleep(0.05)
+        if self.fail:
+            raise ConnectionError("down")
+        self.docs.extend(docs)
+
+
+def reading(i):
+    return Reading(sensor_id=f"t{i}", sensor_type="temperature", value=i, time=datetime.now())
+
+
+def test_close_while_flushing_writes_everything_accepted():
+    async def main():
+        collection = SlowCollection()
+        writer = MongoBatchWriter({"temperature": collection}, batch_size=1, flush_interval=0.01)
+        writer.start()
+        await writer.put(reading(0))
+        await collection.inserting.wait()
+        # Accepted while the first insert_many is in flight
+        await writer.put_many([reading(1), reading(2)])
+        await writer.close()
+        return collection, writer
+
+    collection, writer = asyncio.run(main())
+    assert len(collection.docs) == 3
+    assert writer.stats()["written"] == 3 and writer.stats()["queue_depth"] == 0
+
+
+def test_failed_insert_counts_as_dropped():
+    async def main():
+        writer = MongoBatchWriter({"temperature": SlowCollection(fail=True)})
+        await writer.put_many([reading(0), reading(1)])
+        await writer.close()
+        return writer.stats()
+
+    stats = asyncio.run(main())
+    assert (stats["written"], stats["dropped"], stats["errors"]) == (0, 2, 1)
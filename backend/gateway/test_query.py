@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+import pytest
+import gateway
+from models import Reading
+
+
+def test_explicit_bucket_is_clamped_to_max_points(client):
+    # 20000 readings, 5 ms apart: a 1 ms bucket would return one point per reading
+    start = datetime.now().replace(microsecond=0) - timedelta(seconds=200)
+    client.app.state.history.extend(
+        Reading(sensor_id="t1", sensor_type="temperature", value=i, time=start + timedelta(milliseconds=5 * i))
+        for i in range(20000))
+    end = start + timedelta(seconds=100)
+
+    body = client.get("/query/temperature", params={"from": start.isoformat(), "to": end.isoformat(),
+                                                    "bucket": 0.001}).json()
+
+    assert body["source"] == "memory"
+    assert body["bucket"] == pytest.approx(100 / gateway.QUERY_MAX_POINTS)
+    assert len(body["series"]["t1"]["value"]) <= gateway.QUERY_MAX_POINTS
+
+
+def test_range_before_memory_falls_back_when_mongo_aggregation_fails(client):
+    now = datetime.now().replace(microsecond=0)
+    client.app.state.history.extend([Reading(sensor_id="t1", sensor_type="temperature", value=21.0, time=now)])
+
+    body = client.get("/query/temperature", params={"from": (now - timedelta(hours=1)).isoformat(),
+                                                    "to": (now + timedelta(seconds=1)).isoformat()}).json()
+
+    assert body["source"] == "memory"
+    assert sum(value for value in body["series"]["t1"]["value"] if value is not None) == 21.0
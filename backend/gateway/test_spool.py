@@ -0,0 +1,15 @@
+import os
+import pytest
+from spool import Spool, segment_name
+
+
+def test_failed_recovery_releases_the_directory(tmp_path):
+    # A directory where a segment file should be makes opening the segment fail
+    os.mkdir(tmp_path / segment_name(1))
+    with pytest.raises(OSError) as failed:
+        Spool(str(tmp_path))
+
+    os.rmdir(tmp_path / segment_name(1))
+    spool = Spool(str(tmp_path))
+    spool.close()
+    assert failed.value  # the failed Spool is still referenced from the traceback here
@@ -0,0 +1,23 @@
+import asyncio
+from datetime import datetime
+import pytest
+from models import Reading
+from streaming import StreamHub
+
+
+def test_sensor_id_without_type_is_rejected(client):
+    response = client.get("/stream", params={"sensor_id": "t1"})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["query", "sensor_type"]
+
+
+def test_hub_filters_on_type_and_id():
+    hub = StreamHub()
+    subscriber = hub.subscribe("temperature", "t1")
+    now = datetime.now()
+    hub.publish([Reading(sensor_id=sensor_id, sensor_type=sensor_type, value=1, time=now)
+                 for sensor_type, sensor_id in (("temperature", "t1"), ("temperature", "t2"), ("humidity", "t1"))])
+    batch = asyncio.run(subscriber.next_batch(timeout=1))
+    assert [(reading.sensor_type, reading.sensor_id) for reading in batch] == [("temperature", "t1")]
+    with pytest.raises(ValueError):
+        hub.subscribe(sensor_id="t1")
@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from timeseries import migrate_collection
+
+
+class Interrupted(Exception):
+    pass
+
+
+class MemoryCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction=1):
+        self.docs = sorted(self.docs, key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.docs)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, operand in condition.items():
+            value = doc[field]
+            if not {"$eq": value == operand, "$gt": value > operand, "$lte": value <= operand}[op]:
+                return False
+    return True
+
+
+class MemoryCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.docs = []
+        self.fail_after = None  # raise once this many more documents have been inserted
+
+    def find(self, query=None, projection=None, sort=None, **kwargs):
+        docs = [{key: value for key, value in doc.items() if key != "_id"}
+                for doc in self.docs if matches(doc, query or {})]
+        cursor = MemoryCursor(docs)
+        return cursor.sort(*sort[0]) if sort else cursor
+
+    async def insert_many(self, docs, ordered=True):
+        assert ordered
+        for doc in docs:
+            if self.fail_after == 0:
+                self.fail_after = None
+                raise Interrupted()
+            if self.fail_after is not None:
+                self.fail_after -= 1
+            self.docs.append(dict(doc))
+
+    async def rename(self, new_name):
+        self.db.collections[new_name] = self.db.collections.pop(self.name)
+        self.name = new_name
+
+    async def drop(self):
+        self.db.collections.pop(self.name, None)
+
+    async def index_information(self):
+        return {}
+
+    async def create_index(self, keys, name=None):
+        return name
+
+
+class MemoryDatabase:
+    def __init__(self):
+        self.collections = {}
+        self.types = {}
+        self.fail_after = None  # passed on to the next collection created
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = MemoryCollection(self, name)
+        return self.collections[name]
+
+    async def list_collections(self, filter=None):
+        name = filter["name"]
+        if name not in self.collections:
+            return MemoryCursor([])
+        return MemoryCursor([{"name": name, "type": self.types.get(name, "collection")}])
+
+    async def create_collection(self, name, timeseries=None, **kwargs):
+        self.types[name] = "timeseries"
+        self[name].fail_after, self.fail_after = self.fail_after, None
+        return self[name]
+
+
+def test_interrupted_migration_resumes_without_duplicates():
+    start = datetime(2025, 3, 1)
+    # Pairs of readings share a time, so a batch can end between two documents of the same time
+    docs = [{"sensor_id": f"t{i % 3}", "time": start + timedelta(seconds=i // 2), "value": float(i)}
+            for i in range(25)]
+    db = MemoryDatabase()
+    db["temperature"].docs = [dict(doc, _id=i) for i, doc in enumerate(reversed(docs))]
+
+    async def run():
+        db.fail_after = 9
+        with pytest.raises(Interrupted):
+            await migrate_collection(db, "temperature", batch_size=4, log=lambda message: None)
+        assert 0 < len(db["temperature"].docs) < len(docs)
+        # The gateway may have written newer readings before the migration was resumed
+        late = {"sensor_id": "t0", "time": start + timedelta(hours=1), "value": -1.0}
+        db["temperature"].docs.append(late)
+        await migrate_collection(db, "temperature", batch_size=4, log=lambda message: None)
+        assert await migrate_collection(db, "temperature", batch_size=4, log=lambda message: None) == 0
+        return late
+
+    late = asyncio.run(run())
+    key = lambda doc: (doc["time"], doc["value"])
+    assert sorted(db["temperature"].docs, key=key) == sorted(docs + [late], key=key)
+    assert db.types["temperature"] == "timeseries"
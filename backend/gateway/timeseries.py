@@ -0,0 +1,170 @@
+"""MongoDB time-series setup for the sensor collections.
+
+The gateway calls ensure_collections at startup. Existing plain collections can be
+converted with the CLI (stop the gateway first):
+
+    python timeseries.py status
+    python timeseries.py migrate [--drop-backup]
+"""
+import argparse
+import asyncio
+from typing import Iterable
+
+TIME_FIELD = "time"
+META_FIELD = "sensor_id"
+
+
+def timeseries_options(granularity: str = "seconds") -> dict:
+    return {"timeField": TIME_FIELD, "metaField": META_FIELD, "granularity": granularity}
+
+
+async def collection_type(db, name: str) -> str | None:
+    """'timeseries', 'collection' or None if it does not exist."""
+    cursor = await db.list_collections(filter={"name": name})
+    infos = await cursor.to_list()
+    return infos[0].get("type", "collection") if infos else None
+
+
+INDEXES = {
+    "sensor_time": [(META_FIELD, 1), (TIME_FIELD, 1)],
+    "time": [(TIME_FIELD, 1)],
+}
+
+
+def _key_spec(keys) -> tuple:
+    """Index keys with numeric directions as int (servers may report 1.0); "text", "hashed" etc. stay as they are."""
+    return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                 for field, direction in keys)
+
+
+async def ensure_indexes(collection):
+    """Create the range-query indexes unless an index with the same keys already exists.
+
+    Newer servers build the metaField+timeField index on their own for time-series
+    collections; creating it again under another name would fail.
+    """
+    existing = {_key_spec(info["key"]) for info in (await collection.index_information()).values()}
+    for name, keys in INDEXES.items():
+        if _key_spec(keys) not in existing:
+            await collection.create_index(keys, name=name)
+
+
+async def create_timeseries(db, name: str, granularity: str = "seconds", retention_seconds: int | None = None):
+    kwargs: dict = {"timeseries": timeseries_options(granularity)}
+    if retention_seconds:
+        kwargs["expireAfterSeconds"] = retention_seconds
+    await db.create_collection(name, **kwargs)
+    await ensure_indexes(db[name])
+
+
+async def ensure_collections(db, names: Iterable[str], granularity: str = "seconds",
+                             retention_seconds: int | None = None, log=print):
+    """Create missing collections as time-series ones, add indexes and apply retention."""
+    for name in names:
+        kind = await collection_type(db, name)
+        if kind is None:
+            await create_timeseries(db, name, granularity, retention_seconds)
+            log(f"Created time-series collection: {name}")
+        elif kind == "timeseries":
+            await ensure_indexes(db[name])
+            if retention_seconds:
+                await db.command("collMod", name, expireAfterSeconds=retention_seconds)
+        else:
+            await ensure_indexes(db[name])
+            log(f"Collection {name} is a plain collection; run 'python timeseries.py migrate' to convert it")
+
+
+async def _latest_time(collection, until=None):
+    """The newest `time` in the collection (not after `until` if given), or None if it is empty."""
+    query = {TIME_FIELD: {"$lte": until}} if until is not None else {}
+    async for doc in collection.find(query, projection={TIME_FIELD: 1}).sort(TIME_FIELD, -1).limit(1):
+        return doc[TIME_FIELD]
+    return None
+
+
+async def migrate_collection(db, name: str, granularity: str = "seconds", batch_size: int = 10000,
+                             drop_backup: bool = False, log=print):
+    """Move a plain collection's documents into a new time-series collection of the same name.
+
+    Time-series collections cannot be renamed, so the plain collection is renamed to
+    <name>_backup first and its documents are copied over in time order, in ordered
+    batches, so that what has been copied is always a prefix of the backup. If a run
+    stops part way, the next one finds <name>_backup still there and resumes after the
+    newest time already in <name>. The new collection gets no TTL, so migrating never
+    deletes history; the gateway applies GATEWAY_RAW_RETENTION_SECONDS on its next start
+    if it is set.
+    """
+    backup = f"{name}_backup"
+    kind = await collection_type(db, name)
+    if await collection_type(db, backup) == "collection":
+        if kind == "collection":
+            log(f"{name}: {backup} already exists; drop or rename it before migrating")
+            return 0
+        log(f"{name}: resuming from {backup}")
+        if kind is None:
+            await create_timeseries(db, name, granularity)
+    elif kind == "collection":
+        await db[name].rename(backup)
+        await create_timeseries(db, name, granularity)
+    else:
+        log(f"{name}: nothing to migrate")
+        return 0
+
+    # Anything newer than the backup was written after the migration, e.g. by the gateway
+    watermark = await _latest_time(db[name], until=await _latest_time(db[backup]))
+    batch = []
+    query = {}
+    if watermark is not None:
+        query = {TIME_FIELD: {"$gt": watermark}}
+        # Documents sharing the watermark's time may have been copied only in part
+        present = [doc async for doc in db[name].find({TIME_FIELD: watermark}, projection={"_id": 0})]
+        async for doc in db[backup].find({TIME_FIELD: watermark}, projection={"_id": 0}):
+            if doc in present:
+                present.remove(doc)
+            else:
+                batch.append(doc)
+
+    copied = 0
+    cursor = db[backup].find(query, projection={"_id": 0}, batch_size=batch_size,
+                             sort=[(TIME_FIELD, 1)], allow_disk_use=True)
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await db[name].insert_many(batch)
+            copied += len(batch)
+            batch = []
+            log(f"{name}: {copied} documents copied")
+    if batch:
+        await db[name].insert_many(batch)
+        copied += len(batch)
+    log(f"{name}: migrated {copied} documents")
+    if drop_backup:
+        await db[backup].drop()
+    return copied
+
+
+async def _main(args):
+    from pymongo import AsyncMongoClient
+    import gateway
+
+    client = AsyncMongoClient(args.uri or gateway.MONGO_URI)
+    db = client[args.db]
+    try:
+        for name in gateway.SENSOR_TYPES:
+            if args.command == "status":
+                print(f"{name}: {await collection_type(db, name)}")
+            else:
+                await migrate_collection(db, name, gateway.MONGO_GRANULARITY,
+                                         batch_size=args.batch_size, drop_backup=args.drop_backup)
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("status", "migrate"))
+    parser.add_argument("--uri", help="defaults to gateway.MONGO_URI")
+    parser.add_argument("--db", default="sensors")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--drop-backup", action="store_true")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,45 @@
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+
+Handler = Callable[[List[str], bytes], None]
+
+
+class TopicRouter:
+    """Dispatches MQTT messages to handlers keyed on the first topic segment.
+
+    Each route is registered with the exact subscription filter it needs (for example
+    `sensors/+/+`), so the gateway only subscribes to what it handles. Handlers get the
+    already split topic, so ids carried in the topic never have to be re-read from the
+    payload. Messages that match no route and handler failures are counted, not printed.
+    """
+
+    def __init__(self):
+        self._routes: Dict[str, Tuple[int, Handler]] = {}
+        self._filters: List[str] = []
+        self.handled: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.unknown = 0
+
+    def route(self, topic_filter: str, handler: Handler):
+        parts = topic_filter.split("/")
+        self._routes[parts[0]] = (len(parts), handler)
+        self._filters.append(topic_filter)
+
+    def subscriptions(self, shared_group: str | None = None, qos: int = 0) -> List[Tuple[str, int]]:
+        prefix = f"$share/{shared_group}/" if shared_group else ""
+        return [(prefix + topic_filter, qos) for topic_filter in self._filters]
+
+    def dispatch(self, topic: str, payload: bytes):
+        parts = topic.split("/")
+        route = self._routes.get(parts[0])
+        if route is None or len(parts) != route[0]:
+            self.unknown += 1
+            return
+        try:
+            route[1](parts, payload)
+            self.handled[parts[0]] += 1
+        except Exception:
+            self.errors[parts[0]] += 1
+
+    def stats(self):
+        return {"handled": dict(self.handled), "errors": dict(self.errors), "unknown": self.unknown}
@@ -0,0 +1,90 @@
+"""Applies the gateway controller's actuator commands to the shared environment memory.
+
+Commands arrive on `actuators/<zone>` as JSON objects of absolute actuator states
+(plus the controller's `issued` epoch time); each named flag is written straight into
+that zone of the EnvironmentMemory, where the environment process picks it up on its
+next step. Command-to-actuation latency is measured from `issued`, so it assumes the
+gateway and peer clocks agree.
+"""
+import json
+import time
+import uuid
+from collections import deque
+from multiprocessing.synchronize import Event
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+
+from enviroment.memory import ACTUATORS
+
+STATS_INTERVAL = 10.0
+
+
+class ActuatorApplier:
+    """Writes commands into the memory and keeps latency stats over the last `window` of them."""
+
+    def __init__(self, enviroment_memory, window: int = 1000):
+        self.memory = enviroment_memory
+        self.zones = getattr(enviroment_memory, "zones", 1)
+        self.latencies = deque(maxlen=window)
+        self.applied = 0
+        self.rejected = 0
+
+    def apply(self, zone: int, command: dict) -> bool:
+        if not 0 <= zone < self.zones:
+            self.rejected += 1
+            return False
+        for name in ACTUATORS:
+            if name in command:
+                self.memory.set_actuator(name, bool(command[name]), zone)
+        if "issued" in command:
+            self.latencies.append(time.time() - float(command["issued"]))
+        self.applied += 1
+        return True
+
+    def on_message(self, client, userdata, msg):
+        try:
+            self.apply(int(msg.topic.rsplit("/", 1)[1]), json.loads(msg.payload))
+        except (ValueError, TypeError):
+            self.rejected += 1
+
+    def stats(self) -> dict:
+        ordered = sorted(self.latencies)
+        pick = lambda q: round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 2) if ordered else None
+        return {"applied": self.applied, "rejected": self.rejected, "p50_ms": pick(0.5), "p99_ms": pick(0.99)}
+
+
+def actuator_process(enviroment_memory, ready_event: Event, stop_event: Event,
+                     host="192.168.0.38", port=8883, topic="actuators"):
+    """Subscribe to the controller's commands and apply them until stop_event is set."""
+    applier = ActuatorApplier(enviroment_memory)
+    client = mqtt.Client(client_id=f"{uuid.getnode()}_actuators", reconnect_on_failure=True,
+                         clean_session=True, callback_api_version=CallbackAPIVersion.VERSION1)
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            print("Actuators connected to MQTT broker!")
+            # Commands are retained, so every zone's current state arrives right after subscribing
+            client.subscribe(f"{topic}/+", qos=1)
+        else:
+            print(f"Actuators failed to connect, rc={rc}")
+
+    client.on_connect = on_connect
+    client.on_message = applier.on_message
+    # Do not block the commander if the broker is not up yet; paho keeps retrying
+    client.connect_async(host, port, 60)
+    client.loop_start()
+    ready_event.set()
+    last_applied = 0
+    try:
+        while not stop_event.wait(STATS_INTERVAL):
+            if applier.applied != last_applied:
+                last_applied = applier.applied
+                stats = applier.stats()
+                print(f"Actuators: {stats['applied']} commands applied, "
+                      f"latency p50 {stats['p50_ms']} ms p99 {stats['p99_ms']} ms")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
@@ -0,0 +1,85 @@
+"""Environment read throughput: Manager().dict() proxy vs the shared-memory block.
+
+A writer process updates the environment as fast as it can (or at --write-rate per
+second) while this process reads the way Sensor.getValue does.
+
+    python bench_memory.py [--seconds 3] [--write-rate 0]
+"""
+import argparse
+import multiprocessing as mp
+import random
+import time
+from multiprocessing import Manager
+
+from enviroment.memory import EnvironmentMemory
+
+
+def dict_writer(memory, stop_event, rate):
+    while not stop_event.is_set():
+        memory['temperature'] = random.uniform(15, 25)
+        memory['humidity'] = random.uniform(40, 80)
+        memory['moisture'] = random.uniform(300, 600)
+        memory['time'] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        if rate:
+            time.sleep(1 / rate)
+
+
+def shm_writer(memory, stop_event, rate):
+    while not stop_event.is_set():
+        memory.write(random.uniform(15, 25), random.uniform(40, 80), random.uniform(300, 600))
+        if rate:
+            time.sleep(1 / rate)
+
+
+def measure(label, read, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            read()
+        count += 100
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {count / elapsed:>12,.0f} reads/s  {elapsed / count * 1e6:8.2f} us/read")
+    return count / elapsed
+
+
+def run(label, memory, writer, reads, args):
+    stop_event = mp.Event()
+    p = mp.Process(target=writer, args=(memory, stop_event, args.write_rate))
+    p.start()
+    time.sleep(0.2)
+    try:
+        return {name: measure(f"{label}: {name}", read, args.seconds) for name, read in reads.items()}
+    finally:
+        stop_event.set()
+        p.join()
+
+
+def main(args):
+    manager = Manager()
+    proxy = manager.dict(temperature=20.0, humidity=60.0, moisture=450.0, time="2026-01-01T00:00:00")
+    results = run("manager", proxy, dict_writer, {
+        "getValue (2 lookups)": lambda: (proxy['temperature'], proxy['time']),
+        "copy()": proxy.copy,
+    }, args)
+    manager.shutdown()
+
+    memory = EnvironmentMemory.create()
+    try:
+        shm = run("shared memory", memory, shm_writer, {
+            "getValue (2 lookups)": lambda: (memory['temperature'], memory['time']),
+            "copy()": memory.copy,
+            "read()": memory.read,
+        }, args)
+    finally:
+        memory.close()
+    for name, rate in results.items():
+        print(f"{name}: {shm[name] / rate:.0f}x faster")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--write-rate", type=float, default=0, help="writer updates per second, 0 = unthrottled")
+    main(parser.parse_args())
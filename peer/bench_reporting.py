@@ -0,0 +1,103 @@
+"""Messages and bytes per second saved by report-by-exception (sensor.reporting).
+
+Generates a seeded environment trace at one sample per second per sensor, adds the
+same per-reading offset Sensor.sample does, and runs every sensor's samples through a
+Reporter for each configuration. Wire bytes add the MQTT framing of a PUBLISH (fixed
+header, topic, packet id) and its PUBACK at QoS 1; the baseline is the old behaviour,
+one message per sample with the JSON document Sensor.getValue builds.
+
+    python bench_reporting.py [--sensors 30] [--hours 2] [--zones 3] [--seed 1]
+"""
+import argparse
+import json
+from datetime import datetime
+
+import numpy as np
+
+from sensor.reporting import Reporter
+from sensor.sensor import VALID_TYPES
+from simulator.replay import generate_trace
+
+CONFIGS = (
+    ("every sample, json", {}),
+    ("deadband 1.0", {"deadband": 1.0}),
+    ("deadband 2.5", {"deadband": 2.5}),
+    ("batch 10", {"batch": 10}),
+    ("binary", {"binary": True}),
+    ("binary batch 10", {"binary": True, "batch": 10}),
+    ("deadband 2.5 binary batch 10", {"deadband": 2.5, "binary": True, "batch": 10}),
+)
+
+
+def publish_overhead(topic: str, qos: int = 1) -> int:
+    """MQTT bytes around a payload: PUBLISH fixed header, topic, packet id, plus the PUBACK."""
+    return 2 + 2 + len(topic.encode()) + (2 + 4 if qos else 0)
+
+
+def run_legacy(trace, sensors, seed):
+    """The previous sensor_process: json.dumps(Sensor.getValue()) once per sample."""
+    rng = np.random.default_rng(seed)
+    zones = trace["temperature"].shape[1]
+    totals = {"samples": 0, "messages": 0, "payload": 0, "wire": 0}
+    for index in range(sensors):
+        sensor_type = VALID_TYPES[index % len(VALID_TYPES)]
+        sensor_id = f"bench-{sensor_type}-{index}"
+        values = trace[sensor_type][:, index % zones].astype("f8") + rng.uniform(2, 5, len(trace["time"]))
+        overhead = publish_overhead(f"sensors/{sensor_type}/{sensor_id}")
+        for stamp, value in zip(trace["time"].tolist(), values.tolist()):
+            size = len(json.dumps({"sensor_id": sensor_id, "sensor_type": sensor_type, "value": value,
+                                   "time": datetime.fromtimestamp(stamp).isoformat()}))
+            totals["payload"] += size
+            totals["wire"] += size + overhead
+        totals["samples"] += len(values)
+        totals["messages"] += len(values)
+    return totals
+
+
+def run(trace, sensors, seconds, options, seed):
+    rng = np.random.default_rng(seed)
+    zones = trace["temperature"].shape[1]
+    totals = {"samples": 0, "messages": 0, "payload": 0, "wire": 0}
+    for index in range(sensors):
+        sensor_type = VALID_TYPES[index % len(VALID_TYPES)]
+        zone = index % zones
+        topic = f"sensors/{sensor_type}/bench-{sensor_type}-{index}"
+        reporter = Reporter(zone=zone, **options)
+        values = trace[sensor_type][:, zone].astype("f8") + rng.uniform(2, 5, len(trace["time"]))
+        overhead = publish_overhead(topic)
+        for now, stamp, value in zip(range(seconds), trace["time"].tolist(), values.tolist()):
+            payload = reporter.offer(value, stamp, now=float(now))
+            if payload is not None:
+                totals["wire"] += len(payload) + overhead
+        payload = reporter.flush()
+        if payload is not None:
+            totals["wire"] += len(payload) + overhead
+        totals["samples"] += reporter.samples
+        totals["messages"] += reporter.messages
+        totals["payload"] += reporter.bytes
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sensors", type=int, default=30)
+    parser.add_argument("--hours", type=float, default=2)
+    parser.add_argument("--zones", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    seconds = int(args.hours * 3600)
+    trace = generate_trace(seconds / 86400, step=1.0, zones=args.zones, seed=args.seed)
+    print(f"{args.sensors} sensors, {seconds} samples each, rates are for the whole fleet")
+    print(f"{'configuration':<30} {'msg/s':>9} {'payload B/s':>12} {'wire B/s':>10} {'msgs saved':>11} {'bytes saved':>12}")
+    rows = [("before (getValue json)", run_legacy(trace, args.sensors, args.seed))]
+    rows += [(label, run(trace, args.sensors, seconds, options, args.seed)) for label, options in CONFIGS]
+    baseline = rows[0][1]
+    for label, totals in rows:
+        print(f"{label:<30} {totals['messages'] / seconds:9.2f} {totals['payload'] / seconds:12.1f} "
+              f"{totals['wire'] / seconds:10.1f} {1 - totals['messages'] / baseline['messages']:11.1%} "
+              f"{1 - totals['wire'] / baseline['wire']:12.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,23 @@
 import multiprocessing as mp
-from multiprocessing import Manager
-from typing import Dict
+from typing import Dict, List
 from enviroment.enviroment import enviroment_process
+from enviroment.memory import EnvironmentMemory
 from sensor.sensor import sensor_process
+from actuator.actuator import actuator_process
+from simulator.simulator import run_simulator, stop_simulator
+from fleet.fleet import Fleet, load_spec
+
+# Greenhouse zones simulated by the environment process; simulated sensors are spread across them
+ENV_ZONES = 1
+# Broker carrying the gateway controller's actuator commands
+ACTUATOR_HOST = "192.168.0.38"
+ACTUATOR_PORT = 8883
+# Report-by-exception options for sensors and simulators started from now on (see sensor.reporting)
+REPORTING = {"deadband": 0.0, "heartbeat": 60.0, "batch": 1, "binary": False}
 
 
 def main():
-    manager = Manager()
-    enviroment_memory = manager.dict()
+    enviroment_memory = EnvironmentMemory.create(zones=ENV_ZONES)
     env_ready = mp.Event()
     env_stop = mp.Event()
 
@@ -17,13 +27,35 @@ def main():
     print("Waiting for environment initialization...")
     env_ready.wait()
     print("Environment initialized")
+
+    # Apply the controller's commands to the environment
+    actuator_ready = mp.Event()
+    actuator_stop = mp.Event()
+    actuator_process_ref = mp.Process(target=actuator_process,
+                                      args=(enviroment_memory, actuator_ready, actuator_stop, ACTUATOR_HOST, ACTUATOR_PORT))
+    actuator_process_ref.start()
+    actuator_ready.wait()
     sensors: Dict[str, Dict] = {}
+    simulators: List[Dict] = []
+    fleet = Fleet(enviroment_memory)
     HELP_TEXT = """
     Available Commands:
     add <sensor_id> <sensor_type> <host> <port>     - Start a new sensor process
     remove <sensor_id>                              - Stop and remove a sensor
     restart <sensor_id>                             - Restart a sensor
+    sim <count> [rate] [connections] [shards] [host] [port]
+                                                    - Simulate <count> sensors of each type
+                                                      (rate in msg/s per sensor, default 1)
+    sim stop                                        - Stop all simulators
+    report [deadband] [heartbeat] [batch] [json|binary]
+                                                    - Show or set report-by-exception for new sensors
+    fleet apply <spec.json>                         - Start, restart or stop fleet groups to match a spec
+    fleet stop [group]                              - Stop the whole fleet or one group
+    fleet restart [group]                           - Rolling restart, one process at a time
+    fleet status                                    - Health and publish rate per fleet group
+    fleet sensors <group> [all]                     - Per-sensor health (only unhealthy ones without 'all')
     list                                            - List all active sensors
+    actuators                                       - Show the actuator state of every zone
     help                                            - Show this help message
     quit / exit                                     - Stop everything and exit
 
@@ -32,7 +64,8 @@ def main():
     try:
         print(HELP_TEXT)
         while True:
-            cmd = input("Commander> ").strip().lower()
+            line = input("Commander> ").strip()
+            cmd = line.lower()
             if cmd == "help":
                 print(HELP_TEXT)
             elif cmd.startswith("add"):
@@ -65,7 +98,8 @@ def main():
                     continue
                 ready_event = mp.Event()
                 stop_event = mp.Event()
-                p = mp.Process(target=sensor_process, args=(sensor_id, sensor_type, enviroment_memory, ready_event, stop_event,host,int(port)))
+                p = mp.Process(target=sensor_process, args=(sensor_id, sensor_type, enviroment_memory, ready_event, stop_event,host,int(port)),
+                               kwargs=dict(REPORTING))
                 p.start()
                 ready_event.wait()
                 sensors[sensor_id] = {"process": p, "stop_event": stop_event, "type": sensor_type, "host":host,"port":port}
@@ -96,16 +130,107 @@ def main():
 
                 ready_event = mp.Event()
                 stop_event = mp.Event()
-                p = mp.Process(target=sensor_process, args=(sensor_id,sensor_type, enviroment_memory, ready_event, stop_event, host, port))
+                p = mp.Process(target=sensor_process, args=(sensor_id,sensor_type, enviroment_memory, ready_event, stop_event, host, int(port)),
+                               kwargs=dict(REPORTING))
                 p.start()
                 ready_event.wait()
                 sensors[sensor_id] = {"process": p, "stop_event": stop_event, "type":sensor_type}
                 print(f"Sensor {sensor_id} restarted")
 
+            elif cmd == "sim stop":
+                for info in simulators:
+                    stop_simulator(info)
+                simulators.clear()
+                print("Simulators stopped")
+
+            elif cmd.startswith("sim"):
+                args = cmd.split()[1:]
+                try:
+                    count = int(args[0])
+                    rate = float(args[1]) if len(args) > 1 else 1.0
+                    connections = int(args[2]) if len(args) > 2 else 4
+                    shards = int(args[3]) if len(args) > 3 else 1
+                    host = args[4] if len(args) > 4 else "192.168.0.38"
+                    port = int(args[5]) if len(args) > 5 else 8883
+                except (IndexError, ValueError):
+                    print("Usage: sim <count> [rate] [connections] [shards] [host] [port]")
+                    continue
+                if count <= 0 or rate <= 0 or connections <= 0 or shards <= 0:
+                    print("count, rate, connections and shards must be positive")
+                    continue
+                counts = {sensor_type: count for sensor_type in ("temperature", "humidity", "moisture")}
+                info = run_simulator(counts, enviroment_memory, host, port, rate, connections, shards,
+                                     name=f"sim{len(simulators)}", reporting=dict(REPORTING))
+                simulators.append(info)
+                print(f"Simulating {3 * count} sensors in {shards} process(es)")
+
+            elif cmd.startswith("report"):
+                args = cmd.split()[1:]
+                try:
+                    deadband = float(args[0]) if len(args) > 0 else REPORTING["deadband"]
+                    heartbeat = float(args[1]) if len(args) > 1 else REPORTING["heartbeat"]
+                    batch = int(args[2]) if len(args) > 2 else REPORTING["batch"]
+                    binary = args[3] == "binary" if len(args) > 3 else REPORTING["binary"]
+                except ValueError:
+                    print("Usage: report [deadband] [heartbeat] [batch] [json|binary]")
+                    continue
+                if deadband < 0 or heartbeat <= 0 or not 1 <= batch <= 255:
+                    print("deadband must be >= 0, heartbeat > 0 and batch between 1 and 255")
+                    continue
+                REPORTING.update(deadband=deadband, heartbeat=heartbeat, batch=batch, binary=binary)
+                print(f"Reporting for new sensors: {REPORTING}")
+
+            elif cmd.startswith("fleet"):
+                args = cmd.split()[1:]
+                if args[:1] == ["apply"] and len(args) == 2:
+                    try:
+                        # Paths keep their case
+                        spec = load_spec(line.split()[2], reporting=REPORTING)
+                    except (OSError, ValueError) as e:
+                        print(f"Invalid fleet spec: {e}")
+                        continue
+                    result = fleet.apply(spec)
+                    print(f"Fleet {spec['name']}: {result['sensors']} sensors in {result['seconds']}s "
+                          f"(started {result['started']}, restarted {result['restarted']}, "
+                          f"stopped {result['stopped']}, unchanged {result['unchanged']})")
+                elif args[:1] == ["stop"]:
+                    print(f"Fleet stopped in {fleet.stop(args[1:] or None):.2f}s")
+                elif args[:1] == ["restart"]:
+                    print(f"Rolling restart finished in {fleet.rolling_restart(args[1:] or None):.2f}s")
+                elif args == ["status"]:
+                    if not fleet.groups:
+                        print("No fleet running")
+                    for group in fleet.summary():
+                        print(f"  {group['group']} ({group['type']}): {group['sensors']} sensors in "
+                              f"{group['processes']} process(es), {group['health']}, "
+                              f"{group['published']} published ({group['msg_per_s']} msg/s), "
+                              f"{group['failed']} failed, {group['bytes']} bytes")
+                elif args[:1] == ["sensors"] and len(args) in (2, 3):
+                    if args[1] not in fleet.groups:
+                        print(f"{args[1]} not found! Groups: {list(fleet.groups)}")
+                        continue
+                    for sensor in fleet.health(args[1]):
+                        if args[2:] == ["all"] or sensor["state"] != "ok":
+                            age = sensor["last_publish_age"]
+                            print(f"  {sensor['sensor_id']} (zone {sensor['zone']}): {sensor['state']}, "
+                                  f"{sensor['published']} published, {sensor['failed']} failed, "
+                                  f"{f'last {age}s ago' if age is not None else 'nothing published yet'}")
+                else:
+                    print("Usage: fleet apply <spec.json> | stop [group] | restart [group] | status | sensors <group> [all]")
+
             elif cmd == "list":
                 print("Active sensors:")
                 for id, info in sensors.items():
                     print(f"  {id} ({info['type']})")
+                for index, info in enumerate(simulators):
+                    print(f"  sim{index}: {sum(info['counts'].values())} simulated sensors at {info['rate']} msg/s")
+                for name, running in fleet.groups.items():
+                    print(f"  {name}: {running['spec']['count']} fleet sensors ({running['spec']['type']})")
+
+            elif cmd == "actuators":
+                for zone in range(enviroment_memory.zones):
+                    on = [name for name, state in enviroment_memory.actuators(zone).items() if state]
+                    print(f"  zone {zone}: {', '.join(on) if on else 'all off'}")
 
             elif cmd in ("quit", "exit"):
                 print("Shutting down all sensors and environment...")
@@ -122,9 +247,15 @@ def main():
     for info in sensors.values():
         info["stop_event"].set()
         info["process"].join()
+    for info in simulators:
+        stop_simulator(info)
+    fleet.stop()
 
+    actuator_stop.set()
+    actuator_process_ref.join()
     env_stop.set()
     env_process_ref.join()
+    enviroment_memory.close()
     print("Shutdown complete")
 
 if __name__ == "__main__":
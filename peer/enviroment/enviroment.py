@@ -1,152 +1,197 @@
 import numpy as np
 import math
-import random
 import time
 from datetime import datetime
-from multiprocessing import Manager
 import multiprocessing as mp
 from multiprocessing.synchronize import Event
+from enviroment.memory import ACTUATORS, EnvironmentMemory
+
+class SimClock:
+    """Simulated time that advances by a fixed `step` seconds per tick, independent of the wall clock"""
+    def __init__(self, start: datetime | None = None, step: float = 60.0):
+        start = start if start is not None else datetime.now().replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        self.start = start.timestamp()
+        self.step = step
+        self.ticks = 0
+        # Day of the year at `start`, fractional part is the time of day
+        self.start_day = (start - start.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)).total_seconds() / 86400
+
+    @property
+    def now(self) -> float:
+        """Simulated epoch seconds"""
+        return self.start + self.ticks * self.step
+
+    @property
+    def t_days(self) -> float:
+        return self.start_day + self.ticks * self.step / 86400
+
+    def tick(self) -> float:
+        self.ticks += 1
+        return self.now
+
+
+class ZoneEnvironment:
+    """Environment of N greenhouse zones, every variable an array updated in one vectorized step.
+
+    Each zone has its own latitude, readings and actuator tilts; random draws come from
+    a single seeded np.random.Generator so runs are reproducible.
+    """
+    def __init__(self, zones=1, latitude=None, seed=None):
+        self.zones = zones
+        self.rng = np.random.default_rng(seed)
+        self.latitude = np.broadcast_to(np.asarray(latitude if latitude is not None else math.degrees(math.asin(0.0)),
+                                                   dtype=float), (zones,)).copy()
+        self.temperature = self.rng.uniform(15, 20, zones)
+        self.humidity = np.full(zones, 70.0)
+        self.moisture = self.rng.uniform(300, 600, zones)
 
-class EnvironmentState:
-    """Tracks environment variables and gradual control tilts"""
-    def __init__(self, latitude=None):
-        self.latitude = latitude if latitude is not None else math.degrees(math.asin(0.0))
-        self.temperature = random.uniform(15, 20)
-        self.humidity = 70.0
-        self.moisture = random.uniform(300, 600)
-
-        self.time = time.time()
         self.start_time = time.time()
         self.start_day = 90
-        self.temp_tilt = 0.0
-        self.hum_tilt = 0.0
-        self.moist_tilt = 0.0
+        self.simulated_aging = False
+        self.temp_tilt = np.zeros(zones)
+        self.hum_tilt = np.zeros(zones)
+        self.moist_tilt = np.zeros(zones)
+        self.pump_flow_tilt = None
 
-
-    def temperature_func(self, t_days, fan=False, heater=False, alpha=0.05, thermal_inertia=0.1):
-        lat_norm = abs(self.latitude) / 90.0
+    def temperature_step(self, t_days, fan=False, heater=False, alpha=0.05, thermal_inertia=0.1):
+        lat_norm = np.abs(self.latitude) / 90.0
 
         BASE_TEMP = 27 - 32 * lat_norm
         A_seasonal = 3 + 20 * lat_norm
-        seasonal = A_seasonal * np.sin(2 * np.pi * (t_days / 365 - 0.25))
+        seasonal = A_seasonal * math.sin(2 * math.pi * (t_days / 365 - 0.25))
 
         A_daily = 8 - 6 * lat_norm
-        daily = A_daily * np.sin(2 * np.pi * (t_days % 1) - np.pi/2)
+        daily = A_daily * math.sin(2 * math.pi * (t_days % 1) - math.pi/2)
 
-        years_passed = (time.time() - self.start_time) / (365*24*3600)
+        # Noise grows over the years the environment has run. Fixed-step runs count simulated years
+        # so they are reproducible; the live process counts wall-clock years, since at its time
+        # acceleration simulated years would make the noise grow by ~1 degree per real day
+        if self.simulated_aging:
+            years_passed = max(t_days - self.start_day, 0) / 365
+        else:
+            years_passed = (time.time() - self.start_time) / (365 * 24 * 3600)
         noise_std = 0.3 + 0.02 * years_passed
-        noise = np.random.normal(0, noise_std)
+        noise = self.rng.normal(0, noise_std, self.zones)
 
         temp = BASE_TEMP + seasonal + daily + noise
 
         # Tilt
-        target_delta = 0
-        if fan: target_delta -= 3
-        if heater: target_delta += 3
-
+        target_delta = 3.0 * (np.asarray(heater, dtype=float) - np.asarray(fan, dtype=float))
         self.temp_tilt += alpha * (target_delta - self.temp_tilt)
         temp += self.temp_tilt
 
         # Inertia smoothing
         temp = self.temperature + thermal_inertia * (temp - self.temperature)
 
-        # Clamp
-        temp = max(min(temp, 50), -20)
-        self.temperature = temp
-        return temp
+        self.temperature = np.clip(temp, -20, 50)
+        return self.temperature
 
-    def humidity_func(self, t_days, humidifier=False, dehumidifier=False, alpha=0.01):
-        base_hum = 70 - 0.6 * max(self.temperature, 0)
+    def humidity_step(self, t_days, humidifier=False, dehumidifier=False, alpha=0.01):
+        base_hum = 70 - 0.6 * np.maximum(self.temperature, 0)
 
-        daily = 5 * np.sin(2 * np.pi * (t_days % 1))
+        daily = 5 * math.sin(2 * math.pi * (t_days % 1))
         moisture_effect = (self.moisture - 500) / 250
 
         hum = base_hum + daily + moisture_effect
-        hum += np.random.normal(0, 2.5)
+        hum += self.rng.normal(0, 2.5, self.zones)
 
         # Tilt
-        target_delta = 0
-        if humidifier: target_delta += 10
-        if dehumidifier: target_delta -= 10
-
+        target_delta = 10.0 * (np.asarray(humidifier, dtype=float) - np.asarray(dehumidifier, dtype=float))
         self.hum_tilt += alpha * (target_delta - self.hum_tilt)
         hum += self.hum_tilt
 
-        hum = float(np.clip(hum, 0, 100))
-        self.humidity = hum
-        return hum
+        self.humidity = np.clip(hum, 0, 100)
+        return self.humidity
 
     def evaporation_rate(self, t_day):
         """Dynamic evaporation in mm/day with realistic baseline and diurnal cycle."""
-        if self.moisture > 700:
-            base_evap = random.uniform(1.0, 3.0)
-        elif self.moisture > 400:
-            base_evap = random.uniform(0.2, 0.8)
-        else:
-            base_evap = 0.05
+        base_evap = np.where(self.moisture > 700, self.rng.uniform(1.0, 3.0, self.zones),
+                             np.where(self.moisture > 400, self.rng.uniform(0.2, 0.8, self.zones), 0.05))
 
-        evap = max(self.temperature - 10, 0) * (1 - self.humidity / 100) * 0.1
-        diurnal = 0.3 + 0.7 * max(0, np.sin(2 * np.pi * (t_day % 1)))
+        evap = np.maximum(self.temperature - 10, 0) * (1 - self.humidity / 100) * 0.1
+        diurnal = 0.3 + 0.7 * max(0, math.sin(2 * math.pi * (t_day % 1)))
         evap *= diurnal
-        evap += np.random.normal(0, 0.05)
-        return float(max(base_evap + evap, 0.01))
-
+        evap += self.rng.normal(0, 0.05, self.zones)
+        return np.maximum(base_evap + evap, 0.01)
 
-    def moisture_func(self, t_day, pump=False, alpha=0.02,
-                    sensitivity_mm_to_units=30.0,
-                    pump_flow_units_per_sec=5.0):
+    def moisture_step(self, t_day, dt_sim, pump=False, alpha=0.02,
+                      sensitivity_mm_to_units=30.0,
+                      pump_flow_units_per_sec=5.0):
         """
-        Robust moisture update using actual simulated dt.
+        Moisture update over dt_sim seconds of simulated time.
         - sensitivity_mm_to_units: how many 'moisture units' correspond to 1 mm/day lost (tunable).
         - pump_flow_units_per_sec: when pump ON, how many units/sec are added (tunable).
         - alpha: smoothing factor for a small gradual pump tilt (kept optional).
         """
-        now_real = time.time()
-        dt_real = max(0.0001, now_real - self.time)
-        self.time=now_real
-        # If you use time_acceleration somewhere else (t_sim), compute simulated dt:
-        # If env loop computes t_sim = (time.time() - start_time) * time_acceleration,
-        # then dt_sim = dt_real * time_acceleration.
-        # For portability we compute dt_sim if self has time_acceleration attribute; else assume 1:1.
-        time_accel = getattr(self, "time_acceleration", 1.0)
-        dt_sim = dt_real * time_accel  # seconds of simulated time that passed
-
-        # convert mm/day → mm per simulated second
-        evap_mm_day = self.evaporation_rate(t_day)
-        evap_mm_per_simsec = evap_mm_day / 86400.0
-        # mm lost this update (simulated seconds elapsed)
-        evap_mm_this_step = evap_mm_per_simsec * dt_sim
-
-        # Convert to 'moisture units' via sensitivity parameter:
-        evap_units = evap_mm_this_step * sensitivity_mm_to_units
-
-        # Apply evap loss
+        # evaporation in mm/day → moisture units lost over dt_sim
+        evap_units = self.evaporation_rate(t_day) / 86400.0 * dt_sim * sensitivity_mm_to_units
         moisture = self.moisture - evap_units
 
-        # Pump: treat as a flow (units/sec) multiplied by simulated dt
-        target_pump_flow = pump_flow_units_per_sec if pump else 0.0
-        # optional smoothing of pump flow (gentle actuator inertia)
-        if not hasattr(self, "_pump_flow_tilt"):
-            self._pump_flow_tilt = target_pump_flow
-        self._pump_flow_tilt += alpha * (target_pump_flow - self._pump_flow_tilt)
-
-        pump_added = self._pump_flow_tilt * dt_sim
-        moisture += pump_added
+        # Pump: treat as a flow (units/sec) multiplied by simulated dt, with gentle actuator inertia
+        target_pump_flow = pump_flow_units_per_sec * np.asarray(pump, dtype=float)
+        if self.pump_flow_tilt is None:
+            self.pump_flow_tilt = np.broadcast_to(target_pump_flow, (self.zones,)).copy()
+        self.pump_flow_tilt += alpha * (target_pump_flow - self.pump_flow_tilt)
+        moisture += self.pump_flow_tilt * dt_sim
 
         # small stochastic fluctuation so it's never perfectly constant
-        moisture += np.random.normal(0, 0.005 * max(1.0, abs(moisture) / 100.0))
+        moisture += self.rng.normal(0, 0.005 * np.maximum(1.0, np.abs(moisture) / 100.0))
+
+        self.moisture = np.clip(moisture, 0.0, 1000.0)
+        return self.moisture
+
+    def step(self, t_days, dt_sim, controls=None, alpha=0.01):
+        """Advance every zone; `controls` is a zones x 5 bool array in ACTUATORS order."""
+        if controls is None:
+            controls = np.zeros((self.zones, len(ACTUATORS)), dtype=bool)
+        fan, heater, pump, humidifier, dehumidifier = controls.T
+        temperature = self.temperature_step(t_days, fan, heater, alpha)
+        humidity = self.humidity_step(t_days, humidifier, dehumidifier, alpha)
+        moisture = self.moisture_step(t_days, dt_sim, pump, alpha)
+        return temperature, humidity, moisture
+
+
+class EnvironmentState(ZoneEnvironment):
+    """Single greenhouse: the N=1 case of ZoneEnvironment with the scalar per-variable API"""
+    def __init__(self, latitude=None, seed=None):
+        super().__init__(1, latitude, seed)
+        self.time = time.time()
+
+    def temperature_func(self, t_days, fan=False, heater=False, alpha=0.05, thermal_inertia=0.1):
+        return float(self.temperature_step(t_days, fan, heater, alpha, thermal_inertia)[0])
+
+    def humidity_func(self, t_days, humidifier=False, dehumidifier=False, alpha=0.01):
+        return float(self.humidity_step(t_days, humidifier, dehumidifier, alpha)[0])
+
+    def moisture_func(self, t_day, pump=False, alpha=0.02,
+                    sensitivity_mm_to_units=30.0,
+                    pump_flow_units_per_sec=5.0):
+        """Moisture update over the wall-clock time since the last call, scaled by time_acceleration."""
+        now_real = time.time()
+        dt_real = max(0.0001, now_real - self.time)
+        self.time = now_real
+        dt_sim = dt_real * getattr(self, "time_acceleration", 1.0)
+        return float(self.moisture_step(t_day, dt_sim, pump, alpha, sensitivity_mm_to_units, pump_flow_units_per_sec)[0])
+
+
 
-        # clamp & store dt
-        moisture = float(np.clip(moisture, 0.0, 1000.0))
-        self.moisture = moisture
-        self._last_update_time = now_real
-        return moisture
+def run_simulation(env: ZoneEnvironment, clock: SimClock, steps: int, controls=None, alpha=0.01):
+    """Step `env` on the simulated clock as fast as the CPU allows.
 
+    Yields (time, temperature, humidity, moisture) per tick; arrays have one value per zone.
+    """
+    env.start_day = clock.t_days
+    env.simulated_aging = True
+    for _ in range(steps):
+        temperature, humidity, moisture = env.step(clock.t_days, clock.step, controls, alpha)
+        yield clock.now, temperature, humidity, moisture
+        clock.tick()
 
 
-def enviroment_process(enviroment_memory, ready_event: Event, stop_event: Event, time_acceleration: float | None = None):
+def enviroment_process(enviroment_memory: EnvironmentMemory, ready_event: Event, stop_event: Event, time_acceleration: float | None = None,
+                       latitude=45.0, seed=None):
 
-    env = EnvironmentState(latitude=45.0)
+    env = ZoneEnvironment(enviroment_memory.zones, latitude=latitude, seed=seed)
     ready_event.set()
 
     if not time_acceleration:
@@ -154,25 +199,24 @@ def enviroment_process(enviroment_memory, ready_event: Event, stop_event: Event,
 
     alpha = 0.01
     first = True
+    last = time.time()
 
     try:
         while not stop_event.is_set():
 
-            t_sim = (time.time() - env.start_time) * time_acceleration
+            now = time.time()
+            t_sim = (now - env.start_time) * time_acceleration
             t_days = env.start_day + t_sim / 86400
+            # Moisture runs on wall-clock dt unless env.time_acceleration is set (as EnvironmentState does)
+            dt_sim = max(0.0001, now - last) * getattr(env, "time_acceleration", 1.0)
+            last = now
 
-            # Read controls
-            fan = enviroment_memory.get('fan', False)
-            heater = enviroment_memory.get('heater', False)
-            pump = enviroment_memory.get('pump', False)
-            humidifier = enviroment_memory.get('humidifier', False)
-            dehumidifier = enviroment_memory.get('dehumidifier', False)
+            # Read controls of every zone and step all zones at once
+            controls = enviroment_memory.actuator_array()
+            temperature, humidity, moisture = env.step(t_days, dt_sim, controls, alpha)
 
-            # Write to shared memory (unchanged)
-            enviroment_memory['temperature'] = round(env.temperature_func(t_days, fan, heater, alpha), 2)
-            enviroment_memory['humidity'] = round(env.humidity_func(t_days, humidifier, dehumidifier, alpha), 2)
-            enviroment_memory['moisture'] = round(env.moisture_func(t_days, pump, alpha), 2)
-            enviroment_memory['time'] = datetime.now().isoformat()
+            # Write to shared memory as one seqlocked update
+            enviroment_memory.write(temperature.round(2), humidity.round(2), moisture.round(2), now)
 
             if first:
                 ready_event.set()
@@ -181,4 +225,4 @@ def enviroment_process(enviroment_memory, ready_event: Event, stop_event: Event,
             time.sleep(1)
 
     except KeyboardInterrupt:
-        print("Environment process interrupted")
\ No newline at end of file
+        print("Environment process interrupted")
@@ -0,0 +1,207 @@
+"""Environment state in a shared-memory block instead of a Manager dict.
+
+Layout (little endian) for N zones:
+
+    0         u64          sequence number, odd while the environment process is writing
+    8         u64          number of zones
+    16        f64          time of the last update (epoch seconds)
+    24        f64 x N x 3  temperature, humidity, moisture per zone
+    24 + 24N  u8  x N x 5  actuator flags per zone: fan, heater, pump, humidifier, dehumidifier
+
+Readings are read under a seqlock: take the sequence, copy the fields, and retry if
+the sequence was odd or changed meanwhile. Only the environment process writes the
+readings. Each actuator flag is a single byte that controllers set directly, so
+flags need no lock. Reads are plain memory copies with no IPC.
+
+EnvironmentMemory keeps the dict interface the sensors and the environment loop
+already use (`memory['temperature']`, `memory.get('fan', False)`, `copy()`) for zone
+0; `memory.zone(i)` gives the same interface for zone i. 'time' is returned as an
+isoformat string, as before.
+"""
+import struct
+import time
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+
+READINGS = ("temperature", "humidity", "moisture")
+ACTUATORS = ("fan", "heater", "pump", "humidifier", "dehumidifier")
+
+_SEQ = struct.Struct("<Q")
+_HEADER = struct.Struct("<QQd")
+_TIME = struct.Struct("<d")
+_ZONE_READINGS = struct.Struct(f"<{len(READINGS)}d")
+_ZONE_ACTUATORS = struct.Struct(f"<{len(ACTUATORS)}?")
+_TIME_OFFSET = 16
+_READINGS_OFFSET = _HEADER.size
+
+_READING_INDEX = {name: i for i, name in enumerate(READINGS)}
+_ACTUATOR_INDEX = {name: i for i, name in enumerate(ACTUATORS)}
+
+
+def block_size(zones: int) -> int:
+    return _READINGS_OFFSET + zones * (_ZONE_READINGS.size + _ZONE_ACTUATORS.size)
+
+
+class _ZoneMapping:
+    """Dict interface over one zone; needs `_memory` and `_zone`."""
+
+    _memory: "EnvironmentMemory"
+    _zone: int
+
+    def snapshot(self) -> dict:
+        values, timestamp = self._memory.read(self._zone)
+        state = dict(zip(READINGS, values))
+        state["time"] = datetime.fromtimestamp(timestamp).isoformat()
+        state.update(self._memory.actuators(self._zone))
+        return state
+
+    def copy(self) -> dict:
+        return self.snapshot()
+
+    def __getitem__(self, key: str):
+        if key in _READING_INDEX:
+            return self._memory.read(self._zone)[0][_READING_INDEX[key]]
+        if key == "time":
+            return datetime.fromtimestamp(self._memory.read(self._zone)[1]).isoformat()
+        if key in _ACTUATOR_INDEX:
+            return self._memory.actuator(key, self._zone)
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value):
+        if key in _ACTUATOR_INDEX:
+            self._memory.set_actuator(key, bool(value), self._zone)
+        else:
+            raise KeyError(f"{key} is written by the environment process")
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return key in _READING_INDEX or key in _ACTUATOR_INDEX or key == "time"
+
+    def keys(self):
+        return READINGS + ("time",) + ACTUATORS
+
+
+class ZoneView(_ZoneMapping):
+    """One zone of an EnvironmentMemory, handed to the sensors placed in that zone."""
+
+    def __init__(self, memory: "EnvironmentMemory", zone: int):
+        if not 0 <= zone < memory.zones:
+            raise ValueError(f"Invalid zone: {zone} (memory has {memory.zones} zones)")
+        self._memory = memory
+        self._zone = zone
+
+    def read(self):
+        return self._memory.read(self._zone)
+
+    def actuators(self) -> dict:
+        return self._memory.actuators(self._zone)
+
+    def set_actuator(self, name: str, on: bool):
+        self._memory.set_actuator(name, on, self._zone)
+
+
+class EnvironmentMemory(_ZoneMapping):
+    """Shared environment block for `zones` greenhouse zones; dict access goes to zone 0."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool = False):
+        self._shm = shm
+        self._buf = shm.buf
+        self._owner = owner
+        self.name = shm.name
+        self.zones = _HEADER.unpack_from(shm.buf, 0)[1]
+        self._actuators_offset = _READINGS_OFFSET + self.zones * _ZONE_READINGS.size
+        self._memory = self
+        self._zone = 0
+
+    @classmethod
+    def create(cls, zones: int = 1, name: str | None = None) -> "EnvironmentMemory":
+        size = block_size(zones)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        shm.buf[:size] = bytes(size)
+        _HEADER.pack_into(shm.buf, 0, 0, zones, 0.0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "EnvironmentMemory":
+        return cls(shared_memory.SharedMemory(name=name))
+
+    def __reduce__(self):
+        # Processes started with spawn attach to the block by name
+        return EnvironmentMemory.attach, (self.name,)
+
+    def zone(self, zone: int) -> ZoneView:
+        return ZoneView(self, zone)
+
+    # Readings (single writer: the environment process)
+
+    def write(self, temperature, humidity, moisture, timestamp: float | None = None):
+        """Publish one consistent update; each reading is a scalar or an array with one value per zone."""
+        values = np.empty((self.zones, len(READINGS)))
+        values[:, 0], values[:, 1], values[:, 2] = temperature, humidity, moisture
+        seq = _SEQ.unpack_from(self._buf, 0)[0]
+        _SEQ.pack_into(self._buf, 0, seq + 1)
+        _TIME.pack_into(self._buf, _TIME_OFFSET, time.time() if timestamp is None else timestamp)
+        self._buf[_READINGS_OFFSET:self._actuators_offset] = values.tobytes()
+        _SEQ.pack_into(self._buf, 0, seq + 2)
+
+    def read(self, zone: int = 0):
+        """((temperature, humidity, moisture), time) of one zone from a single update."""
+        buf = self._buf
+        offset = _READINGS_OFFSET + zone * _ZONE_READINGS.size
+        while True:
+            before = _SEQ.unpack_from(buf, 0)[0]
+            if before & 1:
+                continue
+            values = _ZONE_READINGS.unpack_from(buf, offset)
+            timestamp = _TIME.unpack_from(buf, _TIME_OFFSET)[0]
+            if _SEQ.unpack_from(buf, 0)[0] == before:
+                return values, timestamp
+
+    def read_all(self):
+        """(zones x 3 array of readings, time) from a single update."""
+        buf = self._buf
+        while True:
+            before = _SEQ.unpack_from(buf, 0)[0]
+            if before & 1:
+                continue
+            values = np.frombuffer(bytes(buf[_READINGS_OFFSET:self._actuators_offset])).reshape(self.zones, len(READINGS))
+            timestamp = _TIME.unpack_from(buf, _TIME_OFFSET)[0]
+            if _SEQ.unpack_from(buf, 0)[0] == before:
+                return values, timestamp
+
+    def version(self) -> int:
+        """Number of completed writes."""
+        return _SEQ.unpack_from(self._buf, 0)[0] // 2
+
+    # Actuators (any process)
+
+    def _actuator_offset(self, name: str, zone: int) -> int:
+        return self._actuators_offset + zone * _ZONE_ACTUATORS.size + _ACTUATOR_INDEX[name]
+
+    def actuator(self, name: str, zone: int = 0) -> bool:
+        return bool(self._buf[self._actuator_offset(name, zone)])
+
+    def actuators(self, zone: int = 0) -> dict:
+        offset = self._actuators_offset + zone * _ZONE_ACTUATORS.size
+        return dict(zip(ACTUATORS, _ZONE_ACTUATORS.unpack_from(self._buf, offset)))
+
+    def actuator_array(self) -> np.ndarray:
+        """zones x 5 bool array of every actuator flag, columns in ACTUATORS order."""
+        raw = bytes(self._buf[self._actuators_offset:self._actuators_offset + self.zones * _ZONE_ACTUATORS.size])
+        return np.frombuffer(raw, dtype=np.uint8).reshape(self.zones, len(ACTUATORS)).astype(bool)
+
+    def set_actuator(self, name: str, on: bool, zone: int = 0):
+        self._buf[self._actuator_offset(name, zone)] = 1 if on else 0
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
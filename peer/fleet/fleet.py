@@ -0,0 +1,376 @@
+"""Fleet manager: bring whole simulated sensor fleets up and down from a JSON spec.
+
+A spec names the fleet, its default brokers and groups of sensors of one type:
+
+    {
+      "name": "greenhouse",
+      "brokers": [{"host": "192.168.0.38", "port": 8883}],
+      "groups": [
+        {"type": "temperature", "count": 200},
+        {"name": "soil", "type": "moisture", "count": 300, "interval": 5.0,
+         "reporting": {"deadband": 5.0, "heartbeat": 60, "batch": 10, "binary": true},
+         "processes": 2, "connections": 8, "qos": 1,
+         "brokers": [{"host": "10.0.0.2", "port": 1883}]}
+      ]
+    }
+
+Group defaults: name "<fleet>-<type>", interval 1.0 s, 1 process, 4 connections, QoS 1
+and the commander's reporting options. Sensor ids are "<group>-<index>" and sensors are
+spread round-robin over the environment's zones and a group's connections over its
+brokers, so a group sends the same topics and payloads as individually added sensors.
+
+Applying a spec is declarative: groups whose settings did not change keep running,
+changed groups are restarted and groups missing from the spec are stopped. All
+processes of a group start (and stop) at once, and each one connects its MQTT clients
+in parallel, so startup costs one connect round trip instead of one per sensor.
+
+Every sensor's counters live in a shared-memory block per group (one row per sensor,
+written only by the process that runs it), which the commander reads for per-sensor
+health and publish statistics without any IPC.
+"""
+import asyncio
+import json
+import multiprocessing as mp
+import random
+import time
+import uuid
+from multiprocessing import shared_memory
+from multiprocessing.synchronize import Event
+from typing import Dict, List
+
+import numpy as np
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+
+from sensor.reporting import Reporter
+from sensor.sensor import Sensor, VALID_TYPES
+
+DEFAULT_BROKER = {"host": "192.168.0.38", "port": 8883}
+GROUP_DEFAULTS = {"interval": 1.0, "processes": 1, "connections": 4, "qos": 1}
+# Seconds a group process waits for all its clients to connect before it reports ready anyway
+CONNECT_TIMEOUT = 10.0
+HEALTH_STATES = ("ok", "starting", "stale", "disconnected", "stopped")
+
+STATS_DTYPE = np.dtype([
+    ("samples", "<u8"),
+    ("published", "<u8"),
+    ("failed", "<u8"),
+    ("bytes", "<u8"),
+    ("last_publish", "<f8"),  # epoch seconds, 0 before the first publish
+    ("connected", "u1"),
+])
+
+
+class FleetStats:
+    """Shared per-sensor counters of one group, one STATS_DTYPE row per sensor."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, count: int, owner: bool = False):
+        self._shm = shm
+        self._owner = owner
+        self.name = shm.name
+        self.count = count
+        self.rows = np.ndarray((count,), dtype=STATS_DTYPE, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, count: int) -> "FleetStats":
+        shm = shared_memory.SharedMemory(create=True, size=max(count, 1) * STATS_DTYPE.itemsize)
+        stats = cls(shm, count, owner=True)
+        stats.rows[:] = 0
+        return stats
+
+    @classmethod
+    def attach(cls, name: str, count: int) -> "FleetStats":
+        return cls(shared_memory.SharedMemory(name=name), count)
+
+    def __reduce__(self):
+        # Processes started with spawn attach to the block by name
+        return FleetStats.attach, (self.name, self.count)
+
+    def close(self):
+        self.rows = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def load_spec(path: str, reporting: Dict | None = None) -> dict:
+    with open(path) as f:
+        return normalize_spec(json.load(f), reporting)
+
+
+def normalize_spec(spec: dict, reporting: Dict | None = None) -> dict:
+    """Validate a spec and fill in every group's defaults; raises ValueError."""
+    name = spec.get("name", "fleet")
+    brokers = spec.get("brokers") or [DEFAULT_BROKER]
+    groups = {}
+    for group in spec.get("groups", []):
+        group = {**GROUP_DEFAULTS, "brokers": brokers, **group}
+        if group.get("type") not in VALID_TYPES:
+            raise ValueError(f"Invalid sensor type: {group.get('type')}\n Valid types: {VALID_TYPES}")
+        group.setdefault("name", f"{name}-{group['type']}")
+        if not isinstance(group.get("reporting", {}), dict):
+            raise ValueError(f"{group['name']}: reporting must be an object")
+        group["reporting"] = {**(reporting or {}), **group.get("reporting", {})}
+        # Build one Reporter here: the group processes only create theirs after reporting ready
+        if "zone" in group["reporting"]:
+            raise ValueError(f"{group['name']}: zone is assigned per sensor, not in reporting")
+        try:
+            Reporter(**group["reporting"])
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{group['name']}: invalid reporting options: {e}") from None
+        if group["name"] in groups:
+            raise ValueError(f"Duplicate group name: {group['name']}")
+        if not isinstance(group.get("count"), int):
+            raise ValueError(f"{group['name']}: count must be an integer")
+        if group["count"] <= 0 or group["interval"] <= 0 or group["processes"] <= 0 or group["connections"] <= 0:
+            raise ValueError(f"{group['name']}: count, interval, processes and connections must be positive")
+        if not group["brokers"] or not all("host" in broker and "port" in broker for broker in group["brokers"]):
+            raise ValueError(f"{group['name']}: every broker needs a host and a port")
+        group["processes"] = min(group["processes"], group["count"])
+        groups[group["name"]] = group
+    return {"name": name, "groups": groups}
+
+
+def stale_after(group: dict) -> float:
+    """Seconds without a publish after which a sensor of the group counts as stale."""
+    reporting = group["reporting"]
+    heartbeat = reporting.get("heartbeat", 60.0)
+    gap = min(group["interval"] * reporting.get("batch", 1), heartbeat)
+    if reporting.get("deadband", 0.0) > 0:
+        gap = heartbeat
+    return 2 * gap + group["interval"]
+
+
+def client_id_prefix(group: str, shard: int) -> str:
+    """Client id prefix of one group process; the name's length keeps ids of different groups and shards apart."""
+    return f"{uuid.getnode()}_{len(group)}:{group}_{shard}"
+
+
+def connect_clients(prefix: str, count: int, brokers: List[dict], stats: FleetStats, rows: List[List[int]],
+                    max_inflight: int = 1000) -> List[mqtt.Client]:
+    """Start `count` clients without waiting for them; client i serves rows[i] and marks them (dis)connected."""
+    clients = []
+    for index in range(count):
+        broker = brokers[index % len(brokers)]
+        client = mqtt.Client(client_id=f"{prefix}_{index}", reconnect_on_failure=True,
+                             clean_session=True, callback_api_version=CallbackAPIVersion.VERSION1)
+        client.max_inflight_messages_set(max_inflight)
+        served = np.array(rows[index], dtype=np.int64)
+
+        def on_connect(client, userdata, flags, rc, served=served):
+            if rc == 0:
+                stats.rows["connected"][served] = 1
+
+        def on_disconnect(client, userdata, rc, served=served):
+            stats.rows["connected"][served] = 0
+
+        client.on_connect = on_connect
+        client.on_disconnect = on_disconnect
+        client.connect_async(broker["host"], int(broker["port"]), 60)
+        client.loop_start()
+        clients.append(client)
+    return clients
+
+
+async def run_sensor(sensor: Sensor, client: mqtt.Client, row: int, stats: FleetStats, period: float, qos: int,
+                     reporter: Reporter):
+    topic = f"sensors/{sensor.sensor_type}/{sensor.sensor_id}"
+    samples, published, failed, sent, last_publish = (stats.rows[field] for field in
+                                                      ("samples", "published", "failed", "bytes", "last_publish"))
+    # Spread the first readings over one period so the group does not publish in lockstep
+    next_time = time.monotonic() + random.uniform(0, period)
+    while True:
+        await asyncio.sleep(max(0.0, next_time - time.monotonic()))
+        payload = reporter.offer(*sensor.sample())
+        samples[row] += 1
+        if payload is not None:
+            if client.publish(topic, payload, qos=qos).rc == mqtt.MQTT_ERR_SUCCESS:
+                published[row] += 1
+                sent[row] += len(payload)
+                last_publish[row] = time.time()
+            else:
+                failed[row] += 1
+        next_time += period
+        if next_time < time.monotonic():
+            next_time = time.monotonic() + period
+
+
+async def run_group(group: dict, first: int, count: int, stats: FleetStats, enviroment_memory,
+                    ready_event: Event, stop_event: Event, shard: int = 0):
+    """Run sensors first..first+count-1 of a group until stop_event is set."""
+    zones = getattr(enviroment_memory, "zones", 1)
+    indexes = list(range(first, first + count))
+    connections = min(group["connections"], count)
+    rows = [indexes[i::connections] for i in range(connections)]
+    clients = connect_clients(client_id_prefix(group["name"], shard), connections, group["brokers"], stats, rows)
+    # Ready once every client is connected; paho keeps retrying the rest in the background
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    while not stats.rows["connected"][first:first + count].all() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    ready_event.set()
+
+    tasks = []
+    for connection, served in enumerate(rows):
+        for row in served:
+            sensor = Sensor(f"{group['name']}-{row}", group["type"], enviroment_memory, zone=row % zones)
+            reporter = Reporter(zone=sensor.zone, **group["reporting"])
+            tasks.append(asyncio.create_task(run_sensor(sensor, clients[connection], row, stats, group["interval"],
+                                                        group["qos"], reporter)))
+    try:
+        while not stop_event.is_set():
+            await asyncio.sleep(0.2)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Disconnect first so every network thread wakes up and exits at once
+        for client in clients:
+            client.disconnect()
+        for client in clients:
+            client.loop_stop()
+        stats.rows["connected"][first:first + count] = 0
+
+
+def group_process(group: dict, first: int, count: int, stats: FleetStats, enviroment_memory,
+                  ready_event: Event, stop_event: Event, shard: int = 0):
+    try:
+        asyncio.run(run_group(group, first, count, stats, enviroment_memory, ready_event, stop_event, shard))
+    except KeyboardInterrupt:
+        pass
+
+
+class Fleet:
+    """Running groups of the commander's fleet, keyed by group name."""
+
+    def __init__(self, enviroment_memory):
+        self.memory = enviroment_memory
+        self.name: str | None = None
+        self.groups: Dict[str, dict] = {}
+        self._last_totals: Dict[str, tuple] = {}
+
+    # Lifecycle
+
+    def _start_shard(self, running: dict, shard: int) -> dict:
+        group, stats = running["spec"], running["stats"]
+        first = sum(part["count"] for part in running["shards"][:shard])
+        count = group["count"] // group["processes"] + (1 if shard < group["count"] % group["processes"] else 0)
+        ready_event, stop_event = mp.Event(), mp.Event()
+        process = mp.Process(target=group_process, args=(group, first, count, stats, self.memory,
+                                                         ready_event, stop_event, shard))
+        process.start()
+        return {"process": process, "ready": ready_event, "stop": stop_event, "first": first, "count": count}
+
+    def _start_groups(self, groups: List[dict]):
+        """Start every process of every group first, then wait for all of them together."""
+        for group in groups:
+            running = {"spec": group, "stats": FleetStats.create(group["count"]), "shards": [],
+                       "started": time.time()}
+            for shard in range(group["processes"]):
+                running["shards"].append(self._start_shard(running, shard))
+            self.groups[group["name"]] = running
+        for group in groups:
+            for shard in self.groups[group["name"]]["shards"]:
+                shard["ready"].wait(CONNECT_TIMEOUT + 5)
+
+    def _stop_groups(self, names: List[str]):
+        """Signal every process of every group, then join them all."""
+        stopping = [self.groups.pop(name) for name in names if name in self.groups]
+        for running in stopping:
+            for shard in running["shards"]:
+                shard["stop"].set()
+        for running in stopping:
+            for shard in running["shards"]:
+                shard["process"].join()
+            running["stats"].close()
+            self._last_totals.pop(running["spec"]["name"], None)
+
+    def apply(self, spec: dict) -> dict:
+        """Make the running groups match a normalized spec; returns what changed and how long it took."""
+        began = time.perf_counter()
+        wanted = spec["groups"]
+        unchanged = [name for name, group in wanted.items()
+                     if name in self.groups and self.groups[name]["spec"] == group]
+        stop = [name for name in self.groups if name not in unchanged]
+        start = [group for name, group in wanted.items() if name not in unchanged]
+        self._stop_groups(stop)
+        self._start_groups(start)
+        self.name = spec["name"]
+        return {"started": [group["name"] for group in start if group["name"] not in stop],
+                "restarted": [name for name in stop if name in wanted],
+                "stopped": [name for name in stop if name not in wanted],
+                "unchanged": unchanged,
+                "sensors": sum(running["spec"]["count"] for running in self.groups.values()),
+                "seconds": round(time.perf_counter() - began, 2)}
+
+    def stop(self, names: List[str] | None = None) -> float:
+        began = time.perf_counter()
+        self._stop_groups(list(self.groups) if names is None else names)
+        return time.perf_counter() - began
+
+    def rolling_restart(self, names: List[str] | None = None, settle: float = 30.0) -> float:
+        """Restart one process at a time and wait until its sensors publish again before the next.
+
+        Only one shard's sensors are down at any moment, so a group with several processes
+        keeps reporting during the restart.
+        """
+        began = time.perf_counter()
+        for name in list(self.groups) if names is None else names:
+            running = self.groups.get(name)
+            if running is None:
+                continue
+            for index, shard in enumerate(running["shards"]):
+                shard["stop"].set()
+                shard["process"].join()
+                restarted_at = time.time()
+                running["shards"][index] = shard = self._start_shard(running, index)
+                shard["ready"].wait(CONNECT_TIMEOUT + 5)
+                published = running["stats"].rows["last_publish"][shard["first"]:shard["first"] + shard["count"]]
+                deadline = time.monotonic() + settle
+                while (published < restarted_at).any() and time.monotonic() < deadline:
+                    time.sleep(0.05)
+        return time.perf_counter() - began
+
+    # Health and statistics
+
+    def health(self, name: str) -> List[dict]:
+        """One entry per sensor of a group: state, counters and seconds since its last publish."""
+        running = self.groups[name]
+        group, rows = running["spec"], running["stats"].rows.copy()
+        states = self._states(running, rows)
+        now = time.time()
+        return [{"sensor_id": f"{name}-{index}", "state": state, "samples": int(row["samples"]),
+                 "published": int(row["published"]), "failed": int(row["failed"]), "bytes": int(row["bytes"]),
+                 "last_publish_age": round(now - float(row["last_publish"]), 1) if row["last_publish"] else None,
+                 "zone": index % getattr(self.memory, "zones", 1), "type": group["type"]}
+                for index, (row, state) in enumerate(zip(rows, states))]
+
+    def _states(self, running: dict, rows: np.ndarray) -> List[str]:
+        states = np.full(len(rows), "ok", dtype=object)
+        age = time.time() - rows["last_publish"]
+        states[age > stale_after(running["spec"])] = "stale"
+        states[rows["last_publish"] < running["started"]] = "starting"
+        states[rows["connected"] == 0] = "disconnected"
+        for shard in running["shards"]:
+            if not shard["process"].is_alive():
+                states[shard["first"]:shard["first"] + shard["count"]] = "stopped"
+        return states.tolist()
+
+    def summary(self) -> List[dict]:
+        """Per group: sensors by health state, publish totals and the rate since the previous summary."""
+        result = []
+        now = time.monotonic()
+        for name, running in self.groups.items():
+            rows = running["stats"].rows.copy()
+            states = self._states(running, rows)
+            published = int(rows["published"].sum())
+            last_time, last_published = self._last_totals.get(name, (now, published))
+            self._last_totals[name] = (now, published)
+            result.append({
+                "group": name, "type": running["spec"]["type"], "sensors": len(rows),
+                "processes": len(running["shards"]),
+                "health": {state: states.count(state) for state in HEALTH_STATES if state in states},
+                "samples": int(rows["samples"].sum()), "published": published,
+                "failed": int(rows["failed"].sum()), "bytes": int(rows["bytes"].sum()),
+                "msg_per_s": round((published - last_published) / (now - last_time), 1) if now > last_time else None,
+            })
+        return result
@@ -0,0 +1,91 @@
+"""Report-by-exception for sensors: deadband, heartbeat, batching and a compact binary payload.
+
+A sample is reported when it moved at least `deadband` away from the last reported
+value, or when `heartbeat` seconds passed since the last report (so the gateway can
+tell a quiet sensor from a dead one). Reported samples are sent `batch` at a time,
+but never held back longer than `heartbeat`. With the defaults every sample is sent
+on its own as JSON, which is what the gateway always accepted.
+
+Binary payload (little-endian), recognised by the gateway from its first byte (JSON
+always starts with '{' or '['):
+
+    0  u8   MAGIC (0xA5)
+    1  u8   sample count n (1..255)
+    2  u16  zone
+    4  n x (f8 epoch seconds, f4 value)
+"""
+import json
+import struct
+import time
+from datetime import datetime
+from typing import List, Tuple
+
+MAGIC = 0xA5
+HEADER = struct.Struct("<BBH")
+SAMPLE = struct.Struct("<df")
+MAX_BATCH = 255
+
+Sample = Tuple[float, float]  # (epoch seconds, value)
+
+
+def encode_json(samples: List[Sample], zone: int = 0) -> bytes:
+    docs = [{"value": value, "time": datetime.fromtimestamp(stamp).isoformat(), "zone": zone}
+            for stamp, value in samples]
+    return json.dumps(docs[0] if len(docs) == 1 else docs).encode()
+
+
+def encode_binary(samples: List[Sample], zone: int = 0) -> bytes:
+    return HEADER.pack(MAGIC, len(samples), zone) + b"".join(SAMPLE.pack(stamp, value) for stamp, value in samples)
+
+
+class Reporter:
+    """Decides which samples of one sensor get published and encodes them."""
+
+    def __init__(self, deadband: float = 0.0, heartbeat: float = 60.0, batch: int = 1,
+                 binary: bool = False, zone: int = 0):
+        if not 1 <= batch <= MAX_BATCH:
+            raise ValueError(f"batch must be between 1 and {MAX_BATCH}")
+        self.deadband = deadband
+        self.heartbeat = heartbeat
+        self.batch = batch
+        self.encode = encode_binary if binary else encode_json
+        self.zone = zone
+        self._last_value: float | None = None
+        self._last_report = 0.0
+        self._pending: List[Sample] = []
+        self._pending_since = 0.0
+
+        self.samples = 0
+        self.suppressed = 0
+        self.messages = 0
+        self.bytes = 0
+
+    def offer(self, value: float, stamp: float, now: float | None = None) -> bytes | None:
+        """Take one sample; returns a payload when a message is due."""
+        now = time.monotonic() if now is None else now
+        self.samples += 1
+        if (self._last_value is None or abs(value - self._last_value) >= self.deadband
+                or now - self._last_report >= self.heartbeat):
+            if not self._pending:
+                self._pending_since = now
+            self._pending.append((stamp, value))
+            self._last_value = value
+            self._last_report = now
+        else:
+            self.suppressed += 1
+        if self._pending and (len(self._pending) >= self.batch or now - self._pending_since >= self.heartbeat):
+            return self.flush()
+        return None
+
+    def flush(self) -> bytes | None:
+        """Encode whatever is pending, e.g. before the sensor stops."""
+        if not self._pending:
+            return None
+        payload = self.encode(self._pending, self.zone)
+        self._pending = []
+        self.messages += 1
+        self.bytes += len(payload)
+        return payload
+
+    def stats(self) -> dict:
+        return {"samples": self.samples, "suppressed": self.suppressed, "messages": self.messages, "bytes": self.bytes}
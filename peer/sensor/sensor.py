@@ -1,21 +1,25 @@
 
-import math,random,asyncio,json
+import math,random,asyncio
+from datetime import datetime
 from multiprocessing.synchronize import Event
 
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
 import uuid
+from sensor.reporting import Reporter
 
 VALID_TYPES = ("temperature", "humidity", "moisture")
 class Location:
     latitude,longitude=0,0
 class Sensor:
-    def __init__(self, sensor_id:str,sensor_type:str,enviroment_memory,location:Location|float|None=None):
+    def __init__(self, sensor_id:str,sensor_type:str,enviroment_memory,location:Location|float|None=None,zone:int=0):
         if sensor_type not in VALID_TYPES:
             raise ValueError(f"Invalid sensor_type: {sensor_type}\n Valid types: {VALID_TYPES}")
         self.sensor_id = sensor_id
         self.sensor_type= sensor_type
-        self.enviroment_memory= enviroment_memory
+        self.zone = zone
+        # Read only this sensor's greenhouse zone of a multi-zone EnvironmentMemory
+        self.enviroment_memory= enviroment_memory.zone(zone) if hasattr(enviroment_memory, "zone") else enviroment_memory
         lat=math.degrees(math.asin(0.0))
         if isinstance(location, Location):
             lat = location.latitude
@@ -27,21 +31,38 @@ class Sensor:
         self.locTempNoise = random.uniform(-1,1)
         #locational noise for each sensor
     async def getValue(self):
+        state = self.enviroment_memory.copy()  # one consistent read of value and time
         return {
             "sensor_id": self.sensor_id,
             "sensor_type": self.sensor_type,
-            "value": self.enviroment_memory[self.sensor_type]+random.uniform(2,5),
-            "time": self.enviroment_memory['time']
+            "value": state[self.sensor_type]+random.uniform(2,5),
+            "time": state['time'],
+            "zone": self.zone
         }
 
+    def sample(self):
+        """(value, epoch seconds) of one reading, for report-by-exception publishing."""
+        if hasattr(self.enviroment_memory, "read"):
+            values, timestamp = self.enviroment_memory.read()
+            return values[VALID_TYPES.index(self.sensor_type)] + random.uniform(2, 5), timestamp
+        state = self.enviroment_memory.copy()
+        return state[self.sensor_type] + random.uniform(2, 5), datetime.fromisoformat(state['time']).timestamp()
+
     def __str__(self):
         return f"""Sensor - {self.sensor_id}:
         'sensor_id':'{self.sensor_id}'
         'sensor_type':'{self.sensor_type}'\n"""
 
 
-def sensor_process( sensor_id, sensor_type, enviroment_memory,ready_event:Event,stop_event: Event, host="192.168.0.38", port=8883):
-    sensor = Sensor(sensor_id=sensor_id, sensor_type=sensor_type, enviroment_memory=enviroment_memory)
+def sensor_process( sensor_id, sensor_type, enviroment_memory,ready_event:Event,stop_event: Event, host="192.168.0.38", port=8883, zone=0,
+                   interval=1.0, deadband=0.0, heartbeat=60.0, batch=1, binary=False, qos=1):
+    """Publish one sensor's readings every `interval` seconds until stop_event is set.
+
+    deadband, heartbeat, batch and binary configure report-by-exception (see sensor.reporting);
+    the defaults publish every reading as JSON.
+    """
+    sensor = Sensor(sensor_id=sensor_id, sensor_type=sensor_type, enviroment_memory=enviroment_memory, zone=zone)
+    reporter = Reporter(deadband=deadband, heartbeat=heartbeat, batch=batch, binary=binary, zone=zone)
     client = mqtt.Client(client_id=str(uuid.getnode())+"_"+sensor_id,reconnect_on_failure=True,clean_session=False,callback_api_version=CallbackAPIVersion.VERSION1)
 
     def on_connect(client, userdata, flags, rc):
@@ -52,24 +73,25 @@ def sensor_process( sensor_id, sensor_type, enviroment_memory,ready_event:Event,
             print(f"Sensor {sensor_id} failed to connect, rc={rc}")
     client.on_connect = on_connect
     client.connect(host, port, 60)
+    topic = f"sensors/{sensor.sensor_type}/{sensor.sensor_id}"
 
     async def async_worker():
         client.loop_start()  # run MQTT network loop in background thread
         try:
             while not stop_event.is_set():
-                reading = await sensor.getValue()
-                topic = f"sensors/{sensor.sensor_type}/{sensor.sensor_id}"
-                
-                res=client.publish(topic,json.dumps(reading),qos=1)
-                if res.is_published():
-                    print(f"Sensor {sensor_id} published: {reading}")
-                await asyncio.sleep(1)  # publish interval
+                payload = reporter.offer(*sensor.sample())
+                if payload is not None:
+                    client.publish(topic, payload, qos=qos)
+                await asyncio.sleep(interval)  # sampling interval
         except asyncio.CancelledError:
             print(f"Sensor {sensor_id} async worker cancelled")
         finally:
+            payload = reporter.flush()
+            if payload is not None:
+                client.publish(topic, payload, qos=qos)
             client.loop_stop()
             client.disconnect()
-            print(f"Sensor {sensor_id} disconnected from MQTT broker")
+            print(f"Sensor {sensor_id} disconnected from MQTT broker: {reporter.stats()}")
 
     try:
         asyncio.run(async_worker())
@@ -0,0 +1,147 @@
+"""Generate environment traces faster than real time and replay them to MQTT.
+
+The environment runs on a SimClock with a fixed timestep and a seeded generator, so
+the same arguments always give the same trace. Run from the peer directory:
+
+    python -m simulator.replay generate trace.npz --days 365 --step 600 --zones 4 --seed 1
+    python -m simulator.replay replay trace.npz --speed 3600 --host 192.168.0.38 --port 8883
+    python -m simulator.replay replay - --days 7 --step 60 --speed 0     # generate and publish directly
+
+A replay publishes what the sensors would have sent: one reading per zone and sensor
+type per tick on sensors/<type>/<prefix>-<type>-<zone>, with simulated timestamps.
+--speed is simulated seconds per real second; 0 publishes as fast as possible.
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+
+from enviroment.enviroment import SimClock, ZoneEnvironment, run_simulation
+from sensor.sensor import VALID_TYPES
+
+Trace = Dict[str, np.ndarray]
+Message = Tuple[str, bytes]
+
+
+def generate_trace(days: float, step: float = 60.0, zones: int = 1, seed: int | None = None,
+                   latitude=45.0, start: datetime | None = None) -> Trace:
+    """Simulate `days` of environment at a fixed `step` (seconds).
+
+    Returns float64 times and zones-wide float32 columns, 12 bytes per zone and step.
+    """
+    steps = int(days * 86400 / step)
+    trace: Trace = {"time": np.empty(steps)}
+    trace.update({name: np.empty((steps, zones), dtype=np.float32) for name in VALID_TYPES})
+    clock = SimClock(start, step)
+    env = ZoneEnvironment(zones, latitude=latitude, seed=seed)
+    for i, (now, temperature, humidity, moisture) in enumerate(run_simulation(env, clock, steps)):
+        trace["time"][i] = now
+        trace["temperature"][i] = temperature
+        trace["humidity"][i] = humidity
+        trace["moisture"][i] = moisture
+    return trace
+
+
+def save_trace(path: str, trace: Trace):
+    np.savez_compressed(path, **trace)
+
+
+def load_trace(path: str) -> Trace:
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def trace_ticks(trace: Trace, seed: int | None = None, prefix: str = "replay") -> Iterator[Tuple[float, List[Message]]]:
+    """(time, messages) per tick, with each sensor's reading offset the way Sensor.getValue does."""
+    rng = np.random.default_rng(seed)
+    zones = trace["temperature"].shape[1]
+    topics = {name: [(f"sensors/{name}/{prefix}-{name}-{zone}", f"{prefix}-{name}-{zone}") for zone in range(zones)]
+              for name in VALID_TYPES}
+    for i, now in enumerate(trace["time"].tolist()):
+        stamp = datetime.fromtimestamp(now).isoformat()
+        messages = []
+        for name in VALID_TYPES:
+            values = (trace[name][i] + rng.uniform(2, 5, zones)).tolist()
+            for zone, ((topic, sensor_id), value) in enumerate(zip(topics[name], values)):
+                payload = {"sensor_id": sensor_id, "sensor_type": name, "value": value, "time": stamp, "zone": zone}
+                messages.append((topic, json.dumps(payload).encode()))
+        yield now, messages
+
+
+def replay(ticks: Iterable[Tuple[float, List[Message]]], client: mqtt.Client, speed: float = 0.0, qos: int = 1) -> dict:
+    """Publish ticks, pacing them to `speed` simulated seconds per real second (0 = unthrottled)."""
+    stats = {"published": 0, "failed": 0, "ticks": 0}
+    first = None
+    started = time.monotonic()
+    for now, messages in ticks:
+        if first is None:
+            first = now
+        if speed > 0:
+            delay = started + (now - first) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        for topic, payload in messages:
+            if client.publish(topic, payload, qos=qos).rc == mqtt.MQTT_ERR_SUCCESS:
+                stats["published"] += 1
+            else:
+                stats["failed"] += 1
+        stats["ticks"] += 1
+    stats["seconds"] = round(time.monotonic() - started, 3)
+    return stats
+
+
+def connect(host: str, port: int, max_inflight: int = 1000) -> mqtt.Client:
+    client = mqtt.Client(client_id=f"{uuid.getnode()}_replay", reconnect_on_failure=True, clean_session=True,
+                         callback_api_version=CallbackAPIVersion.VERSION1)
+    client.max_inflight_messages_set(max_inflight)
+    client.connect(host, port, 60)
+    client.loop_start()
+    return client
+
+
+def main(args):
+    start = datetime.fromisoformat(args.start) if args.start else None
+    if args.command == "generate" or args.trace == "-":
+        began = time.perf_counter()
+        trace = generate_trace(args.days, args.step, args.zones, args.seed, args.latitude, start)
+        elapsed = time.perf_counter() - began
+        print(f"Simulated {len(trace['time'])} steps x {args.zones} zones in {elapsed:.2f}s "
+              f"({len(trace['time']) / elapsed:,.0f} steps/s)")
+        if args.command == "generate":
+            save_trace(args.trace, trace)
+            print(f"Trace written to {args.trace}")
+            return
+    else:
+        trace = load_trace(args.trace)
+
+    client = connect(args.host, args.port)
+    try:
+        stats = replay(trace_ticks(trace, args.seed, args.prefix), client, args.speed, args.qos)
+    finally:
+        client.loop_stop()
+        client.disconnect()
+    print(f"Replay finished: {stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("generate", "replay"))
+    parser.add_argument("trace", help="trace file (.npz); '-' with replay generates the trace in memory")
+    parser.add_argument("--days", type=float, default=365)
+    parser.add_argument("--step", type=float, default=600, help="simulated seconds per step")
+    parser.add_argument("--zones", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--latitude", type=float, default=45.0)
+    parser.add_argument("--start", help="simulated start time, ISO format (default: Jan 1 of this year)")
+    parser.add_argument("--speed", type=float, default=0.0, help="simulated seconds per real second, 0 = unthrottled")
+    parser.add_argument("--host", default="192.168.0.38")
+    parser.add_argument("--port", type=int, default=8883)
+    parser.add_argument("--qos", type=int, default=1)
+    parser.add_argument("--prefix", default="replay", help="sensor id prefix")
+    main(parser.parse_args())
@@ -0,0 +1,140 @@
+"""Many-sensor simulator: thousands of virtual sensors in one event loop.
+
+Every virtual Sensor is a coroutine; all of them publish through a few shared MQTT
+connections (round-robin) instead of one process and one connection per sensor.
+For more than one core, run_simulator splits the fleet across `shards` processes.
+"""
+import asyncio
+import multiprocessing as mp
+import random
+import time
+import uuid
+from multiprocessing.synchronize import Event
+from typing import Dict, List
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+
+from sensor.sensor import Sensor, VALID_TYPES
+from sensor.reporting import Reporter
+
+STATS_INTERVAL = 10.0
+
+
+def split_counts(counts: Dict[str, int], shards: int) -> List[Dict[str, int]]:
+    """Divide per-type sensor counts as evenly as possible over `shards` processes."""
+    parts: List[Dict[str, int]] = [{} for _ in range(shards)]
+    for sensor_type, count in counts.items():
+        for shard in range(shards):
+            parts[shard][sensor_type] = count // shards + (1 if shard < count % shards else 0)
+    return parts
+
+
+def make_clients(name: str, connections: int, host: str, port: int, max_inflight: int) -> List[mqtt.Client]:
+    clients = []
+    for index in range(connections):
+        client = mqtt.Client(client_id=f"{uuid.getnode()}_{name}_{index}", reconnect_on_failure=True,
+                             clean_session=True, callback_api_version=CallbackAPIVersion.VERSION1)
+        # One connection carries hundreds of sensors; the default window of 20 QoS 1 messages would stall it
+        client.max_inflight_messages_set(max_inflight)
+        client.connect(host, port, 60)
+        client.loop_start()
+        clients.append(client)
+    return clients
+
+
+async def run_sensor(sensor: Sensor, client: mqtt.Client, period: float, qos: int, stats: Dict[str, int],
+                     reporter: Reporter):
+    topic = f"sensors/{sensor.sensor_type}/{sensor.sensor_id}"
+    # Spread the first readings over one period so the fleet does not publish in lockstep
+    next_time = time.monotonic() + random.uniform(0, period)
+    while True:
+        await asyncio.sleep(max(0.0, next_time - time.monotonic()))
+        payload = reporter.offer(*sensor.sample())
+        stats["samples"] += 1
+        if payload is not None:
+            res = client.publish(topic, payload, qos=qos)
+            if res.rc == mqtt.MQTT_ERR_SUCCESS:
+                stats["published"] += 1
+                stats["bytes"] += len(payload)
+            else:
+                stats["failed"] += 1
+        next_time += period
+        if next_time < time.monotonic():
+            # Fell behind (loop saturated); skip the missed slots instead of bursting
+            stats["late"] += 1
+            next_time = time.monotonic() + period
+
+
+async def simulate(counts: Dict[str, int], enviroment_memory, stop_event: Event, ready_event: Event | None = None,
+                   host="192.168.0.38", port=8883, rate=1.0, connections=4, qos=1, name="sim", max_inflight=1000,
+                   reporting: Dict | None = None):
+    """Run the virtual fleet until stop_event is set.
+
+    `reporting` holds Reporter options (deadband, heartbeat, batch, binary) for every sensor.
+    """
+    zones = getattr(enviroment_memory, "zones", 1)
+    # Sensors of each type are spread round-robin over the greenhouse zones
+    sensors = [Sensor(f"{name}-{sensor_type}-{index}", sensor_type, enviroment_memory, zone=index % zones)
+               for sensor_type, count in counts.items() for index in range(count)]
+    clients = make_clients(name, connections, host, port, max_inflight)
+    stats = {"samples": 0, "published": 0, "bytes": 0, "failed": 0, "late": 0}
+    tasks = [asyncio.create_task(run_sensor(sensor, clients[index % len(clients)], 1.0 / rate, qos, stats,
+                                            Reporter(zone=sensor.zone, **(reporting or {}))))
+              for index, sensor in enumerate(sensors)]
+    print(f"Simulator {name}: {len(sensors)} sensors on {len(clients)} connections at {rate} samples/s each")
+    if ready_event is not None:
+        ready_event.set()
+    try:
+        last_report, last_published = time.monotonic(), 0
+        while not stop_event.is_set():
+            await asyncio.sleep(0.5)
+            now = time.monotonic()
+            if now - last_report >= STATS_INTERVAL:
+                print(f"Simulator {name}: {(stats['published'] - last_published) / (now - last_report):.0f} msg/s, {stats}")
+                last_report, last_published = now, stats["published"]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for client in clients:
+            client.loop_stop()
+            client.disconnect()
+        print(f"Simulator {name} stopped: {stats}")
+    return stats
+
+
+def simulator_process(counts: Dict[str, int], enviroment_memory, ready_event: Event, stop_event: Event,
+                      host="192.168.0.38", port=8883, rate=1.0, connections=4, qos=1, name="sim",
+                      reporting: Dict | None = None):
+    try:
+        asyncio.run(simulate(counts, enviroment_memory, stop_event, ready_event, host, port, rate, connections, qos, name,
+                             reporting=reporting))
+    except KeyboardInterrupt:
+        print(f"Simulator {name} interrupted")
+
+
+def run_simulator(counts: Dict[str, int], enviroment_memory, host="192.168.0.38", port=8883, rate=1.0,
+                  connections=4, shards=1, qos=1, name="sim", reporting: Dict | None = None) -> Dict:
+    """Start the fleet in `shards` processes, each with its own loop and `connections` MQTT clients."""
+    for sensor_type in counts:
+        if sensor_type not in VALID_TYPES:
+            raise ValueError(f"Invalid sensor_type: {sensor_type}\n Valid types: {VALID_TYPES}")
+    stop_event = mp.Event()
+    processes = []
+    for shard, shard_counts in enumerate(split_counts(counts, shards)):
+        ready_event = mp.Event()
+        p = mp.Process(target=simulator_process, args=(shard_counts, enviroment_memory, ready_event, stop_event,
+                                                       host, port, rate, connections, qos, f"{name}{shard}",
+                                                       reporting))
+        p.start()
+        ready_event.wait()
+        processes.append(p)
+    return {"processes": processes, "stop_event": stop_event, "counts": counts, "rate": rate,
+            "connections": connections, "shards": shards, "reporting": reporting}
+
+
+def stop_simulator(info: Dict):
+    info["stop_event"].set()
+    for p in info["processes"]:
+        p.join()
@@ -0,0 +1,22 @@
+import numpy as np
+from enviroment.enviroment import SimClock, ZoneEnvironment, run_simulation
+
+
+def noise_std(env: ZoneEnvironment, t_days: float) -> float:
+    # Every zone shares latitude and state, so without inertia the spread across zones is the noise
+    env.temperature[:] = 20.0
+    return float(np.std(env.temperature_step(t_days, thermal_inertia=1.0)))
+
+
+def test_live_temperature_noise_stays_bounded():
+    env = ZoneEnvironment(zones=2000, latitude=45.0, seed=1)
+    # A month of uptime at the live process's default acceleration is ~1440 simulated years
+    t_days = env.start_day + 30 * 17520
+    assert noise_std(env, t_days) < 0.35
+
+
+def test_simulated_runs_age_on_the_simulated_clock():
+    env = ZoneEnvironment(zones=2000, latitude=45.0, seed=1)
+    clock = SimClock(step=86400)
+    list(run_simulation(env, clock, 1))
+    assert noise_std(env, clock.t_days + 365 * 20) > 0.6
@@ -0,0 +1,24 @@
+import pytest
+from fleet.fleet import client_id_prefix, normalize_spec
+
+
+def spec(**reporting):
+    return {"groups": [{"name": "soil", "type": "moisture", "count": 10, "reporting": reporting}]}
+
+
+def test_valid_reporting_is_kept():
+    groups = normalize_spec(spec(batch=10, binary=True), reporting={"heartbeat": 30})["groups"]
+    assert groups["soil"]["reporting"] == {"heartbeat": 30, "batch": 10, "binary": True}
+
+
+@pytest.mark.parametrize("reporting", [{"batch": 0}, {"batch": 256}, {"bacth": 10}, {"zone": 2}])
+def test_invalid_reporting_is_rejected_before_spawning(reporting):
+    with pytest.raises(ValueError, match="soil"):
+        normalize_spec(spec(**reporting))
+
+
+def test_client_ids_do_not_collide_across_groups_and_shards():
+    prefixes = [client_id_prefix(group, shard) for group, shard in
+                (("a1", 0), ("a", 10), ("a_1", 0), ("a", 1), ("a_1_0", 0))]
+    ids = {f"{prefix}_{index}" for prefix in prefixes for index in range(12)}
+    assert len(ids) == len(prefixes) * 12